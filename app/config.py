@@ -1,5 +1,5 @@
 import os
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic_settings import BaseSettings
 
 
@@ -8,6 +8,8 @@ class Settings(BaseSettings):
     
     # API配置
     gemini_api_key: Optional[str] = None
+    gemini_api_keys: List[str] = []  # 服务端API Key池（JSON数组），与 gemini_api_key 合并使用
+    key_eject_seconds: float = 60.0  # 返回配额错误的Key在该模型上被剔除的默认秒数
     
     # 服务器配置
     host: str = "0.0.0.0"
@@ -17,11 +19,104 @@ class Settings(BaseSettings):
     # 文件存储配置
     upload_folder: str = "outputs"
     max_file_size: int = 100 * 1024 * 1024  # 100MB
+    state_folder: str = "data"  # 缓存索引等内部状态，不通过 /outputs 对外暴露
+    catalog_page_size: int = 50  # 文件列表默认每页条数
+    catalog_max_page_size: int = 500  # 文件列表每页最多条数
+    catalog_watch_enabled: bool = True  # 监视输出目录，把手工增删的文件实时同步到索引
+    catalog_reconcile_interval: float = 3600.0  # 索引与磁盘定期对账间隔（秒），0表示只在启动时对账
+    thumbnail_workers: int = 2  # 生成缩略图/预览图的进程数
+    thumbnail_quality: int = 80  # 缩略图/预览图压缩质量
+    retention_interval: float = 600.0  # 输出文件保留策略检查间隔（秒）
+    retention_batch_size: int = 100  # 保留策略每批最多删除的文件数
+    retention_image_max_age_hours: float = 0  # 图片最长保留时间（小时），0表示不限
+    retention_video_max_age_hours: float = 0  # 视频最长保留时间（小时），0表示不限
+    retention_max_bytes: int = 0  # 图片和视频总大小上限（字节），超出时按最近访问时间淘汰，0表示不限
+    retention_temp_max_age_hours: float = 24  # 遗留临时文件和孤立内容对象的保留时间（小时）
     
     # 允许的文件类型
     allowed_image_extensions: List[str] = [".jpg", ".jpeg", ".png", ".webp", ".gif"]
     allowed_video_extensions: List[str] = [".mp4", ".avi", ".mov", ".mkv"]
     
+    # Gemini客户端池配置
+    client_pool_size: int = 32  # 最多缓存的API Key客户端数
+    client_keepalive_expiry: float = 120.0  # 空闲长连接保持时间（秒）
+    client_prewarm: bool = True  # 启动时预热服务端API Key的连接
+    client_close_delay: float = 300.0  # 被淘汰的客户端延迟多久关闭连接（秒），留给仍在进行的请求
+    
+    # 准入控制配置（键为 GeminiService.MODELS 中的名称，每个worker进程单独计算，多进程部署时请按进程数折算）
+    model_concurrency_limits: Dict[str, int] = {
+        "IMAGE_GENERATION": 8,
+        "IMAGE_ANALYSIS": 16,
+        "VIDEO_GENERATION": 10,
+        "VIDEO_GENERATION_FAST": 10,
+        "VIDEO_EXTENSION": 10,
+    }
+    model_queue_limits: Dict[str, int] = {
+        "IMAGE_GENERATION": 32,
+        "IMAGE_ANALYSIS": 64,
+        "VIDEO_GENERATION": 50,
+        "VIDEO_GENERATION_FAST": 50,
+        "VIDEO_EXTENSION": 50,
+    }
+    
+    # 限流配置（键为 GeminiService.MODELS 中的名称，0或缺省表示不限，请按账户配额调整；
+    # 配额状态保存在 state_folder 中，所有worker进程共享，重启后不重置）
+    model_rpm_limits: Dict[str, int] = {
+        "IMAGE_GENERATION": 60,
+        "IMAGE_ANALYSIS": 300,
+        "VIDEO_GENERATION": 10,
+        "VIDEO_GENERATION_FAST": 10,
+        "VIDEO_EXTENSION": 10,
+    }
+    model_rpd_limits: Dict[str, int] = {}
+    rate_limit_max_wait: float = 30.0  # 同步请求在本地最多等待配额的秒数
+    rate_limit_max_states: int = 1024  # 进程内配额状态快照最多保留的用户API Key记录数（按Key和模型计），服务端Key不计入淘汰
+    rate_limit_idle_seconds: float = 3600.0  # 用户API Key的配额记录空闲多久后删除（秒）
+    
+    # 文生图结果缓存配置（默认关闭）
+    image_cache_enabled: bool = False
+    image_cache_ttl_hours: int = 24 * 7
+    image_cache_max_mb: int = 1024
+    
+    # 图片分析结果缓存配置（进程内）
+    analysis_cache_enabled: bool = True
+    analysis_cache_ttl_seconds: int = 3600
+    analysis_cache_max_entries: int = 1024
+    
+    # 可延长视频登记表配置（Gemini文件默认保留48小时）
+    video_registry_ttl_hours: int = 48
+    video_registry_max_entries: int = 10000
+    
+    # 批量文生图配置
+    batch_max_items: int = 500
+    batch_default_parallelism: int = 4
+    batch_max_parallelism: int = 16
+    
+    # 熔断配置（按模型统计上游错误率，每个worker进程单独统计）
+    circuit_error_rate: float = 0.5  # 统计窗口内错误率达到此值时熔断
+    circuit_min_requests: int = 10  # 统计窗口内请求数少于此值时不熔断
+    circuit_window_seconds: float = 60.0  # 错误率统计窗口（秒）
+    circuit_open_seconds: float = 30.0  # 熔断后多久放行探测请求（秒）
+    circuit_half_open_probes: int = 1  # 半开状态同时放行的探测请求数
+    
+    # 文生图对冲请求配置（默认关闭）
+    image_hedge_enabled: bool = False  # 文生图对冲请求开关
+    image_hedge_percentile: float = 95.0  # 请求超过近期延迟的该分位数仍未返回时发出对冲
+    image_hedge_max_fraction: float = 0.05  # 对冲请求占总请求的最大比例
+    image_hedge_min_samples: int = 20  # 延迟样本少于此值时不对冲
+    
+    # 视频任务配置
+    video_job_workers: int = 32  # 同时处理的视频任务数
+    poll_min_interval: float = 2.0  # Operation最小轮询间隔（秒）
+    poll_max_interval: float = 30.0  # Operation最大轮询间隔（秒）
+    poll_default_estimate: float = 60.0  # 无历史数据时的预计完成耗时（秒）
+    poll_ewma_alpha: float = 0.3  # 完成耗时EWMA平滑系数
+    job_history_limit: int = 1000  # 内存和共享状态中保留的任务数
+    video_download_concurrency: int = 4  # 同时下载的视频数
+    video_download_chunk_size: int = 1024 * 1024  # 视频流式下载分块大小（字节）
+    job_event_heartbeat: float = 15.0  # 任务进度SSE无变化时的心跳间隔（秒）
+    operation_lease_seconds: float = 120.0  # 进行中Operation的租约时长（秒），持有进程停止续期后由其他worker接管
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -31,11 +126,18 @@ class Settings(BaseSettings):
 settings = Settings()
 
 
+def get_server_api_keys() -> List[str]:
+    """获取服务端配置的全部API Key（去重，保持顺序）"""
+    keys = [settings.gemini_api_key] + list(settings.gemini_api_keys)
+    return list(dict.fromkeys(key for key in keys if key))
+
+
 def get_gemini_api_key() -> str:
     """获取Gemini API密钥"""
-    if not settings.gemini_api_key:
+    keys = get_server_api_keys()
+    if not keys:
         raise ValueError("Gemini API key not configured. Please set GEMINI_API_KEY in .env file")
-    return settings.gemini_api_key
+    return keys[0]
 
 
 def ensure_output_dirs():
@@ -45,6 +147,7 @@ def ensure_output_dirs():
         os.path.join(settings.upload_folder, "images"),
         os.path.join(settings.upload_folder, "videos"),
         os.path.join(settings.upload_folder, "files"),
+        settings.state_folder,
     ]
     
     for dir_path in dirs:
@@ -3,11 +3,21 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import os
 
 from app.config import settings, ensure_output_dirs
 from app.routes import health, gemini
+from app.services.job_service import job_service
+from app.services.operation_poller import operation_poller
+from app.services.client_registry import client_registry
+from app.services.key_pool import key_pool
+from app.services.output_watcher import output_watcher
+from app.services.thumbnail_service import thumbnail_service
+from app.services.retention import retention_engine
+from app.services.gemini_service import GeminiService
 from app.utils.logger import logger
+from app.utils.static_files import output_files
 
 # 确保输出目录存在
 ensure_output_dirs()
@@ -34,8 +44,9 @@ app.add_middleware(
 if os.path.exists("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
-if os.path.exists("outputs"):
-    app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
+if os.path.exists(settings.upload_folder):
+    # 带强ETag、长期缓存和Range支持，不提供 .objects 等隐藏文件
+    app.mount("/outputs", output_files, name="outputs")
 
 # 模板配置
 templates = Jinja2Templates(directory="app/templates")
@@ -45,6 +56,33 @@ app.include_router(health.router)
 app.include_router(gemini.router)
 
 
+@app.on_event("startup")
+async def on_startup():
+    """启动后台任务服务"""
+    await client_registry.start()
+    await operation_poller.start()
+    await job_service.start()
+    # 对账并监视输出目录，登记索引建立前或进程外产生的文件，新图片在后台生成缩略图
+    output_watcher.subscribe(thumbnail_service.on_output_changes)
+    await output_watcher.start()
+    await retention_engine.start()
+    # 预热服务端Key池中每个Key的客户端连接，不阻塞启动
+    if settings.client_prewarm:
+        for api_key in key_pool.keys:
+            asyncio.create_task(client_registry.warm(api_key, GeminiService.MODELS["IMAGE_ANALYSIS"]))
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """停止后台任务服务"""
+    await job_service.stop()
+    await operation_poller.stop()
+    await retention_engine.stop()
+    await output_watcher.stop()
+    thumbnail_service.shutdown()
+    await client_registry.stop()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """主页"""
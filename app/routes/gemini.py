@@ -1,17 +1,32 @@
 import os
-from typing import Optional, List
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
-from fastapi.responses import FileResponse
+import json
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from app.services.gemini_service import GeminiService
+from app.services.gemini_service import GeminiService, AsyncGeminiService
 from app.services.file_service import FileService
+from app.services.job_service import job_service
+from app.services.admission import admission_controller
+from app.services.rate_limiter import rate_limiter
+from app.services.key_pool import key_pool
+from app.services.video_registry import video_registry
+from app.services.hedging import image_hedger
+from app.services.thumbnail_service import thumbnail_service
+from app.services.output_catalog import output_catalog
+from app.services.single_flight import single_flight, make_request_key
+from app.services.result_cache import image_result_cache, analysis_cache
 from app.utils.logger import logger
+from app.utils.static_files import output_files, content_hash
+from app.utils.helpers import locate_output
 from app.config import settings
 
 router = APIRouter(prefix="/api/v1/gemini", tags=["gemini"])
 
 # 初始化服务
-gemini_service = None
 file_service = FileService()
 
 
@@ -20,6 +35,19 @@ class TextToImageRequest(BaseModel):
     prompt: str
     aspect_ratio: Optional[str] = "1:1"
     api_key: Optional[str] = None
+    bypass_cache: Optional[bool] = False  # 跳过结果缓存，强制重新生成
+
+
+class BatchImageItem(BaseModel):
+    prompt: str
+    aspect_ratio: Optional[str] = "1:1"
+
+
+class BatchImageRequest(BaseModel):
+    items: List[BatchImageItem]
+    parallelism: Optional[int] = None  # 并发数，默认使用配置值
+    api_key: Optional[str] = None
+    bypass_cache: Optional[bool] = False
 
 
 class TextToVideoRequest(BaseModel):
@@ -62,6 +90,46 @@ class APIResponse(BaseModel):
     error: Optional[str] = None
 
 
+async def _generate_image(api_key: Optional[str], prompt: str, aspect_ratio: str,
+                          bypass_cache: bool = False) -> Dict[str, Any]:
+    """文生图公共流程：结果缓存 -> 请求合并 -> 准入控制 -> 上游调用"""
+    # 相同 模型+提示词+参数 的结果可直接复用（需开启结果缓存）
+    request_key = make_request_key(
+        model=GeminiService.MODELS["IMAGE_GENERATION"],
+        prompt=prompt,
+        aspect_ratio=aspect_ratio
+    )
+    if not bypass_cache:
+        # 缓存查询包含SQLite和文件检查，放到线程池，避免阻塞事件循环
+        cached_files = await asyncio.to_thread(image_result_cache.get, request_key)
+        if cached_files:
+            return {
+                "success": True,
+                "files": cached_files,
+                "cached": True,
+                "message": f"Loaded {len(cached_files)} image(s) from cache"
+            }
+    
+    async def run_generation():
+        # 按模型排队，队列已满时返回429
+        async with admission_controller.slot("IMAGE_GENERATION"):
+            # 没有用户Key时从服务端Key池选择负载最低的Key
+            with key_pool.lease("IMAGE_GENERATION", api_key) as lease_key:
+                # 获取Gemini服务（客户端来自连接池）
+                gemini_service = AsyncGeminiService(lease_key)
+                return await gemini_service.generate_image(
+                    prompt=prompt,
+                    aspect_ratio=aspect_ratio
+                )
+    
+    # 相同参数的进行中请求合并为一次上游调用，共享输出文件
+    result = await single_flight.do(request_key, run_generation)
+    
+    if result["success"]:
+        await asyncio.to_thread(image_result_cache.put, request_key, result["files"])
+    return result
+
+
 @router.post("/generate/image", response_model=APIResponse)
 async def generate_image(request: TextToImageRequest):
     """文本生成图片"""
@@ -69,27 +137,22 @@ async def generate_image(request: TextToImageRequest):
         logger.info(f"Image generation request: {request}")
         logger.info(f"Image generation request: {request.prompt[:50]}...")
         
-        # 获取API Key
-        api_key = request.api_key or settings.gemini_api_key
+        # 获取API Key，未提供时使用服务端Key池
+        api_key = request.api_key
         
-        if not api_key:
+        if not api_key and not key_pool.configured:
             raise HTTPException(status_code=400, detail="API Key is required")
         
-        # 动态初始化Gemini服务
-        global gemini_service
-        # 每次都使用新的API Key初始化服务
-        gemini_service = GeminiService(api_key)
-        
-        result = gemini_service.generate_image(
-            prompt=request.prompt,
-            aspect_ratio=request.aspect_ratio
-        )
+        result = await _generate_image(api_key, request.prompt, request.aspect_ratio, request.bypass_cache)
         
         if result["success"]:
+            data = {"files": result["files"]}
+            if result.get("cached"):
+                data["cached"] = True
             return APIResponse(
                 success=True,
                 message=result["message"],
-                data={"files": result["files"]}
+                data=data
             )
         else:
             error_detail = result.get("message", "Image generation failed")
@@ -107,38 +170,94 @@ async def generate_image(request: TextToImageRequest):
         raise HTTPException(status_code=500, detail=str(e) or "Internal server error")
 
 
+@router.post("/generate/images/batch")
+async def generate_images_batch(request: BatchImageRequest):
+    """批量文本生成图片 - 以NDJSON流式返回，每完成一项输出一行"""
+    api_key = request.api_key
+    
+    if not api_key and not key_pool.configured:
+        raise HTTPException(status_code=400, detail="API Key is required")
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(request.items) > settings.batch_max_items:
+        raise HTTPException(status_code=400, detail=f"Batch too large, max {settings.batch_max_items} items")
+    
+    parallelism = min(request.parallelism or settings.batch_default_parallelism, settings.batch_max_parallelism)
+    parallelism = max(1, parallelism)
+    logger.info(f"Batch image generation request: {len(request.items)} items, parallelism {parallelism}")
+    
+    semaphore = asyncio.Semaphore(parallelism)
+    
+    async def run_item(index: int, item: BatchImageItem) -> Dict[str, Any]:
+        """执行单项，错误只影响该项"""
+        async with semaphore:
+            try:
+                result = await _generate_image(
+                    api_key, item.prompt, item.aspect_ratio, request.bypass_cache
+                )
+            except HTTPException as e:
+                result = {"success": False, "error": str(e.detail), "status_code": e.status_code,
+                          "message": "Image generation failed"}
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {e}")
+                result = {"success": False, "error": str(e), "message": "Image generation failed"}
+        return {"index": index, "prompt": item.prompt, **result}
+    
+    async def stream_results():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(request.items)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item_result = await next_done
+                succeeded += 1 if item_result["success"] else 0
+                yield json.dumps(item_result, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "done": True,
+                "total": len(tasks),
+                "succeeded": succeeded,
+                "failed": len(tasks) - succeeded
+            }) + "\n"
+        finally:
+            # 客户端断开时取消未完成的项
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 @router.post("/generate/video/text", response_model=APIResponse)
 async def generate_video_from_text(request: TextToVideoRequest):
     """文本生成视频"""
     try:
         logger.info(f"Video generation from text request: {request.prompt[:50]}...")
         
-        # 获取API Key
-        api_key = request.api_key or settings.gemini_api_key
+        # 获取API Key，未提供时使用服务端Key池
+        api_key = request.api_key
         
-        if not api_key:
+        if not api_key and not key_pool.configured:
             raise HTTPException(status_code=400, detail="API Key is required")
         
-        # 动态初始化Gemini服务
-        global gemini_service
-        # 每次都使用新的API Key初始化服务
-        gemini_service = GeminiService(api_key)
-        
-        result = gemini_service.generate_video_from_text(
+        # 提交后台任务，立即返回任务ID；相同参数的进行中任务直接复用
+        # 未提供API Key时由任务在执行时从Key池分配
+        job = job_service.submit("text_to_video", api_key, {
+            "prompt": request.prompt,
+            "aspect_ratio": request.aspect_ratio,
+            "duration_seconds": request.duration_seconds,
+            "resolution": request.resolution
+        }, dedupe_key=make_request_key(
+            model=GeminiService.MODELS["VIDEO_GENERATION"],
             prompt=request.prompt,
             aspect_ratio=request.aspect_ratio,
+            resolution=request.resolution,
             duration_seconds=request.duration_seconds,
-            resolution=request.resolution
-        )
+            negative_prompt=request.negative_prompt
+        ))
         
-        if result["success"]:
-            return APIResponse(
-                success=True,
-                message=result["message"],
-                data={"file": result["file"]}
-            )
-        else:
-            raise HTTPException(status_code=400, detail=result["message"])
+        return APIResponse(
+            success=True,
+            message="Video generation job submitted",
+            data={"job_id": job["job_id"], "status": job["status"]}
+        )
             
     except HTTPException:
         # 重新抛出HTTPException，不要捕获
@@ -163,42 +282,34 @@ async def generate_video_from_image(
     try:
         logger.info(f"Video generation from image request: {prompt[:50]}...")
         
-        # 获取API Key
-        final_api_key = api_key or settings.gemini_api_key
-        
-        if not final_api_key:
+        # 获取API Key，未提供时使用服务端Key池
+        if not api_key and not key_pool.configured:
             raise HTTPException(status_code=400, detail="API Key is required")
         
         # 保存上传的图片
-        save_result = file_service.save_uploaded_file(image, "image")
+        save_result = await file_service.save_uploaded_file(image, "image")
         if not save_result["success"]:
             raise HTTPException(status_code=400, detail=save_result["message"])
         
-        # 动态初始化Gemini服务
-        global gemini_service
-        # 每次都使用新的API Key初始化服务
-        gemini_service = GeminiService(final_api_key)
-        
-        # 生成视频
-        result = gemini_service.generate_video_from_image(
-            prompt=prompt,
-            image_path=save_result["filepath"],
-            aspect_ratio=aspect_ratio,
-            duration_seconds=duration_seconds,
-            resolution=resolution
-        )
-        
-        # 清理临时图片文件
-        file_service.delete_file(save_result["filepath"])
+        # 提交后台任务，临时图片在提交Operation后由任务服务清理
+        try:
+            job = job_service.submit("image_to_video", api_key, {
+                "prompt": prompt,
+                "image_path": save_result["filepath"],
+                "aspect_ratio": aspect_ratio,
+                "duration_seconds": duration_seconds,
+                "resolution": resolution
+            }, cleanup_files=[save_result["filepath"]])
+        except Exception:
+            # 提交失败（如排队已满）时清理临时图片
+            file_service.delete_file(save_result["filepath"])
+            raise
         
-        if result["success"]:
-            return APIResponse(
-                success=True,
-                message=result["message"],
-                data={"file": result["file"]}
-            )
-        else:
-            raise HTTPException(status_code=400, detail=result["message"])
+        return APIResponse(
+            success=True,
+            message="Video generation job submitted",
+            data={"job_id": job["job_id"], "status": job["status"]}
+        )
             
     except HTTPException:
         # 重新抛出HTTPException，不要捕获
@@ -217,26 +328,49 @@ async def analyze_image(
     try:
         logger.info("Image analysis request")
         
+        # 按图片内容哈希查询缓存，命中时无需保存临时文件
+        digest = hashlib.sha256()
+        while True:
+            chunk = await image.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+        await image.seek(0)
+        cache_key = make_request_key(
+            model=GeminiService.MODELS["IMAGE_ANALYSIS"],
+            image_sha256=digest.hexdigest(),
+            prompt=analysis_prompt
+        )
+        cached_analysis = analysis_cache.get(cache_key)
+        if cached_analysis is not None:
+            return APIResponse(
+                success=True,
+                message="Image analysis completed",
+                data={"analysis": cached_analysis, "cached": True}
+            )
+        
         # 保存上传的图片
-        save_result = file_service.save_uploaded_file(image, "image")
+        save_result = await file_service.save_uploaded_file(image, "image")
         if not save_result["success"]:
             raise HTTPException(status_code=400, detail=save_result["message"])
         
-        # 动态初始化Gemini服务
-        global gemini_service
-        if gemini_service is None:
-            gemini_service = GeminiService(settings.gemini_api_key)
-        
         # 分析图片
-        result = gemini_service.analyze_image(
-            image_path=save_result["filepath"],
-            analysis_prompt=analysis_prompt
-        )
-        
-        # 清理临时图片文件
-        file_service.delete_file(save_result["filepath"])
+        try:
+            async with admission_controller.slot("IMAGE_ANALYSIS"):
+                # 使用服务端Key池中负载最低的Key
+                with key_pool.lease("IMAGE_ANALYSIS") as lease_key:
+                    # 获取Gemini服务（客户端来自连接池）
+                    gemini_service = AsyncGeminiService(lease_key)
+                    result = await gemini_service.analyze_image(
+                        image_path=save_result["filepath"],
+                        analysis_prompt=analysis_prompt
+                    )
+        finally:
+            # 清理临时图片文件
+            file_service.delete_file(save_result["filepath"])
         
         if result["success"]:
+            analysis_cache.put(cache_key, result["analysis"])
             return APIResponse(
                 success=True,
                 message=result["message"],
@@ -253,15 +387,59 @@ async def analyze_image(
         raise HTTPException(status_code=500, detail=str(e) or "Internal server error")
 
 
+class FileListParams:
+    """文件列表查询参数"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, description="每页条数"),
+        cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+        sort: str = Query("modified", description="排序字段：modified / size / filename"),
+        order: str = Query("desc", description="排序方向：desc / asc"),
+        prefix: Optional[str] = Query(None, description="文件名前缀，如 generated_image"),
+        since: Optional[datetime] = Query(None, description="修改时间不早于"),
+        until: Optional[datetime] = Query(None, description="修改时间早于")
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.sort = sort
+        self.order = order
+        self.prefix = prefix
+        self.since = since
+        self.until = until
+
+
+def _list_output_files(file_type: str, params: FileListParams) -> Dict[str, Any]:
+    """按查询参数分页列出文件"""
+    if params.sort not in ("modified", "size", "filename"):
+        raise HTTPException(status_code=400, detail="Invalid sort field")
+    if params.order not in ("desc", "asc"):
+        raise HTTPException(status_code=400, detail="Invalid sort order")
+    try:
+        return file_service.list_files(
+            file_type,
+            limit=params.limit,
+            cursor=params.cursor,
+            sort=params.sort,
+            order=params.order,
+            prefix=params.prefix,
+            since=params.since.timestamp() if params.since else None,
+            until=params.until.timestamp() if params.until else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/files/images")
-async def list_images():
-    """列出生成的图片"""
+async def list_images(params: FileListParams = Depends()):
+    """分页列出生成的图片"""
     try:
-        files = file_service.list_files("image")
+        # 索引查询会读SQLite，放到线程池
+        result = await asyncio.to_thread(_list_output_files, "image", params)
         return APIResponse(
             success=True,
             message="Images listed successfully",
-            data={"files": files}
+            data=result
         )
     except HTTPException:
         # 重新抛出HTTPException，不要捕获
@@ -272,14 +450,14 @@ async def list_images():
 
 
 @router.get("/files/videos")
-async def list_videos():
-    """列出生成的视频"""
+async def list_videos(params: FileListParams = Depends()):
+    """分页列出生成的视频"""
     try:
-        files = file_service.list_files("video")
+        result = await asyncio.to_thread(_list_output_files, "video", params)
         return APIResponse(
             success=True,
             message="Videos listed successfully",
-            data={"files": files}
+            data=result
         )
     except HTTPException:
         # 重新抛出HTTPException，不要捕获
@@ -289,22 +467,55 @@ async def list_videos():
         raise HTTPException(status_code=500, detail=str(e) or "Internal server error")
 
 
+@router.get("/thumbnails/{size}/{filename}")
+async def get_thumbnail(size: str, filename: str, request: Request):
+    """获取生成图片的缩略图（thumb）或预览图（preview），按 Accept 头选择AVIF/WebP"""
+    try:
+        if size not in thumbnail_service.SIZES:
+            raise HTTPException(status_code=400, detail="Invalid thumbnail size")
+        if filename != os.path.basename(filename) or filename.startswith("."):
+            raise HTTPException(status_code=400, detail="Invalid filename")
+        
+        fmt = thumbnail_service.negotiate(request.headers.get("accept", ""))
+        path = await thumbnail_service.get(filename, size, fmt)
+        if path is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        # 查看缩略图也算作访问原图，影响按最近访问时间的淘汰
+        output_catalog.touch(locate_output(thumbnail_service.source_folder, filename))
+        
+        return FileResponse(
+            path=path,
+            media_type=thumbnail_service.media_type(fmt),
+            headers={"Vary": "Accept", "Cache-Control": "public, max-age=86400"}
+        )
+        
+    except HTTPException:
+        # 重新抛出HTTPException，不要捕获
+        raise
+    except Exception as e:
+        logger.error(f"Get thumbnail failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e) or "Internal server error")
+
+
 @router.get("/download/{file_type}/{filename}")
-async def download_file(file_type: str, filename: str):
-    """下载文件"""
+async def download_file(file_type: str, filename: str, request: Request):
+    """下载文件 - 支持条件请求和断点续传"""
     try:
         if file_type not in ["images", "videos"]:
             raise HTTPException(status_code=400, detail="Invalid file type")
+        if filename != os.path.basename(filename) or filename.startswith("."):
+            raise HTTPException(status_code=400, detail="Invalid filename")
         
-        file_path = os.path.join(settings.upload_folder, file_type, filename)
+        file_path = locate_output(os.path.join(settings.upload_folder, file_type), filename)
         
-        if not os.path.exists(file_path):
+        if not os.path.isfile(file_path):
             raise HTTPException(status_code=404, detail="File not found")
         
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type='application/octet-stream'
+        stat_result = os.stat(file_path)
+        output_catalog.touch(file_path)
+        sha256 = await asyncio.to_thread(content_hash, file_path, stat_result)
+        return output_files.file_response(
+            file_path, stat_result, request.scope, sha256=sha256, download_name=filename
         )
         
     except HTTPException:
@@ -321,21 +532,20 @@ async def edit_image(request: ImageEditRequest):
     try:
         logger.info(f"Image editing request: {request.prompt[:50]}...")
         
-        # 获取API Key
-        api_key = request.api_key or settings.gemini_api_key
+        # 获取API Key，未提供时使用服务端Key池
+        api_key = request.api_key
         
-        if not api_key:
+        if not api_key and not key_pool.configured:
             raise HTTPException(status_code=400, detail="API Key is required")
         
-        # 动态初始化Gemini服务
-        global gemini_service
-        if gemini_service is None:
-            gemini_service = GeminiService(api_key)
-        
-        result = gemini_service.edit_image(
-            prompt=request.prompt,
-            image_data=request.image_data
-        )
+        async with admission_controller.slot("IMAGE_GENERATION"):
+            with key_pool.lease("IMAGE_GENERATION", api_key) as lease_key:
+                # 获取Gemini服务（客户端来自连接池）
+                gemini_service = AsyncGeminiService(lease_key)
+                result = await gemini_service.edit_image(
+                    prompt=request.prompt,
+                    image_data=request.image_data
+                )
         
         if result["success"]:
             return APIResponse(
@@ -363,16 +573,14 @@ async def concatenate_images(request: ImageConcatenateRequest):
     try:
         logger.info(f"Image concatenation request: {len(request.images)} images")
         
-        # 获取API Key
-        api_key = request.api_key or settings.gemini_api_key
+        # 获取API Key，未提供时使用服务端Key池
+        api_key = request.api_key
         
-        if not api_key:
+        if not api_key and not key_pool.configured:
             raise HTTPException(status_code=400, detail="API Key is required")
         
-        # 动态初始化Gemini服务
-        global gemini_service
-        if gemini_service is None:
-            gemini_service = GeminiService(api_key)
+        # 获取Gemini服务（客户端来自连接池）
+        gemini_service = GeminiService(api_key)
         
         result = gemini_service.concatenate_images(request.images)
         
@@ -406,7 +614,7 @@ async def upload_video(video: UploadFile = File(...)):
         logger.info(f"Video upload request: {video.filename}")
         
         # 保存上传的视频
-        save_result = file_service.save_uploaded_file(video, "video")
+        save_result = await file_service.save_uploaded_file(video, "video")
         if not save_result["success"]:
             raise HTTPException(status_code=400, detail=save_result["message"])
         
@@ -425,38 +633,40 @@ async def upload_video(video: UploadFile = File(...)):
 
 @router.post("/extend/video", response_model=APIResponse)
 async def extend_video(request: VideoExtendRequest):
-    """延长视频 - 只能延长当前会话中刚生成的视频"""
+    """延长视频 - 只能延长登记表中仍在有效期内的视频，返回任务ID"""
     try:
         logger.info(f"Video extension request: {request.filename}")
         
-        # 获取API Key
-        api_key = request.api_key or settings.gemini_api_key
+        # 获取API Key，未提供时使用服务端Key池
+        api_key = request.api_key
         
-        if not api_key:
+        if not api_key and not key_pool.configured:
             raise HTTPException(status_code=400, detail="API Key is required")
         
-        # 使用全局的gemini_service实例（会话级）
-        global gemini_service
-        if gemini_service is None:
-            gemini_service = GeminiService(api_key)
+        # Video对象保存在持久化登记表中
+        if not await asyncio.to_thread(video_registry.is_extendable, request.filename):
+            raise HTTPException(
+                status_code=400,
+                detail="此视频无法延长。只能延长最近生成且仍在有效期内的视频。"
+            )
         
-        result = gemini_service.extend_video(
+        # 提交后台任务，立即返回任务ID；重复提交的延长请求直接复用
+        job = job_service.submit("extend_video", api_key, {
+            "filename": request.filename,
+            "prompt": request.prompt,
+            "resolution": request.resolution
+        }, dedupe_key=make_request_key(
+            model=GeminiService.MODELS["VIDEO_EXTENSION"],
             filename=request.filename,
             prompt=request.prompt,
             resolution=request.resolution
-        )
+        ))
         
-        if result["success"]:
-            return APIResponse(
-                success=True,
-                message=result["message"],
-                data={
-                    "file": result["file"],
-                    "chain": result.get("chain", [request.filename, result["file"]])
-                }
-            )
-        else:
-            raise HTTPException(status_code=400, detail=result["message"])
+        return APIResponse(
+            success=True,
+            message="Video extension job submitted",
+            data={"job_id": job["job_id"], "status": job["status"]}
+        )
             
     except HTTPException:
         # 重新抛出HTTPException，不要捕获
@@ -464,3 +674,53 @@ async def extend_video(request: VideoExtendRequest):
     except Exception as e:
         logger.error(f"Video extension failed: {e}")
         raise HTTPException(status_code=500, detail=str(e) or "Internal server error")
+
+
+@router.get("/queue", response_model=APIResponse)
+async def get_queue_status():
+    """查询各模型的并发、排队深度、限流和对冲状态"""
+    return APIResponse(
+        success=True,
+        message="Queue status retrieved",
+        data={
+            "models": admission_controller.get_status(),
+            "rate_limits": await asyncio.to_thread(rate_limiter.get_status),
+            "api_keys": key_pool.get_status(),
+            "hedging": image_hedger.get_status()
+        }
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=APIResponse)
+async def get_job(job_id: str):
+    """查询视频任务状态"""
+    job = await job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return APIResponse(
+        success=True,
+        message=job["message"],
+        data=job
+    )
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """以SSE推送视频任务进度：状态变化、轮询次数、已用时，结束时包含输出文件URL"""
+    if await job_service.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for job in job_service.watch(job_id, heartbeat=settings.job_event_heartbeat):
+            yield f"event: status\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 禁止反向代理缓冲，保证事件及时送达
+            "X-Accel-Buffering": "no"
+        }
+    )
@@ -1,8 +1,11 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Dict, Any
 
 from app.utils.logger import logger
+from app.services.gemini_service import GeminiService
+from app.services.circuit_breaker import circuit_breakers
 
 router = APIRouter()
 
@@ -11,6 +14,7 @@ class HealthResponse(BaseModel):
     status: str
     timestamp: str
     message: str
+    circuits: Dict[str, Dict[str, Any]] = {}
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -18,10 +22,15 @@ async def health_check():
     """健康检查接口"""
     logger.info("Health check requested")
     
+    # 各模型熔断状态，有熔断打开时整体标记为degraded
+    circuits = circuit_breakers.get_status(GeminiService.MODELS.keys())
+    degraded = [model_key for model_key, circuit in circuits.items() if circuit["state"] != "closed"]
+    
     return HealthResponse(
-        status="healthy",
+        status="degraded" if degraded else "healthy",
         timestamp=datetime.now().isoformat(),
-        message="Web UI for Large Models is running"
+        message=f"Circuit open for: {', '.join(degraded)}" if degraded else "Web UI for Large Models is running",
+        circuits=circuits
     )
 
 
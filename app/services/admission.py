@@ -0,0 +1,167 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.services.gemini_service import GeminiService
+from app.services.circuit_breaker import circuit_breakers
+
+
+class AdmissionRejectedError(HTTPException):
+    """等待队列已满 - 返回429并带上Retry-After"""
+
+    def __init__(self, model_key: str, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail=f"Too many concurrent requests for {model_key}, please retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.model_key = model_key
+        self.retry_after = retry_after
+
+
+class ModelGate:
+    """单个模型的并发闸门：最多 limit 个并发调用，最多 max_queue 个排队"""
+
+    def __init__(self, model_key: str, limit: int, max_queue: int, alpha: float = 0.2):
+        """初始化闸门"""
+        self.model_key = model_key
+        self.limit = limit
+        self.max_queue = max_queue
+        self.alpha = alpha
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        # 单次占用时长的EWMA，用于估算Retry-After
+        self.avg_hold = 5.0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def reserve(self, force: bool = False):
+        """占一个排队位置，队列已满时抛出 AdmissionRejectedError，force 时不检查上限"""
+        if not force and self.active + self.waiting >= self.limit + self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejectedError(self.model_key, self.retry_after())
+        self.waiting += 1
+
+    @asynccontextmanager
+    async def hold(self):
+        """等待已预约的排队位置轮到执行，退出时释放"""
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            hold_time = time.monotonic() - started
+            self.avg_hold += self.alpha * (hold_time - self.avg_hold)
+
+    async def try_acquire(self) -> bool:
+        """不排队地占用一个空闲并发名额（对冲等可选请求使用），没有空闲名额或已有请求在排队时返回False"""
+        if self.waiting or self._semaphore.locked():
+            return False
+        # 有空闲名额时 acquire 立即返回，不会等待
+        await self._semaphore.acquire()
+        self.active += 1
+        return True
+
+    def release(self):
+        """释放 try_acquire 占用的名额"""
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """排队并占用一个并发名额"""
+        self.reserve()
+        async with self.hold():
+            yield
+
+    def retry_after(self) -> int:
+        """估算排队清空所需秒数"""
+        rounds = (self.waiting + 1) / max(1, self.limit)
+        return max(1, math.ceil(self.avg_hold * rounds))
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取闸门状态"""
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "avg_hold_seconds": round(self.avg_hold, 2)
+        }
+
+
+class AdmissionController:
+    """按模型（GeminiService.MODELS 的键）做准入控制和背压
+
+    并发名额和队列只在当前进程内计数，多worker部署时到达上游的并发为 worker数 × 配置值。
+    """
+
+    def __init__(self, models: Dict[str, str], limits: Dict[str, int], queue_limits: Dict[str, int],
+                 default_limit: int = 8, default_queue: int = 32):
+        """初始化准入控制器"""
+        self.models = models
+        self._gates = {
+            model_key: ModelGate(
+                model_key,
+                limits.get(model_key, default_limit),
+                queue_limits.get(model_key, default_queue)
+            )
+            for model_key in models
+        }
+
+    def gate(self, model_key: str) -> ModelGate:
+        """获取模型对应的闸门"""
+        if model_key not in self._gates:
+            raise ValueError(f"Unknown model: {model_key}")
+        return self._gates[model_key]
+
+    def slot(self, model_key: str):
+        """排队并占用一个并发名额，用法：async with admission_controller.slot(key)"""
+        # 模型熔断中时直接拒绝，不进入排队
+        circuit_breakers.check(model_key)
+        return self.gate(model_key).slot()
+
+    def reserve(self, model_key: str, force: bool = False):
+        """提前预约排队位置（提交后台任务时使用），force 用于恢复重启前已提交的任务"""
+        if not force:
+            circuit_breakers.check(model_key)
+        self.gate(model_key).reserve(force)
+
+    def hold(self, model_key: str):
+        """占用已预约的名额（后台任务执行时使用）"""
+        return self.gate(model_key).hold()
+
+    async def try_acquire(self, model_key: str) -> bool:
+        """不排队地占用一个空闲名额，成功后须调用 release 释放"""
+        return await self.gate(model_key).try_acquire()
+
+    def release(self, model_key: str):
+        """释放 try_acquire 占用的名额"""
+        self.gate(model_key).release()
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取所有模型的队列状态"""
+        status = {}
+        for model_key, gate in self._gates.items():
+            status[model_key] = {"model": self.models[model_key], **gate.get_status()}
+        return status
+
+
+# 全局准入控制器实例
+admission_controller = AdmissionController(
+    GeminiService.MODELS,
+    settings.model_concurrency_limits,
+    settings.model_queue_limits
+)
@@ -0,0 +1,231 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Deque, Tuple, Iterable
+
+import httpx
+from fastapi import HTTPException
+
+from app.config import settings
+from app.utils.logger import logger
+
+
+class CircuitOpenError(HTTPException):
+    """模型熔断中 - 直接返回503并带上Retry-After，不再等待上游超时"""
+
+    def __init__(self, model_key: str, retry_after: float):
+        retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=503,
+            detail=f"{model_key} is temporarily unavailable (circuit open), please retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.model_key = model_key
+        self.retry_after = retry_after
+
+
+class OperationFailedError(Exception):
+    """上游的长时间Operation以错误结束（operation.error），计为上游失败，不会重试"""
+
+    def __init__(self, error: Any):
+        super().__init__(f"Video operation failed: {error}")
+        self.error = error
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """判断错误是否说明上游不可用（5xx、超时、连接失败），请求参数类错误不计入"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code >= 500
+    return isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError))
+
+
+class CircuitBreaker:
+    """单个模型的熔断器：closed -> open -> half_open -> closed
+
+    统计窗口内错误率超过阈值时打开，冷却后放行少量探测请求，
+    探测成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, model_key: str, error_rate: float = 0.5, min_requests: int = 10,
+                 window_seconds: float = 60.0, open_seconds: float = 30.0, half_open_probes: int = 1):
+        """初始化熔断器
+
+        Args:
+            error_rate: 打开熔断的错误率阈值
+            min_requests: 窗口内请求数少于此值时不熔断
+            window_seconds: 错误率统计窗口（秒）
+            open_seconds: 打开后多久放行探测请求（秒）
+            half_open_probes: 半开状态同时放行的探测请求数
+        """
+        self.model_key = model_key
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.rejected = 0
+        # 窗口内的调用结果 (时间, 是否失败)
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._probes = 0
+        self._probe_deadline = 0.0
+        self._lock = threading.Lock()
+
+    def check(self):
+        """入口快速检查：熔断中且未到探测时间时直接拒绝，不占用探测名额"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now < self.opened_at + self.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(self.model_key, self.opened_at + self.open_seconds - now)
+
+    def before_call(self):
+        """发起上游调用前调用，熔断中拒绝，半开状态占用探测名额"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now < self.opened_at + self.open_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.model_key, self.opened_at + self.open_seconds - now)
+                self._transition(self.HALF_OPEN)
+
+            if self.state == self.HALF_OPEN:
+                # 探测请求没有回报结果（如被取消）时，超时后释放名额
+                if now >= self._probe_deadline:
+                    self._probes = 0
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.model_key, self._probe_deadline - now)
+                self._probes += 1
+                self._probe_deadline = now + self.open_seconds
+
+    def record_success(self):
+        """记录一次上游成功"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+                return
+            self._record(time.monotonic(), False)
+
+    def record_failure(self):
+        """记录一次上游失败"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._transition(self.OPEN)
+                return
+            if self.state == self.OPEN:
+                return
+            self._record(now, True)
+            total = len(self._outcomes)
+            failures = sum(1 for _, failed in self._outcomes if failed)
+            if total >= self.min_requests and failures / total >= self.error_rate:
+                logger.warning(f"Circuit for {self.model_key} opening: {failures}/{total} failures")
+                self._transition(self.OPEN)
+
+    def _record(self, now: float, failed: bool):
+        """记录结果并丢弃窗口外的数据"""
+        self._outcomes.append((now, failed))
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _transition(self, state: str):
+        """切换状态"""
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        if state == self.CLOSED:
+            self._outcomes.clear()
+        self._probes = 0
+        self.state = state
+        logger.info(f"Circuit for {self.model_key} -> {state}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取熔断器状态"""
+        with self._lock:
+            now = time.monotonic()
+            failures = sum(1 for t, failed in self._outcomes if failed and t >= now - self.window_seconds)
+            total = sum(1 for t, _ in self._outcomes if t >= now - self.window_seconds)
+            status = {
+                "state": self.state,
+                "requests": total,
+                "failures": failures,
+                "rejected": self.rejected
+            }
+            if self.state == self.OPEN:
+                status["retry_after"] = round(max(0.0, self.opened_at + self.open_seconds - now), 1)
+            return status
+
+
+class CircuitBreakerRegistry:
+    """按 GeminiService.MODELS 中的名称管理熔断器，首次使用时创建
+
+    错误率只在当前进程内统计，多worker部署时各进程分别熔断。
+    """
+
+    def __init__(self, **options):
+        """初始化，options 为每个熔断器的参数"""
+        self.options = options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model_key: str) -> CircuitBreaker:
+        """获取（或创建）模型的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(model_key)
+            if breaker is None:
+                breaker = CircuitBreaker(model_key, **self.options)
+                self._breakers[model_key] = breaker
+            return breaker
+
+    def check(self, model_key: str):
+        """入口快速检查"""
+        self.breaker(model_key).check()
+
+    def before_call(self, model_key: str):
+        """上游调用前检查"""
+        self.breaker(model_key).before_call()
+
+    def is_closed(self, model_key: str) -> bool:
+        """模型熔断器是否处于关闭（正常）状态"""
+        return self.breaker(model_key).state == CircuitBreaker.CLOSED
+
+    def record_success(self, model_key: str):
+        """记录上游成功"""
+        self.breaker(model_key).record_success()
+
+    def record_error(self, model_key: str, error: Exception):
+        """记录上游错误
+
+        上游不可用或Operation以错误结束计为失败；上游返回的参数类错误说明上游可用，按成功计；
+        本地错误（拒绝、未配置客户端、磁盘错误等）没有得到上游响应，不计入。
+        半开状态下未回报结果的探测名额在超时后释放。
+        """
+        if isinstance(error, OperationFailedError) or is_upstream_failure(error):
+            self.breaker(model_key).record_failure()
+        elif isinstance(getattr(error, "code", None), int):
+            self.breaker(model_key).record_success()
+
+    def get_status(self, model_keys: Iterable[str] = ()) -> Dict[str, Dict[str, Any]]:
+        """获取熔断器状态，model_keys 中尚未使用过的模型也一并列出"""
+        for model_key in model_keys:
+            self.breaker(model_key)
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return {model_key: breaker.get_status() for model_key, breaker in breakers}
+
+
+# 全局熔断器实例
+circuit_breakers = CircuitBreakerRegistry(
+    error_rate=settings.circuit_error_rate,
+    min_requests=settings.circuit_min_requests,
+    window_seconds=settings.circuit_window_seconds,
+    open_seconds=settings.circuit_open_seconds,
+    half_open_probes=settings.circuit_half_open_probes
+)
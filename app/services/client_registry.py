@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+import httpx
+from google import genai
+from google.genai import types
+
+from app.config import settings
+from app.utils.logger import logger
+
+
+def hash_api_key(api_key: str) -> str:
+    """计算API Key的哈希，避免明文Key出现在内存索引和日志中"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class ClientRegistry:
+    """genai.Client 池 - 按API Key哈希复用长连接客户端，LRU淘汰
+
+    被淘汰的客户端延迟 close_delay 秒后关闭同步和异步连接池，留给仍在进行的请求完成。
+    """
+
+    def __init__(self, max_clients: int = 32, keepalive_expiry: float = 120.0,
+                 max_keepalive_connections: int = 20, close_delay: float = 300.0):
+        """初始化客户端池"""
+        self.max_clients = max_clients
+        self.keepalive_expiry = keepalive_expiry
+        self.max_keepalive_connections = max_keepalive_connections
+        self.close_delay = close_delay
+        self._clients: "OrderedDict[str, genai.Client]" = OrderedDict()
+        # 已淘汰、等待关闭的客户端 [(淘汰时间, 客户端)]
+        self._retired: List[Tuple[float, genai.Client]] = []
+        self._close_task: Optional[asyncio.Task] = None
+        # 下载文件用的共享HTTP客户端，按需创建
+        self._http_client: Optional[httpx.Client] = None
+        # 视频任务会在线程池中取客户端，需要加锁
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> genai.Client:
+        """获取（或创建）API Key对应的客户端"""
+        if not api_key:
+            raise ValueError("API key is required")
+
+        key_hash = hash_api_key(api_key)
+        with self._lock:
+            client = self._clients.get(key_hash)
+            if client is not None:
+                self._clients.move_to_end(key_hash)
+                return client
+
+            client = self._create_client(api_key)
+            self._clients[key_hash] = client
+            # 超出容量时淘汰最久未使用的客户端，仍在进行的请求可能还在用，延迟关闭
+            while len(self._clients) > self.max_clients:
+                evicted_hash, evicted = self._clients.popitem(last=False)
+                self._retired.append((time.monotonic(), evicted))
+                logger.info(f"Gemini client evicted: {evicted_hash[:12]}")
+            return client
+
+    async def warm(self, api_key: str, model: str):
+        """预热客户端：对异步（文生图等）和同步（视频任务）连接池各发起一次轻量请求建立TLS长连接"""
+        client = self.get(api_key)
+        try:
+            await asyncio.gather(
+                client.aio.models.get(model=model),
+                asyncio.to_thread(client.models.get, model=model)
+            )
+            logger.info(f"Gemini client warmed: {hash_api_key(api_key)[:12]}")
+        except Exception as e:
+            logger.warning(f"Gemini client warm-up request failed: {e}")
+
+    async def start(self):
+        """启动定期关闭已淘汰客户端的后台任务"""
+        if self._close_task is None:
+            self._close_task = asyncio.create_task(self._close_loop())
+
+    async def stop(self):
+        """停止后台任务并关闭所有客户端"""
+        if self._close_task is not None:
+            self._close_task.cancel()
+            await asyncio.gather(self._close_task, return_exceptions=True)
+            self._close_task = None
+        with self._lock:
+            clients = [client for _, client in self._retired] + list(self._clients.values())
+            self._retired = []
+            self._clients.clear()
+            http_client, self._http_client = self._http_client, None
+        for client in clients:
+            await self._close(client)
+        if http_client is not None:
+            http_client.close()
+
+    async def _close_loop(self):
+        """定期关闭淘汰超过 close_delay 的客户端"""
+        while True:
+            await asyncio.sleep(max(1.0, self.close_delay / 2))
+            cutoff = time.monotonic() - self.close_delay
+            with self._lock:
+                expired = [client for retired_at, client in self._retired if retired_at <= cutoff]
+                self._retired = [item for item in self._retired if item[0] > cutoff]
+            for client in expired:
+                await self._close(client)
+
+    async def _close(self, client: genai.Client):
+        """关闭客户端的同步和异步连接池"""
+        try:
+            client.close()
+            await client.aio.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to close Gemini client: {e}")
+
+    def get_http_client(self) -> httpx.Client:
+        """获取用于流式下载生成文件的共享HTTP客户端（线程安全，复用长连接）"""
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry
+                    ),
+                    # 视频文件较大，读超时放宽
+                    timeout=httpx.Timeout(30.0, read=300.0),
+                    follow_redirects=True
+                )
+            return self._http_client
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取客户端池状态"""
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "max_clients": self.max_clients,
+                "retired": len(self._retired)
+            }
+
+    def _create_client(self, api_key: str) -> genai.Client:
+        """创建带长连接配置的客户端，同步（视频任务）和异步（文生图等）连接池使用相同配置"""
+        limits = httpx.Limits(
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        http_options = types.HttpOptions(
+            client_args={"limits": limits},
+            async_client_args={"limits": limits}
+        )
+        client = genai.Client(api_key=api_key, http_options=http_options)
+        logger.info(f"Gemini client created: {hash_api_key(api_key)[:12]}")
+        return client
+
+
+# 全局客户端池实例
+client_registry = ClientRegistry(
+    max_clients=settings.client_pool_size,
+    keepalive_expiry=settings.client_keepalive_expiry,
+    close_delay=settings.client_close_delay
+)
@@ -1,16 +1,24 @@
 import os
+import asyncio
+import hashlib
 import shutil
-from typing import List, Dict, Any
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from werkzeug.utils import secure_filename
 
 from app.config import settings
 from app.utils.logger import logger
-from app.utils.helpers import generate_unique_filename, validate_file_type, get_file_size_mb
+from app.utils.helpers import generate_unique_filename, validate_file_type, get_file_size_mb, sharded_path
+from app.services.output_catalog import output_catalog
+from app.services.output_store import OutputStore
 
 
 class FileService:
     """文件服务类"""
     
+    # 上传文件分块复制大小
+    CHUNK_SIZE = 1024 * 1024
+    
     def __init__(self):
         """初始化文件服务"""
         self.upload_folder = settings.upload_folder
@@ -18,8 +26,8 @@ class FileService:
         self.allowed_image_extensions = settings.allowed_image_extensions
         self.allowed_video_extensions = settings.allowed_video_extensions
     
-    def save_uploaded_file(self, file, file_type: str = "image") -> Dict[str, Any]:
-        """保存上传的文件"""
+    async def save_uploaded_file(self, file, file_type: str = "image") -> Dict[str, Any]:
+        """保存上传的文件 - 分块流式写入，超过大小限制立即中止，同时计算sha256"""
         try:
             if not file or not file.filename:
                 return {
@@ -41,31 +49,25 @@ class FileService:
                     "message": f"不支持的文件格式，请上传 {', '.join(allowed_extensions)} 格式的文件"
                 }
             
+            # 上传大小已知时直接拒绝，不再复制
+            if getattr(file, "size", None) is not None and file.size > self.max_file_size:
+                return self._file_too_large()
+            
             # 生成安全的文件名
             filename = secure_filename(file.filename)
             unique_filename = generate_unique_filename(filename, file_type)
             
             # 确定保存路径
             subfolder = "images" if file_type == "image" else "videos"
-            save_dir = os.path.join(self.upload_folder, subfolder)
-            os.makedirs(save_dir, exist_ok=True)
-            
-            filepath = os.path.join(save_dir, unique_filename)
+            filepath = sharded_path(os.path.join(self.upload_folder, subfolder), unique_filename)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
             
-            # 保存文件 - 修复FastAPI UploadFile的保存方式
-            with open(filepath, 'wb') as f:
-                content = file.file.read()
-                f.write(content)
-            
-            # 检查文件大小
-            file_size_mb = get_file_size_mb(filepath)
-            if file_size_mb > (self.max_file_size / (1024 * 1024)):
-                os.remove(filepath)
-                return {
-                    "success": False,
-                    "error": "File too large",
-                    "message": f"文件过大，最大支持 {self.max_file_size / (1024 * 1024):.0f}MB"
-                }
+            # 阻塞的读写放到线程池，内存占用只有一个分块
+            written = await asyncio.to_thread(self._write_stream, file.file, filepath)
+            if written is None:
+                return self._file_too_large()
+            size, sha256 = written
+            await asyncio.to_thread(output_catalog.add, filepath, sha256)
             
             logger.info(f"File saved successfully: {filepath}")
             
@@ -74,7 +76,8 @@ class FileService:
                 "filename": unique_filename,
                 "filepath": filepath,
                 "url": f"/outputs/{subfolder}/{unique_filename}",
-                "size_mb": file_size_mb,
+                "size_mb": round(size / (1024 * 1024), 2),
+                "sha256": sha256,
                 "message": "文件上传成功"
             }
             
@@ -88,6 +91,42 @@ class FileService:
                 "message": "文件保存失败"
             }
     
+    def _write_stream(self, source, filepath: str) -> Optional[Tuple[int, str]]:
+        """分块复制到临时文件并计算sha256，完成后原子重命名；超过大小限制时删除并返回None"""
+        digest = hashlib.sha256()
+        size = 0
+        # 以点开头的临时文件，不会出现在文件列表中
+        temp_path = os.path.join(os.path.dirname(filepath), f".{os.path.basename(filepath)}.part")
+        try:
+            with open(temp_path, 'wb') as f:
+                while True:
+                    chunk = source.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_file_size:
+                        logger.warning(f"Upload exceeds size limit, aborted: {filepath}")
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+            if size > self.max_file_size:
+                os.remove(temp_path)
+                return None
+            os.replace(temp_path, filepath)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return size, digest.hexdigest()
+    
+    def _file_too_large(self) -> Dict[str, Any]:
+        """文件过大的返回结果"""
+        return {
+            "success": False,
+            "error": "File too large",
+            "message": f"文件过大，最大支持 {self.max_file_size / (1024 * 1024):.0f}MB"
+        }
+    
     def get_file_info(self, filepath: str) -> Dict[str, Any]:
         """获取文件信息"""
         try:
@@ -118,32 +157,21 @@ class FileService:
                 "message": "获取文件信息失败"
             }
     
-    def list_files(self, file_type: str = "image") -> List[Dict[str, Any]]:
-        """列出指定类型的文件"""
-        try:
-            subfolder = "images" if file_type == "image" else "videos"
-            folder_path = os.path.join(self.upload_folder, subfolder)
-            
-            if not os.path.exists(folder_path):
-                return []
-            
-            files = []
-            for filename in os.listdir(folder_path):
-                filepath = os.path.join(folder_path, filename)
-                if os.path.isfile(filepath):
-                    file_info = self.get_file_info(filepath)
-                    if file_info["success"]:
-                        file_info["url"] = f"/outputs/{subfolder}/{filename}"
-                        files.append(file_info)
-            
-            # 按修改时间排序（最新的在前）
-            files.sort(key=lambda x: x["modified"], reverse=True)
-            
-            return files
-            
-        except Exception as e:
-            logger.error(f"List files failed: {e}")
-            return []
+    def list_files(self, file_type: str = "image", limit: Optional[int] = None,
+                   cursor: Optional[str] = None, sort: str = "modified", order: str = "desc",
+                   prefix: Optional[str] = None, since: Optional[float] = None,
+                   until: Optional[float] = None) -> Dict[str, Any]:
+        """分页列出指定类型的文件 - 查询输出索引，不扫描目录
+
+        Returns:
+            {"files": 当前页文件, "next_cursor": 下一页游标，没有更多时为None}
+        """
+        limit = min(limit or settings.catalog_page_size, settings.catalog_max_page_size)
+        files, next_cursor = output_catalog.list(
+            file_type, limit=limit, cursor=cursor, sort=sort, order=order,
+            prefix=prefix, since=since, until=until
+        )
+        return {"files": files, "next_cursor": next_cursor}
     
     def delete_file(self, filepath: str) -> Dict[str, Any]:
         """删除文件"""
@@ -156,6 +184,7 @@ class FileService:
                 }
             
             os.remove(filepath)
+            output_catalog.remove(filepath)
             logger.info(f"File deleted: {filepath}")
             
             return {
@@ -171,12 +200,86 @@ class FileService:
                 "message": "文件删除失败"
             }
     
-    def cleanup_temp_files(self, max_age_hours: int = 24):
-        """清理临时文件"""
+    def cleanup_temp_files(self, max_age_hours: float = 24, cursor: str = "",
+                           max_entries: int = 100) -> Tuple[Dict[str, int], str]:
+        """清理超过指定时间的临时文件（.part）和不再被任何输出文件引用的内容对象
+
+        每次都检查对象临时目录；其余目录按分片增量检查，从 cursor 之后的目录开始，
+        检查的文件数达到 max_entries 后停止，返回 (删除数量, 下次开始的游标)，游标为空表示从头开始。
+        只处理超过 max_age_hours 的文件，不会删除正在写入或刚写入的文件。
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        removed = {"temp_files": 0, "orphan_objects": 0}
+        objects_dir = os.path.join(self.upload_folder, OutputStore.OBJECTS_DIR)
+        tmp_dir = os.path.join(objects_dir, "tmp")
+        next_cursor = ""
         try:
-            # 这里可以实现清理逻辑
-            # 例如删除超过指定时间的临时文件
-            pass
+            self._cleanup_dir(tmp_dir, cutoff, False, removed)
+            examined = 0
+            for relative in self._cleanup_dirs(tmp_dir):
+                if relative <= cursor:
+                    continue
+                path = os.path.join(self.upload_folder, relative)
+                in_objects = os.path.commonpath([path, objects_dir]) == objects_dir
+                examined += self._cleanup_dir(path, cutoff, in_objects, removed)
+                if examined >= max_entries:
+                    next_cursor = relative
+                    break
+            if removed["temp_files"] or removed["orphan_objects"]:
+                logger.info(
+                    f"Removed {removed['temp_files']} temp files and "
+                    f"{removed['orphan_objects']} orphan objects"
+                )
         except Exception as e:
             logger.error(f"Cleanup temp files failed: {e}")
+            next_cursor = cursor
+        return removed, next_cursor
+
+    def _cleanup_dirs(self, tmp_dir: str) -> List[str]:
+        """按顺序列出需要增量检查的目录（相对路径）：各子目录及其分片目录，不包括对象临时目录"""
+        dirs = []
+        if not os.path.isdir(self.upload_folder):
+            return dirs
+        with os.scandir(self.upload_folder) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                dirs.append(entry.name)
+                with os.scandir(entry.path) as shard_entries:
+                    dirs.extend(
+                        os.path.join(entry.name, shard_entry.name) for shard_entry in shard_entries
+                        if shard_entry.is_dir() and shard_entry.path != tmp_dir
+                    )
+        return sorted(dirs)
 
+    @staticmethod
+    def _cleanup_dir(path: str, cutoff: float, in_objects: bool, removed: Dict[str, int]) -> int:
+        """清理单个目录中过期的临时文件和孤立内容对象，返回检查的文件数
+
+        输出目录中只需查看 .part 文件，不对其他文件调用 stat。
+        """
+        examined = 0
+        try:
+            with os.scandir(path) as it:
+                entries = [entry for entry in it if entry.is_file()]
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            is_temp = entry.name.endswith(".part")
+            if not is_temp and not in_objects:
+                continue
+            examined += 1
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime >= cutoff:
+                continue
+            if is_temp:
+                os.remove(entry.path)
+                removed["temp_files"] += 1
+            elif stat.st_nlink == 1:
+                # 对外文件名都已删除，只剩对象本身的链接
+                os.remove(entry.path)
+                removed["orphan_objects"] += 1
+        return examined
@@ -1,8 +1,9 @@
 import os
 import time
+import asyncio
 import uuid
 import base64
-from datetime import datetime
+import hashlib
 from typing import Optional, Dict, Any, List
 from io import BytesIO
 from PIL import Image
@@ -12,7 +13,14 @@ from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.config import get_gemini_api_key, settings
 from app.utils.logger import logger
-from app.utils.helpers import generate_unique_filename, cleanup_temp_file
+from app.utils.helpers import cleanup_temp_file
+from app.services.client_registry import client_registry, hash_api_key
+from app.services.rate_limiter import rate_limiter
+from app.services.circuit_breaker import circuit_breakers, OperationFailedError
+from app.services.key_pool import key_pool
+from app.services.hedging import image_hedger
+from app.services.video_registry import video_registry
+from app.services.output_store import output_store
 
 
 class GeminiService:
@@ -36,33 +44,26 @@ class GeminiService:
         """初始化Gemini服务"""
         try:
             self.api_key = api_key or get_gemini_api_key()
-            self.client = None
-            self._init_client()
-            # 会话级Video对象缓存 - 用于视频延长功能
-            self._video_cache = {}  # {video_filename: {"video_object": Video, "chain": [filenames]}}
         except Exception as e:
             logger.warning(f"Gemini service initialization failed: {e}")
             self.api_key = api_key
-            self.client = None
-            self._video_cache = {}
     
-    def _init_client(self):
-        """初始化Gemini客户端"""
+    @property
+    def client(self) -> Optional[genai.Client]:
+        """从客户端池获取长连接客户端，避免每个请求重建连接
+
+        每次访问都从池中取，视频任务等长时间持有服务实例时，不会继续使用已被淘汰关闭的客户端。
+        """
+        if not self.api_key:
+            return None
         try:
-            if not self.api_key:
-                raise ValueError("API key is required")
-            from google import genai
-            self.client = genai.Client(api_key=self.api_key)
-            logger.info("Gemini client initialized successfully")
+            return client_registry.get(self.api_key)
         except Exception as e:
             logger.error(f"Failed to initialize Gemini client: {e}")
-            self.client = None
+            return None
     
     def _ensure_client(self):
-        """确保客户端已初始化，如果未初始化则尝试重新初始化"""
-        if not self.client:
-            logger.info("Client not initialized, attempting to reinitialize...")
-            self._init_client()
+        """确保客户端可用"""
         return self.client is not None
     
     def get_client_status(self):
@@ -72,6 +73,16 @@ class GeminiService:
             "api_key_configured": bool(self.api_key)
         }
     
+    def report_upstream_error(self, model_key: str, error: Exception):
+        """上报上游调用错误，用于限流器和Key池根据429暂停请求、熔断器统计错误率"""
+        rate_limiter.report_error(self.api_key, model_key, error)
+        key_pool.report_error(self.api_key, model_key, error)
+        circuit_breakers.record_error(model_key, error)
+    
+    def report_upstream_success(self, model_key: str):
+        """上报上游调用成功，用于熔断器统计错误率和半开探测"""
+        circuit_breakers.record_success(model_key)
+    
     def _validate_video_params(self, aspect_ratio: str, resolution: str, person_generation: str):
         """验证视频生成参数"""
         if aspect_ratio not in self.SUPPORTED_ASPECT_RATIOS:
@@ -105,40 +116,7 @@ class GeminiService:
                 contents=[prompt],
             )
             
-            # 处理响应 - 根据官方文档的示例代码
-            saved_files = []
-            if response.candidates:
-                for candidate in response.candidates:
-                    if candidate.content and candidate.content.parts:
-                        for i, part in enumerate(candidate.content.parts):
-                            # 检查是否有图片数据
-                            if part.inline_data and part.inline_data.data:
-                                filename = self._save_image_from_data(part.inline_data.data, f"generated_image_{i}")
-                                saved_files.append(filename)
-                                logger.info(f"Saved generated image: {filename}")
-                            # 检查是否有文本响应（可能包含错误信息）
-                            elif part.text:
-                                logger.info(f"Response text: {part.text}")
-                                # 如果返回文本而不是图片，可能是提示词问题
-                                if any(keyword in part.text.lower() for keyword in ["cannot", "unable", "can't", "不能", "无法"]):
-                                    return {
-                                        "success": False,
-                                        "error": "API returned text instead of image",
-                                        "message": f"图片生成失败：{part.text}"
-                                    }
-            
-            if saved_files:
-                return {
-                    "success": True,
-                    "files": saved_files,
-                    "message": f"Successfully generated {len(saved_files)} image(s)"
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": "No images in response",
-                    "message": "Image generation failed - no images returned. Please try a different prompt or check your API key."
-                }
+            return self._build_generate_image_result(response)
             
         except Exception as e:
             error_msg = str(e)
@@ -151,6 +129,43 @@ class GeminiService:
                 "message": f"Image generation failed: {error_msg}"
             }
     
+    def _build_generate_image_result(self, response) -> Dict[str, Any]:
+        """处理图片生成响应并保存图片"""
+        # 处理响应 - 根据官方文档的示例代码
+        saved_files = []
+        if response.candidates:
+            for candidate in response.candidates:
+                if candidate.content and candidate.content.parts:
+                    for i, part in enumerate(candidate.content.parts):
+                        # 检查是否有图片数据
+                        if part.inline_data and part.inline_data.data:
+                            filename = self._save_image_from_data(part.inline_data.data, f"generated_image_{i}")
+                            saved_files.append(filename)
+                            logger.info(f"Saved generated image: {filename}")
+                        # 检查是否有文本响应（可能包含错误信息）
+                        elif part.text:
+                            logger.info(f"Response text: {part.text}")
+                            # 如果返回文本而不是图片，可能是提示词问题
+                            if any(keyword in part.text.lower() for keyword in ["cannot", "unable", "can't", "不能", "无法"]):
+                                return {
+                                    "success": False,
+                                    "error": "API returned text instead of image",
+                                    "message": f"图片生成失败：{part.text}"
+                                }
+        
+        if saved_files:
+            return {
+                "success": True,
+                "files": saved_files,
+                "message": f"Successfully generated {len(saved_files)} image(s)"
+            }
+        else:
+            return {
+                "success": False,
+                "error": "No images in response",
+                "message": "Image generation failed - no images returned. Please try a different prompt or check your API key."
+            }
+    
     def generate_video_from_text(self, prompt: str, aspect_ratio: str = "16:9",
                                 duration_seconds: int = 8, resolution: str = "720p",
                                 person_generation: str = "allow_all", negative_prompt: str = "") -> Dict[str, Any]:
@@ -163,70 +178,19 @@ class GeminiService:
                     "message": "Please configure API key first"
                 }
             
-            logger.info(f"Generating video from text: {prompt[:50]}...")
-            
-            # 验证参数
-            self._validate_video_params(aspect_ratio, resolution, person_generation)
-            
-            # 调用Veo API - 根据官方示例代码的正确方式
-            # 注意：使用snake_case参数名格式，与官方示例一致
-            config_params = {
-                "person_generation": person_generation,
-                "aspect_ratio": aspect_ratio,
-                "resolution": resolution,
-                "durationSeconds": duration_seconds,
-            }
-            
-            # 添加负提示（如果提供）
-            if negative_prompt:
-                config_params["negativePrompt"] = negative_prompt
-            
-            config = types.GenerateVideosConfig(**config_params)
-            
-            # 详细日志记录
-            logger.info(f"=== 文生视频API调用详情 ===")
-            logger.info(f"模型: {self.MODELS['VIDEO_GENERATION']}")
-            logger.info(f"提示词: {prompt[:100]}...")
-            logger.info(f"配置参数: {config_params}")
-            logger.info(f"Config对象: {config}")
-            
-            operation = self.client.models.generate_videos(
-                model=self.MODELS["VIDEO_GENERATION"],
+            operation = self.start_video_from_text(
                 prompt=prompt,
-                config=config
+                aspect_ratio=aspect_ratio,
+                duration_seconds=duration_seconds,
+                resolution=resolution,
+                person_generation=person_generation,
+                negative_prompt=negative_prompt
             )
             
-            logger.info(f"Operation对象: {operation}")
-            logger.info(f"Operation类型: {type(operation)}")
-            
             # 等待视频生成完成 - 根据官方文档的轮询方式
-            while not operation.done:
-                logger.info("Waiting for video generation to complete...")
-                time.sleep(10)  # 官方文档建议10秒间隔
-                operation = self.client.operations.get(operation)
-            
-            # 下载生成的视频
-            if not operation.response.generated_videos:
-                raise Exception("无法根据要求生成视频")
-            
-            # 处理生成的视频
-            for n, video in enumerate(operation.response.generated_videos):
-                try:
-                    filename = self._download_video(video.video, "text_to_video")
-                    logger.info(f"成功下载视频 {n}: {filename}")
-                    
-                    # 缓存Video对象，用于后续延长功能
-                    self._cache_video_object(filename, video.video, None)
-                    logger.info(f"Video对象已缓存，可用于延长: {filename}")
-                    
-                    return {
-                        "success": True,
-                        "file": filename,
-                        "message": "Video generated successfully"
-                    }
-                except Exception as e:
-                    logger.error(f"下载视频 {n} 失败: {str(e)}")
-                    raise e
+            operation = self._wait_for_operation(operation)
+            
+            return self.finish_video_operation(operation, "text_to_video")
             
         except Exception as e:
             logger.error(f"Video generation from text failed: {e}")
@@ -236,6 +200,50 @@ class GeminiService:
                 "message": "Video generation from text failed"
             }
     
+    def start_video_from_text(self, prompt: str, aspect_ratio: str = "16:9",
+                              duration_seconds: int = 8, resolution: str = "720p",
+                              person_generation: str = "allow_all", negative_prompt: str = ""):
+        """提交文生视频任务，立即返回Operation对象（不等待完成）"""
+        if not self._ensure_client():
+            raise RuntimeError("Gemini client not initialized")
+        
+        logger.info(f"Generating video from text: {prompt[:50]}...")
+        
+        # 验证参数
+        self._validate_video_params(aspect_ratio, resolution, person_generation)
+        
+        # 调用Veo API - 根据官方示例代码的正确方式
+        # 注意：使用snake_case参数名格式，与官方示例一致
+        config_params = {
+            "person_generation": person_generation,
+            "aspect_ratio": aspect_ratio,
+            "resolution": resolution,
+            "durationSeconds": duration_seconds,
+        }
+        
+        # 添加负提示（如果提供）
+        if negative_prompt:
+            config_params["negativePrompt"] = negative_prompt
+        
+        config = types.GenerateVideosConfig(**config_params)
+        
+        # 详细日志记录
+        logger.info(f"=== 文生视频API调用详情 ===")
+        logger.info(f"模型: {self.MODELS['VIDEO_GENERATION']}")
+        logger.info(f"提示词: {prompt[:100]}...")
+        logger.info(f"配置参数: {config_params}")
+        logger.info(f"Config对象: {config}")
+        
+        operation = self.client.models.generate_videos(
+            model=self.MODELS["VIDEO_GENERATION"],
+            prompt=prompt,
+            config=config
+        )
+        
+        logger.info(f"Operation对象: {operation}")
+        logger.info(f"Operation类型: {type(operation)}")
+        return operation
+    
     def generate_video_from_image(self, prompt: str, image_path: str,
                                  aspect_ratio: str = "16:9",
                                  duration_seconds: int = 8, resolution: str = "720p",
@@ -249,80 +257,20 @@ class GeminiService:
                     "message": "Please configure API key first"
                 }
             
-            logger.info(f"Generating video from image: {prompt[:50]}...")
-            
-            # 验证参数
-            self._validate_video_params(aspect_ratio, resolution, person_generation)
-            
-            # 验证person_generation参数（图生视频不支持allow_all）
-            if person_generation == "allow_all":
-                raise ValueError("Image to video generation does not support generating videos with both adults and children")
-            
-            # 读取并处理图片
-            image = self._load_image(image_path)
-            
-            # 调用Veo API - 根据官方示例代码的正确方式
-            # 注意：使用snake_case参数名格式，与官方示例一致
-            config_params = {
-                "person_generation": person_generation,
-                "aspect_ratio": aspect_ratio,
-                "resolution": resolution,
-                "durationSeconds": duration_seconds,
-            }
-            
-            # 添加负提示（如果提供）
-            if negative_prompt:
-                config_params["negativePrompt"] = negative_prompt
-            
-            config = types.GenerateVideosConfig(**config_params)
-            
-            # 详细日志记录
-            logger.info(f"=== 图生视频API调用详情 ===")
-            logger.info(f"模型: {self.MODELS['VIDEO_GENERATION']}")
-            logger.info(f"提示词: {prompt[:100]}...")
-            logger.info(f"图片路径: {image_path}")
-            logger.info(f"图片对象: {type(image)}")
-            logger.info(f"配置参数: {config_params}")
-            logger.info(f"Config对象: {config}")
-            
-            operation = self.client.models.generate_videos(
-                model=self.MODELS["VIDEO_GENERATION"],
+            operation = self.start_video_from_image(
                 prompt=prompt,
-                image=image,
-                config=config
+                image_path=image_path,
+                aspect_ratio=aspect_ratio,
+                duration_seconds=duration_seconds,
+                resolution=resolution,
+                person_generation=person_generation,
+                negative_prompt=negative_prompt
             )
             
-            logger.info(f"Operation对象: {operation}")
-            logger.info(f"Operation类型: {type(operation)}")
-            
             # 等待视频生成完成 - 根据官方文档的轮询方式
-            while not operation.done:
-                logger.info("Waiting for video generation to complete...")
-                time.sleep(10)  # 官方文档建议10秒间隔
-                operation = self.client.operations.get(operation)
-            
-            # 下载生成的视频
-            if not operation.response.generated_videos:
-                raise Exception("无法根据要求生成视频")
-            
-            # 处理生成的视频
-            for n, video in enumerate(operation.response.generated_videos):
-                try:
-                    filename = self._download_video(video.video, "image_to_video")
-                    logger.info(f"成功下载视频 {n}: {filename}")
-                    
-                    # 缓存Video对象，用于后续延长功能
-                    self._cache_video_object(filename, video.video, None)
-                    logger.info(f"Video对象已缓存，可用于延长: {filename}")
-                    
-                    return {
-                        "success": True,
-                        "file": filename,
-                        "message": "Video generated successfully"
-                    }
-                except Exception as e:
-                    logger.error(f"下载视频 {n} 失败: {str(e)}")
-                    raise e
+            operation = self._wait_for_operation(operation)
+            
+            return self.finish_video_operation(operation, "image_to_video")
             
         except Exception as e:
             logger.error(f"Video generation from image failed: {e}")
@@ -332,6 +280,113 @@ class GeminiService:
                 "message": "Video generation from image failed"
             }
     
+    def start_video_from_image(self, prompt: str, image_path: str,
+                               aspect_ratio: str = "16:9",
+                               duration_seconds: int = 8, resolution: str = "720p",
+                               person_generation: str = "allow_adult", negative_prompt: str = ""):
+        """提交图生视频任务，立即返回Operation对象（不等待完成）"""
+        if not self._ensure_client():
+            raise RuntimeError("Gemini client not initialized")
+        
+        logger.info(f"Generating video from image: {prompt[:50]}...")
+        
+        # 验证参数
+        self._validate_video_params(aspect_ratio, resolution, person_generation)
+        
+        # 验证person_generation参数（图生视频不支持allow_all）
+        if person_generation == "allow_all":
+            raise ValueError("Image to video generation does not support generating videos with both adults and children")
+        
+        # 读取并处理图片
+        image = self._load_image(image_path)
+        
+        # 调用Veo API - 根据官方示例代码的正确方式
+        # 注意：使用snake_case参数名格式，与官方示例一致
+        config_params = {
+            "person_generation": person_generation,
+            "aspect_ratio": aspect_ratio,
+            "resolution": resolution,
+            "durationSeconds": duration_seconds,
+        }
+        
+        # 添加负提示（如果提供）
+        if negative_prompt:
+            config_params["negativePrompt"] = negative_prompt
+        
+        config = types.GenerateVideosConfig(**config_params)
+        
+        # 详细日志记录
+        logger.info(f"=== 图生视频API调用详情 ===")
+        logger.info(f"模型: {self.MODELS['VIDEO_GENERATION']}")
+        logger.info(f"提示词: {prompt[:100]}...")
+        logger.info(f"图片路径: {image_path}")
+        logger.info(f"图片对象: {type(image)}")
+        logger.info(f"配置参数: {config_params}")
+        logger.info(f"Config对象: {config}")
+        
+        operation = self.client.models.generate_videos(
+            model=self.MODELS["VIDEO_GENERATION"],
+            prompt=prompt,
+            image=image,
+            config=config
+        )
+        
+        logger.info(f"Operation对象: {operation}")
+        logger.info(f"Operation类型: {type(operation)}")
+        return operation
+    
+    def get_operation(self, operation):
+        """查询一次Operation的最新状态"""
+        return self.client.operations.get(operation)
+    
+    def _wait_for_operation(self, operation, interval: int = 10):
+        """阻塞轮询直到Operation完成（同步调用方使用）"""
+        while not operation.done:
+            logger.info("Waiting for video generation to complete...")
+            time.sleep(interval)  # 官方文档建议10秒间隔
+            operation = self.get_operation(operation)
+        return operation
+    
+    def finish_video_operation(self, operation, prefix: str,
+                               parent_filename: Optional[str] = None) -> Dict[str, Any]:
+        """下载已完成Operation中的视频并缓存Video对象
+        
+        Args:
+            operation: 已完成的Operation对象
+            prefix: 保存文件名前缀
+            parent_filename: 父视频文件名（延长视频时提供）
+        """
+        if operation.error:
+            raise OperationFailedError(operation.error)
+        
+        # 下载生成的视频
+        if not operation.response or not operation.response.generated_videos:
+            raise Exception("无法延长视频" if parent_filename else "无法根据要求生成视频")
+        
+        # 处理生成的视频
+        for n, video in enumerate(operation.response.generated_videos):
+            try:
+                filename = self._download_video(video.video, prefix)
+                logger.info(f"成功下载视频 {n}: {filename}")
+                
+                # 缓存Video对象，用于后续延长功能
+                self._cache_video_object(filename, video.video, parent_filename)
+                logger.info(f"Video对象已缓存，可用于延长: {filename}")
+                
+                result = {
+                    "success": True,
+                    "file": filename,
+                    "message": "Video extended successfully" if parent_filename else "Video generated successfully"
+                }
+                if parent_filename:
+                    # 获取完整的视频链
+                    result["chain"] = self.get_video_chain(filename)
+                    logger.info(f"视频链: {result['chain']}")
+                return result
+            except Exception as e:
+                logger.error(f"下载视频 {n} 失败: {str(e)}")
+                raise e
+    
     def analyze_image(self, image_path: str, analysis_prompt: str = "Describe this image in detail") -> Dict[str, Any]:
         """分析图片"""
         try:
@@ -346,11 +401,7 @@ class GeminiService:
                 contents=[image, analysis_prompt]
             )
             
-            return {
-                "success": True,
-                "analysis": response.text,
-                "message": "Image analysis completed"
-            }
+            return self._build_analysis_result(response)
             
         except Exception as e:
             logger.error(f"Image analysis failed: {e}")
@@ -360,6 +411,14 @@ class GeminiService:
                 "message": "Image analysis failed"
             }
     
+    def _build_analysis_result(self, response) -> Dict[str, Any]:
+        """处理图片分析响应"""
+        return {
+            "success": True,
+            "analysis": response.text,
+            "message": "Image analysis completed"
+        }
+    
     def _load_image(self, image_path: str):
         """加载图片为Gemini Image类型"""
         if not os.path.exists(image_path):
@@ -387,123 +446,79 @@ class GeminiService:
         )
     
     def _save_image_from_data(self, image_data: bytes, prefix: str) -> str:
-        """从图片数据保存图片"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{prefix}_{timestamp}.png"
-        filepath = os.path.join(settings.upload_folder, "images", filename)
-        
-        # 确保目录存在
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
+        """从图片数据保存图片（内容寻址存储，相同内容只保存一份）"""
         # 检查图片数据
         if not image_data:
             logger.error("Image data is empty")
             raise ValueError("Image data is empty")
         
-        # 保存图片数据
-        with open(filepath, 'wb') as f:
-            f.write(image_data)
-        
-        logger.info(f"Image saved: {filepath}")
-        return f"/outputs/images/{filename}"
+        url = output_store.put_bytes(image_data, "images", prefix, ".png")
+        logger.info(f"Image saved: {url}")
+        return url
     
     def _save_video_from_data(self, video_data: bytes, prefix: str) -> str:
         """从视频数据保存视频"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{prefix}_{timestamp}.mp4"
-        filepath = os.path.join(settings.upload_folder, "videos", filename)
-        
-        # 确保目录存在
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
         # 检查视频数据
         if not video_data:
             logger.error("Video data is empty")
             raise ValueError("Video data is empty")
         
-        # 保存视频数据
-        with open(filepath, 'wb') as f:
-            f.write(video_data)
-        
-        logger.info(f"Video saved: {filepath}")
-        return f"/outputs/videos/{filename}"
+        url = output_store.put_bytes(video_data, "videos", prefix, ".mp4")
+        logger.info(f"Video saved: {url}")
+        return url
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def _save_image(self, image, prefix: str) -> str:
-        """保存生成的图片"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{prefix}_{timestamp}.png"
-        filepath = os.path.join(settings.upload_folder, "images", filename)
-        
-        # 确保目录存在
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
-        # 保存图片
-        try:
-            image.save(filepath)
-            logger.info(f"Image saved: {filepath}")
-        except Exception as e:
-            logger.error(f"Failed to save image: {e}")
-            # 尝试使用PIL保存
-            try:
-                from PIL import Image as PILImage
-                import io
-                if hasattr(image, 'image_bytes'):
-                    pil_image = PILImage.open(io.BytesIO(image.image_bytes))
-                    pil_image.save(filepath)
-                    logger.info(f"Image saved with PIL: {filepath}")
-                else:
-                    raise Exception("No image data available")
-            except Exception as e2:
-                logger.error(f"Failed to save image with PIL: {e2}")
-                raise e
-        
-        return f"/outputs/images/{filename}"
+        """保存生成的图片（types.Image）"""
+        image_bytes = getattr(image, "image_bytes", None)
+        if not image_bytes:
+            logger.error("Failed to save image: no image data available")
+            raise ValueError("No image data available")
+        return self._save_image_from_data(image_bytes, prefix)
     
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def _download_video(self, video, prefix: str) -> str:
-        """下载生成的视频 - 根据参考代码的实现"""
-        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-        def download_video_internal(client, video, path, prefix):
-            timestamp_format = "%Y%m%d_%H%M%S"
-            timestamp = datetime.now().strftime(timestamp_format)
-            filename = f"{prefix}_{timestamp}.mp4"
-            filepath = os.path.join(path, filename)
-            client.files.download(file=video)
-            video.save(filepath)
-            return filename
-        
-        # 确保目录存在
-        os.makedirs(settings.upload_folder + "/videos", exist_ok=True)
-        
+        """流式下载生成的视频：分块写入临时文件并计算sha256，完成后存入内容寻址存储，内存占用与视频大小无关"""
+        fd, temp_path = output_store.temp_file()
+        digest = hashlib.sha256()
         try:
-            filename = download_video_internal(self.client, video, settings.upload_folder + "/videos", prefix)
-            logger.info(f"Video saved: {filename}")
-            return f"/outputs/videos/{filename}"
+            with os.fdopen(fd, "wb") as f:
+                if video.video_bytes:
+                    # 部分响应直接内联了视频数据
+                    f.write(video.video_bytes)
+                    digest.update(video.video_bytes)
+                elif video.uri:
+                    http_client = client_registry.get_http_client()
+                    with http_client.stream("GET", video.uri, headers={"x-goog-api-key": self.api_key}) as response:
+                        response.raise_for_status()
+                        for chunk in response.iter_bytes(settings.video_download_chunk_size):
+                            f.write(chunk)
+                            digest.update(chunk)
+                else:
+                    raise ValueError("Video has neither uri nor inline data")
+                f.flush()
+                os.fsync(f.fileno())
+            
+            if os.path.getsize(temp_path) == 0:
+                raise ValueError("Downloaded video is empty")
+            url = output_store.put_file(temp_path, "videos", prefix, ".mp4", digest.hexdigest())
         except Exception as e:
             logger.error(f"Failed to save video: {e}")
-            raise e
+            cleanup_temp_file(temp_path)
+            raise
+        
+        logger.info(f"Video saved: {url}")
+        return url
     
     def _cache_video_object(self, filename: str, video_object, parent_filename: Optional[str] = None):
-        """缓存Video对象用于延长功能
+        """登记Video对象用于延长功能（持久化，跨进程共享）
         
         Args:
             filename: 视频文件名
             video_object: Video对象
             parent_filename: 父视频文件名（如果是延长的话）
         """
-        # 构建视频链
-        chain = []
-        if parent_filename and parent_filename in self._video_cache:
-            # 继承父视频的链
-            chain = self._video_cache[parent_filename]["chain"].copy()
-            chain.append(parent_filename)
-        
-        self._video_cache[filename] = {
-            "video_object": video_object,
-            "chain": chain,
-            "timestamp": time.time()
-        }
-        logger.info(f"Video cached: {filename}, chain length: {len(chain)}")
+        video_registry.register(filename, video_object, parent_filename, hash_api_key(self.api_key))
     
     def get_video_chain(self, filename: str) -> List[str]:
         """获取视频的延长历史链
@@ -511,12 +526,7 @@ class GeminiService:
         Returns:
             视频文件名列表，按时间顺序排列
         """
-        if filename not in self._video_cache:
-            return [filename]
-        
-        chain = self._video_cache[filename]["chain"].copy()
-        chain.append(filename)
-        return chain
+        return video_registry.get_chain(filename)
     
     def is_video_extendable(self, filename: str) -> bool:
         """检查视频是否可以延长
@@ -524,7 +534,7 @@ class GeminiService:
         Returns:
             True if video can be extended, False otherwise
         """
-        return filename in self._video_cache
+        return video_registry.is_extendable(filename)
     
     def edit_image(self, prompt: str, image_data: str) -> Dict[str, Any]:
         """编辑图片 - 使用 Gemini 2.5 Flash Image Preview 模型"""
@@ -538,17 +548,7 @@ class GeminiService:
             
             logger.info(f"Editing image with prompt: {prompt[:50]}...")
             
-            # 处理base64图片数据
-            if image_data.startswith('data:image/'):
-                image_data = image_data.split(',')[1]
-            
-            # 解码base64图片并转换为PIL Image
-            image_bytes = base64.b64decode(image_data)
-            base_image = Image.open(BytesIO(image_bytes))
-            
-            # 转换为RGB模式
-            if base_image.mode != 'RGB':
-                base_image = base_image.convert('RGB')
+            base_image = self._decode_edit_image(image_data)
             
             # 调用Gemini API进行图像编辑 - 根据官方文档的正确方式
             response = self.client.models.generate_content(
@@ -556,76 +556,7 @@ class GeminiService:
                 contents=[prompt, base_image],
             )
             
-            # 处理响应 - 参考代码的详细处理方式
-            logger.info(f"Response received: {type(response)}")
-            logger.info(f"Response candidates: {len(response.candidates) if response.candidates else 0}")
-            
-            if not response.candidates:
-                logger.error("No response candidates from API")
-                return {
-                    "success": False,
-                    "error": "No response candidates from API",
-                    "message": "图像编辑失败，未收到API响应"
-                }
-            
-            candidate = response.candidates[0]
-            logger.info(f"Candidate content parts: {len(candidate.content.parts) if candidate.content.parts else 0}")
-            
-            # 处理响应部分
-            for i, part in enumerate(candidate.content.parts):
-                logger.info(f"Part {i}: text={part.text is not None}, inline_data={part.inline_data is not None}")
-                
-                if part.text is not None:
-                    logger.info(f"AI Response: {part.text}")
-                    # 如果返回的是文本而不是图片，可能是因为提示词问题
-                    if "不能" in part.text or "无法" in part.text or "can't" in part.text.lower():
-                        return {
-                            "success": False,
-                            "error": "API returned text instead of image",
-                            "message": f"图像编辑失败：{part.text}"
-                        }
-                
-                # 检查是否有图片数据（即使也有文本）
-                if part.inline_data is not None and part.inline_data.data:
-                    logger.info(f"Found image data in part {i}, processing...")
-                    # 找到编辑后的图像数据
-                    edited_image_data = part.inline_data.data
-                    logger.info(f"Image data size: {len(edited_image_data)} bytes")
-                    
-                    if len(edited_image_data) > 0:
-                        edited_image_base64 = base64.b64encode(edited_image_data).decode('utf-8')
-                        edited_image_data_url = f'data:image/png;base64,{edited_image_base64}'
-                        
-                        # 保存编辑后的图像
-                        filename = self._save_edited_image(edited_image_base64, prompt)
-                        logger.info(f"Edited image saved to: {filename}")
-                        
-                        return {
-                            "success": True,
-                            "file": filename,
-                            "image_data_url": edited_image_data_url,
-                            "message": "图像编辑成功"
-                        }
-                    else:
-                        logger.warning(f"Part {i} has inline_data but data is empty")
-            
-            # 如果没有找到图像数据，返回详细的错误信息
-            error_msg = "No image data found in API response"
-            if response.candidates and response.candidates[0].content.parts:
-                parts_info = []
-                for part in response.candidates[0].content.parts:
-                    if part.text:
-                        parts_info.append(f"text: {part.text[:100]}...")
-                    else:
-                        parts_info.append("non-text part")
-                error_msg += f". Response contains: {', '.join(parts_info)}"
-            
-            logger.error(error_msg)
-            return {
-                "success": False,
-                "error": "No image data found in API response",
-                "message": f"图像编辑失败：{error_msg}"
-            }
+            return self._build_edit_image_result(response, prompt)
             
         except Exception as e:
             logger.error(f"Image editing failed: {e}")
@@ -635,6 +566,94 @@ class GeminiService:
                 "message": "图像编辑失败"
             }
     
+    def _decode_edit_image(self, image_data: str):
+        """解码待编辑的base64图片为PIL Image"""
+        # 处理base64图片数据
+        if image_data.startswith('data:image/'):
+            image_data = image_data.split(',')[1]
+        
+        # 解码base64图片并转换为PIL Image
+        image_bytes = base64.b64decode(image_data)
+        base_image = Image.open(BytesIO(image_bytes))
+        
+        # 转换为RGB模式
+        if base_image.mode != 'RGB':
+            base_image = base_image.convert('RGB')
+        return base_image
+    
+    def _build_edit_image_result(self, response, prompt: str) -> Dict[str, Any]:
+        """处理图像编辑响应并保存图片"""
+        # 处理响应 - 参考代码的详细处理方式
+        logger.info(f"Response received: {type(response)}")
+        logger.info(f"Response candidates: {len(response.candidates) if response.candidates else 0}")
+        
+        if not response.candidates:
+            logger.error("No response candidates from API")
+            return {
+                "success": False,
+                "error": "No response candidates from API",
+                "message": "图像编辑失败，未收到API响应"
+            }
+        
+        candidate = response.candidates[0]
+        logger.info(f"Candidate content parts: {len(candidate.content.parts) if candidate.content.parts else 0}")
+        
+        # 处理响应部分
+        for i, part in enumerate(candidate.content.parts):
+            logger.info(f"Part {i}: text={part.text is not None}, inline_data={part.inline_data is not None}")
+            
+            if part.text is not None:
+                logger.info(f"AI Response: {part.text}")
+                # 如果返回的是文本而不是图片，可能是因为提示词问题
+                if "不能" in part.text or "无法" in part.text or "can't" in part.text.lower():
+                    return {
+                        "success": False,
+                        "error": "API returned text instead of image",
+                        "message": f"图像编辑失败：{part.text}"
+                    }
+            
+            # 检查是否有图片数据（即使也有文本）
+            if part.inline_data is not None and part.inline_data.data:
+                logger.info(f"Found image data in part {i}, processing...")
+                # 找到编辑后的图像数据
+                edited_image_data = part.inline_data.data
+                logger.info(f"Image data size: {len(edited_image_data)} bytes")
+                
+                if len(edited_image_data) > 0:
+                    edited_image_base64 = base64.b64encode(edited_image_data).decode('utf-8')
+                    edited_image_data_url = f'data:image/png;base64,{edited_image_base64}'
+                    
+                    # 保存编辑后的图像
+                    filename = self._save_edited_image(edited_image_base64, prompt)
+                    logger.info(f"Edited image saved to: {filename}")
+                    
+                    return {
+                        "success": True,
+                        "file": filename,
+                        "image_data_url": edited_image_data_url,
+                        "message": "图像编辑成功"
+                    }
+                else:
+                    logger.warning(f"Part {i} has inline_data but data is empty")
+        
+        # 如果没有找到图像数据，返回详细的错误信息
+        error_msg = "No image data found in API response"
+        if response.candidates and response.candidates[0].content.parts:
+            parts_info = []
+            for part in response.candidates[0].content.parts:
+                if part.text:
+                    parts_info.append(f"text: {part.text[:100]}...")
+                else:
+                    parts_info.append("non-text part")
+            error_msg += f". Response contains: {', '.join(parts_info)}"
+        
+        logger.error(error_msg)
+        return {
+            "success": False,
+            "error": "No image data found in API response",
+            "message": f"图像编辑失败：{error_msg}"
+        }
+    
     def concatenate_images(self, image_data_list: List[str]) -> Dict[str, Any]:
         """横向拼接多张图片"""
         try:
@@ -728,13 +747,6 @@ class GeminiService:
     
     def _save_edited_image(self, image_base64: str, prompt: str) -> str:
         """保存编辑后的图片"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"edited_image_{timestamp}.png"
-        filepath = os.path.join(settings.upload_folder, "images", filename)
-        
-        # 确保目录存在
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
         # 检查图片数据
         if not image_base64:
             logger.error("Image base64 data is empty")
@@ -745,16 +757,9 @@ class GeminiService:
             image_bytes = base64.b64decode(image_base64)
             logger.info(f"Saving edited image, size: {len(image_bytes)} bytes")
             
-            with open(filepath, 'wb') as f:
-                f.write(image_bytes)
-            
-            # 验证文件是否成功保存
-            if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                logger.info(f"Edited image saved successfully: {filepath}")
-                return f"/outputs/images/{filename}"
-            else:
-                logger.error(f"Failed to save edited image: {filepath}")
-                raise Exception("Failed to save edited image")
+            url = output_store.put_bytes(image_bytes, "images", "edited_image", ".png")
+            logger.info(f"Edited image saved successfully: {url}")
+            return url
                 
         except Exception as e:
             logger.error(f"Error saving edited image: {e}")
@@ -762,22 +767,17 @@ class GeminiService:
     
     def _save_concatenated_image(self, image_base64: str, image_count: int) -> str:
         """保存拼接后的图片"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"concatenated_{image_count}images_{timestamp}.png"
-        filepath = os.path.join(settings.upload_folder, "images", filename)
-        
         # 解码并保存图片
         image_bytes = base64.b64decode(image_base64)
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
+        url = output_store.put_bytes(image_bytes, "images", f"concatenated_{image_count}images", ".png")
         
-        logger.info(f"Concatenated image saved: {filepath}")
-        return f"/outputs/images/{filename}"
+        logger.info(f"Concatenated image saved: {url}")
+        return url
 
     def extend_video(self, filename: str, prompt: str = "", resolution: str = "720p") -> Dict[str, Any]:
         """延长视频 - 使用 Veo 3.1 模型
         
-        注意：只能延长当前会话中刚刚生成的视频
+        注意：只能延长登记表中仍在有效期内的视频
         
         Args:
             filename: 视频文件名（不含路径，如"/outputs/videos/xxx.mp4"）
@@ -795,90 +795,203 @@ class GeminiService:
                     "message": "Please configure API key first"
                 }
             
-            logger.info(f"Extending video: {filename}")
-            
-            # 验证分辨率参数
-            if resolution not in self.SUPPORTED_RESOLUTIONS:
-                raise ValueError(f"Unsupported resolution: {resolution}. Supported: {self.SUPPORTED_RESOLUTIONS}")
-            
-            # 检查视频是否在缓存中
+            # 检查视频是否在登记表中
             if not self.is_video_extendable(filename):
                 return {
                     "success": False,
                     "error": "Video not extendable",
-                    "message": "此视频无法延长。只能延长当前会话中刚刚生成的视频。请先生成一个新视频，然后立即延长。"
+                    "message": "此视频无法延长。只能延长最近生成且仍在有效期内的视频。"
+                }
+            
+            operation = self.start_video_extension(filename, prompt, resolution)
+            
+            # 等待视频延长完成
+            operation = self._wait_for_operation(operation)
+            
+            return self.finish_video_operation(operation, "extended_video", parent_filename=filename)
+            
+        except Exception as e:
+            logger.error(f"Video extension failed: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Video extension failed: {str(e)}"
+            }
+    
+    def start_video_extension(self, filename: str, prompt: str = "", resolution: str = "720p"):
+        """提交视频延长任务，立即返回Operation对象（不等待完成）"""
+        if not self._ensure_client():
+            raise RuntimeError("Gemini client not initialized")
+        
+        logger.info(f"Extending video: {filename}")
+        
+        # 验证分辨率参数
+        if resolution not in self.SUPPORTED_RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution: {resolution}. Supported: {self.SUPPORTED_RESOLUTIONS}")
+        
+        # 从登记表获取Video对象
+        video_object = video_registry.get_video(filename)
+        if video_object is None:
+            raise ValueError("此视频无法延长。只能延长最近生成且仍在有效期内的视频。")
+        logger.info(f"从登记表获取Video对象: {filename}")
+        
+        # 如果没有提供提示词，使用默认的延长提示词
+        if not prompt.strip():
+            prompt = "Extend this video naturally, continuing the action and maintaining the same style and quality."
+        
+        # 调用Veo 3.1 API进行视频延长
+        config_params = {
+            "number_of_videos": 1,
+            "resolution": resolution
+        }
+        
+        config = types.GenerateVideosConfig(**config_params)
+        
+        # 详细日志记录
+        logger.info(f"=== 视频延长API调用详情 ===")
+        logger.info(f"模型: {self.MODELS['VIDEO_EXTENSION']}")
+        logger.info(f"提示词: {prompt[:100]}...")
+        logger.info(f"原视频: {filename}")
+        logger.info(f"配置参数: {config_params}")
+        
+        # 调用API
+        operation = self.client.models.generate_videos(
+            model=self.MODELS["VIDEO_EXTENSION"],
+            video=video_object,
+            prompt=prompt,
+            config=config
+        )
+        
+        logger.info(f"API调用成功，等待视频延长完成...")
+        return operation
+
+
+class AsyncGeminiService(GeminiService):
+    """Gemini API异步服务类 - 基于 client.aio，上游调用不阻塞事件循环"""
+    
+    async def generate_image(self, prompt: str, aspect_ratio: str = "1:1") -> Dict[str, Any]:
+        """生成图片 - 使用 Gemini 2.5 Flash Image Preview 模型"""
+        # 本地等待配额，避免发出必然被拒绝的请求
+        await rate_limiter.acquire(self.api_key, "IMAGE_GENERATION")
+        # 模型熔断中直接失败，半开时只放行探测请求
+        circuit_breakers.before_call("IMAGE_GENERATION")
+        try:
+            if not self._ensure_client():
+                return {
+                    "success": False,
+                    "error": "Gemini client not initialized",
+                    "message": "Please configure API key first"
                 }
             
-            # 从缓存获取Video对象
-            video_object = self._video_cache[filename]["video_object"]
-            logger.info(f"从缓存获取Video对象: {filename}")
+            logger.info(f"Generating image with prompt: {prompt[:50]}...")
+            
+            # 可选的对冲请求：慢请求超过近期延迟分位数时补发一次，先返回者胜出
+            response = await image_hedger.call(
+                lambda: self.client.aio.models.generate_content(
+                    model=self.MODELS["IMAGE_GENERATION"],
+                    contents=[prompt],
+                ),
+                can_hedge=self._can_hedge,
+                on_hedge_done=self._on_hedge_done
+            )
+            self.report_upstream_success("IMAGE_GENERATION")
             
-            # 如果没有提供提示词，使用默认的延长提示词
-            if not prompt.strip():
-                prompt = "Extend this video naturally, continuing the action and maintaining the same style and quality."
+            # 保存图片涉及磁盘写入，放到线程池
+            return await asyncio.to_thread(self._build_generate_image_result, response)
             
-            # 调用Veo 3.1 API进行视频延长
-            config_params = {
-                "number_of_videos": 1,
-                "resolution": resolution
+        except Exception as e:
+            self.report_upstream_error("IMAGE_GENERATION", e)
+            error_msg = str(e)
+            logger.error(f"Image generation failed: {error_msg}")
+            logger.error(f"Client status: {'Initialized' if self.client else 'Not initialized'}")
+            return {
+                "success": False,
+                "error": error_msg,
+                "message": f"Image generation failed: {error_msg}"
             }
+    
+    async def _can_hedge(self) -> bool:
+        """对冲请求只在熔断器正常、有空闲并发名额且有空闲配额时发出，名额在对冲请求结束后释放"""
+        # admission 依赖本模块，延迟导入
+        from app.services.admission import admission_controller
+
+        if not circuit_breakers.is_closed("IMAGE_GENERATION"):
+            return False
+        if not await admission_controller.try_acquire("IMAGE_GENERATION"):
+            return False
+        if not await rate_limiter.try_acquire(self.api_key, "IMAGE_GENERATION"):
+            admission_controller.release("IMAGE_GENERATION")
+            return False
+        return True
+
+    def _on_hedge_done(self):
+        """对冲请求结束，释放并发名额"""
+        from app.services.admission import admission_controller
+
+        admission_controller.release("IMAGE_GENERATION")
+    
+    async def edit_image(self, prompt: str, image_data: str) -> Dict[str, Any]:
+        """编辑图片 - 使用 Gemini 2.5 Flash Image Preview 模型"""
+        await rate_limiter.acquire(self.api_key, "IMAGE_GENERATION")
+        circuit_breakers.before_call("IMAGE_GENERATION")
+        try:
+            if not self._ensure_client():
+                return {
+                    "success": False,
+                    "error": "Gemini client not initialized",
+                    "message": "Please configure API key first"
+                }
             
-            config = types.GenerateVideosConfig(**config_params)
+            logger.info(f"Editing image with prompt: {prompt[:50]}...")
             
-            # 详细日志记录
-            logger.info(f"=== 视频延长API调用详情 ===")
-            logger.info(f"模型: {self.MODELS['VIDEO_EXTENSION']}")
-            logger.info(f"提示词: {prompt[:100]}...")
-            logger.info(f"原视频: {filename}")
-            logger.info(f"配置参数: {config_params}")
+            base_image = await asyncio.to_thread(self._decode_edit_image, image_data)
             
-            # 调用API
-            operation = self.client.models.generate_videos(
-                model=self.MODELS["VIDEO_EXTENSION"],
-                video=video_object,
-                prompt=prompt,
-                config=config
+            response = await self.client.aio.models.generate_content(
+                model=self.MODELS["IMAGE_GENERATION"],
+                contents=[prompt, base_image],
             )
+            self.report_upstream_success("IMAGE_GENERATION")
             
-            logger.info(f"API调用成功，等待视频延长完成...")
+            return await asyncio.to_thread(self._build_edit_image_result, response, prompt)
             
-            # 等待视频延长完成
-            while not operation.done:
-                logger.info("Waiting for video extension to complete...")
-                time.sleep(10)
-                operation = self.client.operations.get(operation)
-            
-            # 下载延长后的视频
-            if not operation.response.generated_videos:
-                raise Exception("无法延长视频")
-            
-            # 处理延长后的视频
-            for n, extended_video in enumerate(operation.response.generated_videos):
-                try:
-                    new_filename = self._download_video(extended_video.video, "extended_video")
-                    logger.info(f"成功下载延长视频 {n}: {new_filename}")
-                    
-                    # 缓存延长后的Video对象，并记录父视频
-                    self._cache_video_object(new_filename, extended_video.video, filename)
-                    
-                    # 获取完整的视频链
-                    video_chain = self.get_video_chain(new_filename)
-                    logger.info(f"视频链: {video_chain}")
-                    
-                    return {
-                        "success": True,
-                        "file": new_filename,
-                        "chain": video_chain,
-                        "message": "Video extended successfully"
-                    }
-                except Exception as e:
-                    logger.error(f"下载延长视频 {n} 失败: {str(e)}")
-                    raise e
+        except Exception as e:
+            self.report_upstream_error("IMAGE_GENERATION", e)
+            logger.error(f"Image editing failed: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "message": "图像编辑失败"
+            }
+    
+    async def analyze_image(self, image_path: str, analysis_prompt: str = "Describe this image in detail") -> Dict[str, Any]:
+        """分析图片"""
+        await rate_limiter.acquire(self.api_key, "IMAGE_ANALYSIS")
+        circuit_breakers.before_call("IMAGE_ANALYSIS")
+        try:
+            if not self._ensure_client():
+                return {
+                    "success": False,
+                    "error": "Gemini client not initialized",
+                    "message": "Please configure API key first"
+                }
+            
+            logger.info(f"Analyzing image: {image_path}")
+            
+            image = await asyncio.to_thread(self._load_image, image_path)
+            
+            response = await self.client.aio.models.generate_content(
+                model=self.MODELS["IMAGE_ANALYSIS"],
+                contents=[image, analysis_prompt]
+            )
+            self.report_upstream_success("IMAGE_ANALYSIS")
+            
+            return self._build_analysis_result(response)
             
         except Exception as e:
-            logger.error(f"Video extension failed: {e}")
+            self.report_upstream_error("IMAGE_ANALYSIS", e)
+            logger.error(f"Image analysis failed: {e}")
             return {
                 "success": False,
                 "error": str(e),
-                "message": f"Video extension failed: {str(e)}"
+                "message": "Image analysis failed"
             }
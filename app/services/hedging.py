@@ -0,0 +1,136 @@
+import asyncio
+import inspect
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Awaitable, Deque, Union
+
+from app.config import settings
+from app.utils.logger import logger
+
+
+class HedgedCaller:
+    """对冲请求：请求超过近期延迟的指定分位数仍未返回时，再发一次相同请求，先返回者胜出
+
+    对冲次数受预算限制：每个请求积累 max_fraction 个令牌，每次对冲消耗一个，
+    长期对冲比例不超过 max_fraction。
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 95.0, max_fraction: float = 0.05,
+                 min_samples: int = 20, window: int = 500, max_budget: float = 10.0):
+        """初始化
+
+        Args:
+            percentile: 触发对冲的延迟分位数
+            max_fraction: 对冲请求占总请求的最大比例
+            min_samples: 延迟样本少于此值时不对冲
+            window: 保留的最近延迟样本数
+            max_budget: 预算令牌上限，限制空闲后的突发对冲
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.max_budget = max_budget
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._budget = 0.0
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """当前触发对冲的等待时间，样本不足时返回None"""
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+    async def call(self, fn: Callable[[], Awaitable[Any]],
+                   can_hedge: Optional[Callable[[], Union[bool, Awaitable[bool]]]] = None,
+                   on_hedge_done: Optional[Callable[[], None]] = None) -> Any:
+        """执行 fn，必要时发出对冲请求
+
+        Args:
+            fn: 发起一次上游调用的函数，每次调用产生一个新的请求
+            can_hedge: 发出对冲前的额外检查（如配额、熔断、并发名额），可以是协程函数，返回False则不对冲
+            on_hedge_done: 对冲请求结束（完成、失败或被取消）后调用，用于释放 can_hedge 占用的资源
+        """
+        self.requests += 1
+        self._budget = min(self.max_budget, self._budget + self.max_fraction)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        delay = self.hedge_delay() if self.enabled else None
+        tasks = {primary: started}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self._budget >= 1 and await self._allowed(can_hedge):
+                    self._budget -= 1
+                    self.hedged += 1
+                    logger.info(f"Hedging request after {delay:.1f}s")
+                    hedge = asyncio.ensure_future(fn())
+                    if on_hedge_done is not None:
+                        hedge.add_done_callback(lambda _: on_hedge_done())
+                    tasks[hedge] = time.monotonic()
+
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # 优先取成功的结果；都失败时抛出最后一个错误
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None or not pending:
+                    winner = winner or done.pop()
+                    break
+
+            if winner.exception() is None:
+                if winner is primary or primary.done():
+                    self._latencies.append(time.monotonic() - tasks[winner])
+                else:
+                    # 对冲胜出时主请求仍未返回，记录主请求已用的时间（其实际延迟的下限），避免分位数逐渐偏低
+                    self._latencies.append(time.monotonic() - started)
+            if winner is not primary:
+                self.hedge_wins += 1
+            return winner.result()
+        finally:
+            # 取消仍在进行的请求，丢弃其结果
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                task.add_done_callback(self._discard)
+
+    @staticmethod
+    def _discard(task: asyncio.Future):
+        """取出被丢弃请求的异常，避免 asyncio 记录 Task exception was never retrieved"""
+        if not task.cancelled():
+            task.exception()
+
+    async def _allowed(self, can_hedge: Optional[Callable[[], Union[bool, Awaitable[bool]]]]) -> bool:
+        """执行对冲前的额外检查"""
+        if can_hedge is None:
+            return True
+        allowed = can_hedge()
+        if inspect.isawaitable(allowed):
+            allowed = await allowed
+        return bool(allowed)
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取对冲状态"""
+        delay = self.hedge_delay()
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": round(delay, 2) if delay is not None else None,
+            "budget": round(self._budget, 2)
+        }
+
+
+# 全局文生图对冲实例
+image_hedger = HedgedCaller(
+    enabled=settings.image_hedge_enabled,
+    percentile=settings.image_hedge_percentile,
+    max_fraction=settings.image_hedge_max_fraction,
+    min_samples=settings.image_hedge_min_samples
+)
@@ -0,0 +1,430 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, AsyncIterator
+
+from google.genai import types
+
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.helpers import cleanup_temp_file
+from app.services.gemini_service import GeminiService
+from app.services.operation_poller import operation_poller, is_transient_error
+from app.services.admission import admission_controller
+from app.services.rate_limiter import rate_limiter
+from app.services.circuit_breaker import circuit_breakers
+from app.services.key_pool import key_pool
+from app.services.video_registry import video_registry
+from app.services.operation_store import operation_store
+from app.services.output_catalog import output_catalog
+from app.services.client_registry import hash_api_key
+
+
+class JobStatus:
+    """任务状态常量"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DOWNLOADING = "downloading"
+    DONE = "done"
+    FAILED = "failed"
+
+    FINISHED = (DONE, FAILED)
+
+
+class JobService:
+    """视频任务服务类 - 后台worker负责Operation的提交、轮询和下载
+
+    任务状态每次变化都写入共享数据库，其他worker进程收到的查询和订阅从数据库读取。
+    """
+
+    # 订阅其他进程的任务时读取共享状态的间隔（秒）
+    REMOTE_WATCH_INTERVAL = 2.0
+    # 轮询或下载暂时失败后，多久之后重新认领该Operation（秒）
+    RETRY_DELAY = 60.0
+
+    # 任务类型 -> (GeminiService提交方法, 文件名前缀, 模型)
+    JOB_KINDS = {
+        "text_to_video": ("start_video_from_text", "text_to_video", "VIDEO_GENERATION"),
+        "image_to_video": ("start_video_from_image", "image_to_video", "VIDEO_GENERATION"),
+        "extend_video": ("start_video_extension", "extended_video", "VIDEO_EXTENSION"),
+    }
+
+    def __init__(self, max_workers: int = 32, history_limit: int = 1000, download_concurrency: int = 4,
+                 lease_seconds: float = 120.0):
+        """初始化任务服务"""
+        self.max_workers = max_workers
+        self.download_concurrency = download_concurrency
+        self.history_limit = history_limit
+        self.lease_seconds = lease_seconds
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 去重键 -> 进行中的任务ID
+        self._inflight: Dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # 下载阶段并发名额，与生成阶段的worker数分开控制
+        self._download_slots: Optional[asyncio.Semaphore] = None
+        # 本进程的租约持有者ID，在start中生成，fork出的各worker进程互不相同
+        self._owner: Optional[str] = None
+        self._lease_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """启动后台worker"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._download_slots = asyncio.Semaphore(self.download_concurrency)
+        self._owner = uuid.uuid4().hex
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.max_workers)
+        ]
+        self._resume_pending(
+            await asyncio.to_thread(operation_store.claim_pending, self._owner, self.lease_seconds)
+        )
+        self._lease_task = asyncio.create_task(self._lease_loop())
+        logger.info(f"Job service started with {self.max_workers} workers")
+
+    async def stop(self):
+        """停止后台worker，释放租约以便其他worker立即接管未完成的Operation"""
+        tasks = self._workers + ([self._lease_task] if self._lease_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._lease_task = None
+        self._settle_local_jobs()
+        if self._owner:
+            await asyncio.to_thread(operation_store.release, self._owner)
+        logger.info("Job service stopped")
+
+    def _settle_local_jobs(self):
+        """进程退出前写入本进程未结束任务的最终状态：有已提交Operation的交给其他worker恢复，其余标记为取消"""
+        for job in self._jobs.values():
+            if job["status"] in JobStatus.FINISHED:
+                continue
+            if not job["_operation_name"]:
+                self._update(job, JobStatus.FAILED, "Job cancelled")
+            # 事件循环即将退出，同步写入，不依赖线程池中尚未执行的写入
+            operation_store.save_job(self._public_view(job), self._owner, time.time())
+
+    def submit(self, kind: str, api_key: Optional[str], params: Dict[str, Any],
+               cleanup_files: Optional[List[str]] = None,
+               dedupe_key: Optional[str] = None) -> Dict[str, Any]:
+        """提交任务，立即返回任务信息
+
+        Args:
+            kind: 任务类型，见 JOB_KINDS
+            api_key: 用户提供的API Key，为空时执行时从服务端Key池分配
+            params: 传给提交方法的参数
+            cleanup_files: Operation提交后需要删除的临时文件
+            dedupe_key: 去重键，相同键的任务未结束时直接返回该任务
+        """
+        if kind not in self.JOB_KINDS:
+            raise ValueError(f"Unsupported job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job service not started")
+
+        if dedupe_key and dedupe_key in self._inflight:
+            existing = self._jobs.get(self._inflight[dedupe_key])
+            if existing is not None and existing["status"] not in JobStatus.FINISHED:
+                logger.info(f"Duplicate job attached to {existing['job_id']}")
+                return self._public_view(existing)
+
+        # 预约模型排队位置，队列已满时抛出429
+        admission_controller.reserve(self.JOB_KINDS[kind][2])
+
+        job = self._create_job(uuid.uuid4().hex, kind, api_key, params, cleanup_files, dedupe_key)
+        logger.info(f"Job submitted: {job['job_id']} ({kind})")
+        return self._public_view(job)
+
+    def _create_job(self, job_id: str, kind: str, api_key: Optional[str], params: Dict[str, Any],
+                    cleanup_files: Optional[List[str]] = None, dedupe_key: Optional[str] = None,
+                    created_at: Optional[float] = None) -> Dict[str, Any]:
+        """创建任务记录并放入队列"""
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": JobStatus.QUEUED,
+            "message": "Job queued",
+            "file": None,
+            "chain": None,
+            "error": None,
+            "polls": 0,
+            "created_at": created_at or time.time(),
+            "started_at": None,
+            "finished_at": None,
+            # 内部字段，不对外暴露
+            "_api_key": api_key,
+            "_params": params,
+            "_cleanup_files": cleanup_files or [],
+            "_dedupe_key": dedupe_key,
+            # 重启后恢复的任务：已提交的Operation名称和所用Key的哈希
+            "_operation_name": None,
+            "_key_hash": None,
+            "_submitted_at": None,
+            # 状态变化通知，每次变化后替换为新的Event
+            "_changed": asyncio.Event(),
+        }
+        self._jobs[job_id] = job
+        self._persist(job)
+        if dedupe_key:
+            self._inflight[dedupe_key] = job_id
+        self._prune_history()
+        self._queue.put_nowait(job_id)
+        return job
+
+    async def _lease_loop(self):
+        """定期续期本进程持有的租约，并接管租约已过期的Operation"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(operation_store.renew, self._owner, self.lease_seconds)
+                records = await asyncio.to_thread(operation_store.claim_pending, self._owner, self.lease_seconds)
+                self._resume_pending(records)
+            except Exception as e:
+                logger.error(f"Operation lease renewal failed: {e}")
+
+    def _resume_pending(self, records: List[Dict[str, Any]]):
+        """恢复本进程认领的已提交但未完成的Operation，继续轮询并下载"""
+        for record in records:
+            if record["job_id"] in self._jobs:
+                continue
+            # 恢复的任务上游已在执行，不受排队上限限制
+            admission_controller.reserve(self.JOB_KINDS[record["kind"]][2], force=True)
+            job = self._create_job(
+                record["job_id"], record["kind"], None, record["params"],
+                dedupe_key=record["dedupe_key"], created_at=record["created_at"]
+            )
+            job["_operation_name"] = record["operation_name"]
+            job["_key_hash"] = record["key_hash"]
+            job["_submitted_at"] = record["submitted_at"]
+            job["message"] = "Job resumed after restart"
+            self._persist(job)
+            logger.info(f"Job resumed: {record['job_id']} ({record['operation_name']})")
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态，不在本进程的任务从共享状态读取"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return await asyncio.to_thread(operation_store.get_job, job_id, self.lease_seconds)
+        return self._public_view(job)
+
+    async def watch(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[Dict[str, Any]]:
+        """订阅任务进度：状态或轮询次数变化时产出快照，空闲时按心跳间隔产出，任务结束后停止"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            async for view in self._watch_remote(job_id, heartbeat):
+                yield view
+            return
+        while True:
+            if self._jobs.get(job_id) is not job:
+                # 任务已交还给租约循环重新认领，之后的进度从共享状态读取
+                async for view in self._watch_remote(job_id, heartbeat):
+                    yield view
+                return
+            # 先取Event再产出快照，避免漏掉两者之间发生的变化
+            changed = job["_changed"]
+            yield self._public_view(job)
+            if job["status"] in JobStatus.FINISHED:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _watch_remote(self, job_id: str, heartbeat: float) -> AsyncIterator[Dict[str, Any]]:
+        """订阅其他进程负责的任务：定期读取共享状态，有变化或到心跳间隔时产出"""
+        last_key = None
+        last_sent = 0.0
+        while True:
+            view = await asyncio.to_thread(operation_store.get_job, job_id, self.lease_seconds)
+            if view is None:
+                return
+            key = (view["status"], view["message"], view["polls"])
+            if key != last_key or time.monotonic() - last_sent >= heartbeat:
+                yield view
+                last_key = key
+                last_sent = time.monotonic()
+            if view["status"] in JobStatus.FINISHED:
+                return
+            await asyncio.sleep(self.REMOTE_WATCH_INTERVAL)
+
+    def _public_view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """去掉内部字段，附加已耗时"""
+        view = {k: v for k, v in job.items() if not k.startswith("_")}
+        view["elapsed"] = round((job["finished_at"] or time.time()) - job["created_at"], 1)
+        return view
+
+    def _notify(self, job: Dict[str, Any]):
+        """通知订阅者任务有变化"""
+        changed = job["_changed"]
+        job["_changed"] = asyncio.Event()
+        changed.set()
+        self._persist(job)
+
+    def _persist(self, job: Dict[str, Any]):
+        """在线程池中把任务状态写入共享数据库，供其他worker查询"""
+        view = self._public_view(job)
+        asyncio.get_running_loop().run_in_executor(
+            None, operation_store.save_job, view, self._owner, time.time()
+        )
+
+    def _on_poll(self, job: Dict[str, Any], polls: int):
+        """记录轮询次数"""
+        job["polls"] = polls
+        self._notify(job)
+
+    def _prune_history(self):
+        """只保留最近的已结束任务"""
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job["status"] in JobStatus.FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history_limit)]:
+            del self._jobs[job_id]
+
+    def _update(self, job: Dict[str, Any], status: str, message: str):
+        """更新任务状态"""
+        job["status"] = status
+        job["message"] = message
+        if status in JobStatus.FINISHED:
+            job["finished_at"] = time.time()
+        logger.info(f"Job {job['job_id']} -> {status}")
+        self._notify(job)
+
+    async def _worker(self, index: int):
+        """后台worker主循环"""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {index} crashed on {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        """执行单个任务：分配API Key后依次 提交 -> 轮询 -> 下载"""
+        model_key = self.JOB_KINDS[job["kind"]][2]
+        params = job["_params"]
+        # 恢复的任务和延长视频必须使用原来的Key，否则访问不到Operation或原视频
+        key_hash = job["_key_hash"]
+        if key_hash is None and job["kind"] == "extend_video":
+            key_hash = await asyncio.to_thread(video_registry.get_key_hash, params["filename"])
+        try:
+            # 提交、轮询和下载使用同一个Key，任务结束前一直计入该Key的负载
+            with key_pool.lease(model_key, job["_api_key"], key_hash) as api_key:
+                await self._execute(job, GeminiService(api_key))
+        finally:
+            # 释放对API Key的引用
+            job["_api_key"] = None
+
+    async def _execute(self, job: Dict[str, Any], service: GeminiService):
+        """执行任务各阶段"""
+        method_name, prefix, model_key = self.JOB_KINDS[job["kind"]]
+        params = job["_params"]
+        job["started_at"] = time.time()
+
+        try:
+            # 占用模型并发名额直到Operation完成，排队期间保持queued状态
+            async with admission_controller.hold(model_key):
+                if job["_operation_name"]:
+                    operation = self._restore_operation(job, service)
+                    elapsed = time.time() - job["_submitted_at"]
+                else:
+                    # 后台任务没有请求超时，本地一直等到有配额
+                    await rate_limiter.acquire(service.api_key, model_key, max_wait=None)
+                    circuit_breakers.before_call(model_key)
+                    self._update(job, JobStatus.RUNNING, "Waiting for video generation to complete")
+                    # 阻塞的SDK调用放到线程池，避免卡住事件循环
+                    operation = await asyncio.to_thread(getattr(service, method_name), **params)
+                    service.report_upstream_success(model_key)
+                    await asyncio.to_thread(self._cleanup, job)
+                    # 立即持久化Operation，进程重启后可继续轮询和下载；SQLite写入放到线程池
+                    await asyncio.to_thread(
+                        operation_store.save, job["job_id"], job["kind"], operation.name, hash_api_key(service.api_key),
+                        params, job["_dedupe_key"], job["created_at"], self._owner, self.lease_seconds
+                    )
+                    job["_operation_name"] = operation.name
+                    job["_submitted_at"] = time.time()
+                    elapsed = 0.0
+
+                # 交给共享轮询器，按历史耗时自适应轮询
+                poll_key = (
+                    GeminiService.MODELS[model_key],
+                    params.get("resolution", "720p"),
+                    params.get("duration_seconds", "-")
+                )
+                operation = await operation_poller.wait(
+                    service, operation, poll_key, on_poll=lambda polls: self._on_poll(job, polls),
+                    elapsed=elapsed
+                )
+
+            parent_filename = params.get("filename") if job["kind"] == "extend_video" else None
+            # 多个已完成视频并行下载，数量受下载名额限制
+            async with self._download_slots:
+                self._update(job, JobStatus.DOWNLOADING, "Downloading generated video")
+                result = await asyncio.to_thread(
+                    service.finish_video_operation, operation, prefix, parent_filename
+                )
+
+            job["file"] = result["file"]
+            job["chain"] = result.get("chain")
+            await asyncio.to_thread(operation_store.delete, job["job_id"])
+            self._update(job, JobStatus.DONE, result["message"])
+
+        except asyncio.CancelledError:
+            # 进程退出时被取消，保留Operation记录，由其他worker或下次启动时恢复
+            if job["_operation_name"]:
+                self._update(job, JobStatus.QUEUED, "Worker stopped, job will resume on another worker")
+            else:
+                self._update(job, JobStatus.FAILED, "Job cancelled")
+            raise
+        except Exception as e:
+            service.report_upstream_error(model_key, e)
+            if self._can_retry(job, e):
+                # 已提交（已计费）的Operation保留记录，交给租约循环稍后重新轮询和下载
+                logger.warning(f"Job {job['job_id']} hit a transient error, will retry: {e}")
+                await asyncio.to_thread(operation_store.retry_later, job["job_id"], self._owner, self.RETRY_DELAY)
+                self._update(job, JobStatus.QUEUED, f"Temporary upstream error, will retry: {str(e)}")
+                self._jobs.pop(job["job_id"], None)
+            else:
+                logger.error(f"Job {job['job_id']} failed: {e}")
+                await asyncio.to_thread(operation_store.delete, job["job_id"])
+                job["error"] = str(e)
+                self._update(job, JobStatus.FAILED, f"Video job failed: {str(e)}")
+        finally:
+            await asyncio.to_thread(self._cleanup, job)
+            if job["_dedupe_key"]:
+                self._inflight.pop(job["_dedupe_key"], None)
+
+    def _can_retry(self, job: Dict[str, Any], error: Exception) -> bool:
+        """已提交的Operation遇到可恢复的错误、且生成结果仍在上游保留期内时可以重试"""
+        if not job["_operation_name"] or not is_transient_error(error):
+            return False
+        return time.time() - job["_submitted_at"] < settings.video_registry_ttl_hours * 3600
+
+    def _restore_operation(self, job: Dict[str, Any], service: GeminiService):
+        """根据持久化的名称重建Operation"""
+        if not service.api_key or hash_api_key(service.api_key) != job["_key_hash"]:
+            raise RuntimeError("The API key used for this operation is not configured on the server, cannot resume")
+        self._update(job, JobStatus.RUNNING, "Resumed after restart, waiting for video generation to complete")
+        return types.GenerateVideosOperation(name=job["_operation_name"])
+
+    def _cleanup(self, job: Dict[str, Any]):
+        """删除任务的临时文件"""
+        for path in job["_cleanup_files"]:
+            cleanup_temp_file(path)
+            output_catalog.remove(path)
+        job["_cleanup_files"] = []
+
+
+# 全局任务服务实例
+job_service = JobService(
+    max_workers=settings.video_job_workers,
+    history_limit=settings.job_history_limit,
+    download_concurrency=settings.video_download_concurrency,
+    lease_seconds=settings.operation_lease_seconds
+)
@@ -0,0 +1,111 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+from app.config import settings, get_server_api_keys
+from app.utils.logger import logger
+from app.services.client_registry import hash_api_key
+from app.services.rate_limiter import rate_limiter, is_quota_error, parse_retry_delay
+
+
+class ApiKeyPool:
+    """服务端API Key池 - 没有用户Key的请求按负载分配到各个Key
+
+    优先选择未被剔除、本地配额无需等待、进行中请求最少的Key，
+    条件相同时轮询。返回配额错误的Key在该模型上暂时剔除。
+    """
+
+    def __init__(self, keys: List[str], eject_seconds: float = 60.0):
+        """初始化Key池"""
+        self.keys = list(dict.fromkeys(key for key in keys if key))
+        self.eject_seconds = eject_seconds
+        self._by_hash = {hash_api_key(key): key for key in self.keys}
+        self._in_flight = {key: 0 for key in self.keys}
+        # (Key, 模型) -> 剔除截止时间
+        self._ejected_until: Dict[Tuple[str, str], float] = {}
+        self._cursor = 0
+        # 视频任务在线程池中上报错误，需要加锁
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        """是否配置了服务端Key"""
+        return bool(self.keys)
+
+    def select(self, model_key: str) -> Optional[str]:
+        """为模型选择当前负载最低的Key，没有配置Key时返回None"""
+        if not self.keys:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            count = len(self.keys)
+
+            def score(index: int):
+                key = self.keys[index]
+                ejected_for = max(0.0, self._ejected_until.get((key, model_key), 0.0) - now)
+                # 从游标开始的轮询顺序，作为最后的比较条件
+                order = (index - self._cursor) % count
+                return (ejected_for, rate_limiter.wait_time(key, model_key), self._in_flight[key], order)
+
+            index = min(range(count), key=score)
+            self._cursor = (index + 1) % count
+            return self.keys[index]
+
+    @contextmanager
+    def lease(self, model_key: str, user_key: Optional[str] = None,
+              key_hash: Optional[str] = None) -> Iterator[Optional[str]]:
+        """借用一个Key，用法：with key_pool.lease(model_key, user_key) as api_key
+
+        Args:
+            user_key: 用户提供的Key，提供时直接使用，不计入池的负载
+            key_hash: 需要固定使用的池内Key的哈希（如延长视频必须使用生成它的Key）
+        """
+        if user_key:
+            yield user_key
+            return
+
+        api_key = self._by_hash.get(key_hash) if key_hash else None
+        if api_key is None:
+            api_key = self.select(model_key)
+        if api_key is None:
+            yield None
+            return
+
+        with self._lock:
+            self._in_flight[api_key] += 1
+        try:
+            yield api_key
+        finally:
+            with self._lock:
+                self._in_flight[api_key] -= 1
+
+    def report_error(self, api_key: str, model_key: str, error: Exception):
+        """上报上游错误，池内Key返回配额错误时在该模型上暂时剔除"""
+        if api_key not in self._in_flight or not is_quota_error(error):
+            return
+        delay = parse_retry_delay(error) or self.eject_seconds
+        with self._lock:
+            self._ejected_until[(api_key, model_key)] = time.monotonic() + delay
+        logger.warning(f"API key {hash_api_key(api_key)[:12]} ejected for {model_key} for {delay:.1f}s")
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取Key池状态（只显示Key哈希前缀）"""
+        now = time.monotonic()
+        status = {}
+        with self._lock:
+            for key in self.keys:
+                ejected = {
+                    model_key: round(until - now, 1)
+                    for (ejected_key, model_key), until in self._ejected_until.items()
+                    if ejected_key == key and until > now
+                }
+                status[hash_api_key(key)[:12]] = {
+                    "in_flight": self._in_flight[key],
+                    "ejected": ejected
+                }
+        return status
+
+
+# 全局Key池实例
+key_pool = ApiKeyPool(get_server_api_keys(), eject_seconds=settings.key_eject_seconds)
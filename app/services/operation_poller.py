@@ -0,0 +1,232 @@
+import asyncio
+import time
+import uuid
+from typing import Optional, Dict, Any, Tuple, Callable
+
+from app.config import settings
+from app.utils.logger import logger
+from app.services.circuit_breaker import is_upstream_failure
+from app.services.rate_limiter import is_quota_error
+
+
+def is_transient_error(error: Exception) -> bool:
+    """判断错误是否可能自行恢复（上游不可用、配额、网络或磁盘错误），这类错误不应放弃已提交的Operation"""
+    return is_upstream_failure(error) or is_quota_error(error) or isinstance(error, OSError)
+
+
+class CompletionStats:
+    """按 (模型, 分辨率, 时长) 统计Operation完成耗时的EWMA"""
+
+    def __init__(self, default_estimate: float = 60.0, alpha: float = 0.3):
+        """初始化统计"""
+        self.default_estimate = default_estimate
+        self.alpha = alpha
+        # {key: {"mean": 秒, "deviation": 秒, "samples": 次数}}
+        self._stats: Dict[Tuple, Dict[str, float]] = {}
+
+    def record(self, key: Tuple, duration: float):
+        """记录一次完成耗时"""
+        stat = self._stats.get(key)
+        if stat is None:
+            self._stats[key] = {"mean": duration, "deviation": duration / 4, "samples": 1}
+            return
+        error = duration - stat["mean"]
+        stat["mean"] += self.alpha * error
+        stat["deviation"] += self.alpha * (abs(error) - stat["deviation"])
+        stat["samples"] += 1
+
+    def estimate(self, key: Tuple) -> Tuple[float, float]:
+        """返回 (预计耗时, 偏差)"""
+        stat = self._stats.get(key)
+        if stat is None:
+            return self.default_estimate, self.default_estimate / 4
+        return stat["mean"], stat["deviation"]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """导出统计信息"""
+        return {"/".join(str(part) for part in key): dict(stat) for key, stat in self._stats.items()}
+
+
+class OperationPoller:
+    """共享的Operation轮询器 - 在一个事件循环任务中轮询所有未完成的Operation
+
+    轮询间隔根据历史完成耗时自适应：预计完成前少查，
+    进入预计完成窗口后按最小间隔密集查询。
+    查询出错时按指数退避重试，连续出错超过上限或遇到不可恢复的错误时才失败。
+    """
+
+    MAX_POLL_ERRORS = 8
+    # 出错后重试的最长间隔（秒）
+    MAX_ERROR_BACKOFF = 300.0
+
+    def __init__(self, min_interval: float = 2.0, max_interval: float = 30.0,
+                 default_estimate: float = 60.0, alpha: float = 0.3):
+        """初始化轮询器"""
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stats = CompletionStats(default_estimate, alpha)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """启动轮询循环"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Operation poller started")
+
+    async def stop(self):
+        """停止轮询循环"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        for entry in self._entries.values():
+            if not entry["future"].done():
+                entry["future"].cancel()
+        self._entries.clear()
+        logger.info("Operation poller stopped")
+
+    async def wait(self, service, operation, key: Tuple,
+                   on_poll: Optional[Callable[[int], None]] = None, elapsed: float = 0.0):
+        """登记Operation并等待其完成，返回完成后的Operation
+
+        Args:
+            service: 提供 get_operation 的 GeminiService 实例
+            operation: generate_videos 返回的Operation
+            key: 统计分组键，如 (模型, 分辨率, 时长)
+            on_poll: 每次轮询后回调，参数为累计轮询次数
+            elapsed: Operation已经执行的秒数（重启后恢复的Operation）
+        """
+        if operation.done:
+            return operation
+        if self._task is None:
+            raise RuntimeError("Operation poller not started")
+
+        entry_id = uuid.uuid4().hex
+        now = time.monotonic()
+        entry = {
+            "service": service,
+            "operation": operation,
+            "key": key,
+            "submitted_at": now - elapsed,
+            # 恢复的Operation状态未知，立即查询一次
+            "next_poll_at": now if elapsed else now + self._next_interval(key, 0.0),
+            "polls": 0,
+            "errors": 0,
+            "on_poll": on_poll,
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        self._entries[entry_id] = entry
+        self._wakeup.set()
+        try:
+            return await entry["future"]
+        finally:
+            self._entries.pop(entry_id, None)
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取轮询器状态"""
+        return {
+            "in_flight": len(self._entries),
+            "stats": self.stats.snapshot()
+        }
+
+    def _next_interval(self, key: Tuple, elapsed: float) -> float:
+        """根据预计完成时间计算下一次轮询间隔"""
+        expected, deviation = self.stats.estimate(key)
+        window_start = expected - deviation
+        if elapsed < window_start:
+            # 还没到预计完成窗口，直接睡到窗口开始（不超过最大间隔）
+            interval = window_start - elapsed
+        elif elapsed < expected + 2 * deviation:
+            # 预计完成窗口内，密集轮询以尽快拿到结果
+            interval = self.min_interval
+        else:
+            # 已明显超时，逐步放宽间隔
+            interval = (elapsed - expected) / 4
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    async def _run(self):
+        """轮询主循环，单次出错只记录日志，不让共享的轮询任务退出"""
+        while True:
+            try:
+                await self._run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Operation poller loop failed: {e}")
+                await asyncio.sleep(self.min_interval)
+
+    async def _run_once(self):
+        """轮询到期的Operation，没有到期的则等到最近的一个"""
+        now = time.monotonic()
+        due = [(entry_id, entry) for entry_id, entry in self._entries.items()
+               if entry["next_poll_at"] <= now and not entry["future"].done()]
+
+        if due:
+            await asyncio.gather(*(self._poll(entry) for _, entry in due))
+            return
+
+        pending = [entry["next_poll_at"] for entry in self._entries.values()
+                   if not entry["future"].done()]
+        timeout = max(0.0, min(pending) - now) if pending else None
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _poll(self, entry: Dict[str, Any]):
+        """轮询单个Operation，意外错误只影响该Operation的下次轮询时间"""
+        try:
+            await self._poll_once(entry)
+        except Exception as e:
+            logger.error(f"Polling operation crashed: {e}")
+            entry["next_poll_at"] = time.monotonic() + self.max_interval
+
+    async def _poll_once(self, entry: Dict[str, Any]):
+        """查询一次Operation状态"""
+        try:
+            operation = await asyncio.to_thread(entry["service"].get_operation, entry["operation"])
+            entry["errors"] = 0
+        except Exception as e:
+            entry["errors"] += 1
+            logger.warning(f"Polling operation failed ({entry['errors']}/{self.MAX_POLL_ERRORS}): {e}")
+            if entry["errors"] >= self.MAX_POLL_ERRORS or not is_transient_error(e):
+                if not entry["future"].done():
+                    entry["future"].set_exception(e)
+                return
+            # 上游故障时指数退避，避免短时间内耗尽重试次数
+            backoff = min(self.MAX_ERROR_BACKOFF, self.min_interval * 2 ** entry["errors"])
+            entry["next_poll_at"] = time.monotonic() + backoff
+            return
+
+        entry["operation"] = operation
+        entry["polls"] += 1
+        if entry["on_poll"] is not None:
+            try:
+                entry["on_poll"](entry["polls"])
+            except Exception as e:
+                logger.error(f"Operation poll callback failed: {e}")
+        elapsed = time.monotonic() - entry["submitted_at"]
+
+        if operation.done:
+            self.stats.record(entry["key"], elapsed)
+            logger.info(f"Operation done after {elapsed:.1f}s and {entry['polls']} polls: {entry['key']}")
+            if not entry["future"].done():
+                entry["future"].set_result(operation)
+            return
+
+        entry["next_poll_at"] = time.monotonic() + self._next_interval(entry["key"], elapsed)
+
+
+# 全局轮询器实例
+operation_poller = OperationPoller(
+    min_interval=settings.poll_min_interval,
+    max_interval=settings.poll_max_interval,
+    default_estimate=settings.poll_default_estimate,
+    alpha=settings.poll_ewma_alpha
+)
@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Optional, Dict, Any, List
+
+from app.config import settings
+from app.utils.logger import logger
+
+
+class OperationStore:
+    """进行中视频Operation的持久化记录 - 进程重启后据此重新轮询并下载
+
+    generate_videos 返回后立即写入，任务完成或失败后删除；
+    只保存API Key的哈希，不保存Key本身。
+    多个worker进程共享同一数据库，每条记录由持有租约的进程负责轮询，
+    租约过期（进程退出或卡死）后由其他进程接管。
+    jobs 表保存各任务的对外状态，任意worker都能回答任务查询。
+    leases 表保存其他后台工作（如缩略图预生成）的短期租约，避免多个worker重复处理。
+    """
+
+    # 已结束任务的状态
+    FINISHED_STATUSES = ("done", "failed")
+
+    def __init__(self, db_path: str, job_history_limit: int = 1000):
+        """初始化记录表
+
+        Args:
+            db_path: 数据库路径
+            job_history_limit: jobs 表最多保留的任务数
+        """
+        self.db_path = db_path
+        self.job_history_limit = job_history_limit
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接"""
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        """创建表结构"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS operations (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    operation_name TEXT NOT NULL,
+                    key_hash TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    dedupe_key TEXT,
+                    created_at REAL NOT NULL,
+                    submitted_at REAL NOT NULL
+                )
+            """)
+            # 旧版本数据库没有租约列，旧记录视为无人持有
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(operations)")]
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE operations ADD COLUMN owner TEXT")
+            if "lease_until" not in columns:
+                conn.execute("ALTER TABLE operations ADD COLUMN lease_until REAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    view TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_recent ON jobs(COALESCE(finished_at, heartbeat_at))")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    lease_until REAL NOT NULL
+                )
+            """)
+
+    def save(self, job_id: str, kind: str, operation_name: str, key_hash: str,
+             params: Dict[str, Any], dedupe_key: Optional[str], created_at: float,
+             owner: str, lease_seconds: float):
+        """记录已提交的Operation，租约归提交的进程所有"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO operations "
+                "(job_id, kind, operation_name, key_hash, params, dedupe_key, created_at, submitted_at, "
+                "owner, lease_until) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, operation_name, key_hash, json.dumps(params, default=str),
+                 dedupe_key, created_at, now, owner, now + lease_seconds)
+            )
+        logger.info(f"Operation persisted for job {job_id}: {operation_name}")
+
+    def delete(self, job_id: str):
+        """任务结束后删除记录"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM operations WHERE job_id = ?", (job_id,))
+
+    def claim_pending(self, owner: str, lease_seconds: float) -> List[Dict[str, Any]]:
+        """认领无人持有或租约已过期的Operation，按提交时间排序，只返回本进程认领成功的记录"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT * FROM operations WHERE lease_until IS NULL OR lease_until < ? "
+                "ORDER BY submitted_at",
+                (now,)
+            ).fetchall()
+            records = []
+            for row in rows:
+                # 条件更新保证同一条记录只被一个进程认领
+                cursor = conn.execute(
+                    "UPDATE operations SET owner = ?, lease_until = ? "
+                    "WHERE job_id = ? AND (lease_until IS NULL OR lease_until < ?)",
+                    (owner, now + lease_seconds, row["job_id"], now)
+                )
+                # 每条记录单独提交，避免长时间持有写锁
+                conn.commit()
+                if cursor.rowcount != 1:
+                    continue
+                record = dict(row)
+                record["params"] = json.loads(record["params"])
+                records.append(record)
+        return records
+
+    def renew(self, owner: str, lease_seconds: float) -> int:
+        """续期本进程持有的全部租约并更新未结束任务的心跳，返回续期的Operation数"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE operations SET lease_until = ? WHERE owner = ?",
+                (now + lease_seconds, owner)
+            )
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND finished_at IS NULL", (now, owner)
+            )
+            return cursor.rowcount
+
+    def retry_later(self, job_id: str, owner: str, delay: float):
+        """放弃本进程对一条记录的租约，delay 秒后任意进程都可以重新认领"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE operations SET owner = NULL, lease_until = ? WHERE job_id = ? AND owner = ?",
+                (time.time() + delay, job_id, owner)
+            )
+
+    def release(self, owner: str):
+        """进程退出时释放租约，其他进程可以立即接管"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE operations SET owner = NULL, lease_until = NULL WHERE owner = ?", (owner,)
+            )
+
+    def try_lease(self, name: str, owner: str, lease_seconds: float) -> bool:
+        """抢占命名租约，租约被其他进程持有且未过期时返回False"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE lease_until < ?", (now,))
+            cursor = conn.execute(
+                "INSERT INTO leases (name, owner, lease_until) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET lease_until = excluded.lease_until "
+                "WHERE leases.owner = excluded.owner",
+                (name, owner, now + lease_seconds)
+            )
+            return cursor.rowcount > 0
+
+    def save_job(self, view: Dict[str, Any], owner: str, updated_at: float):
+        """写入任务的对外状态；写入可能乱序到达，只保留最新的状态"""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, owner, status, view, updated_at, heartbeat_at, finished_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(job_id) DO UPDATE SET owner = excluded.owner, status = excluded.status, "
+                    "view = excluded.view, updated_at = excluded.updated_at, "
+                    "heartbeat_at = excluded.heartbeat_at, finished_at = excluded.finished_at "
+                    "WHERE excluded.updated_at >= jobs.updated_at",
+                    (view["job_id"], owner, view["status"], json.dumps(view, ensure_ascii=False, default=str),
+                     updated_at, updated_at, view.get("finished_at"))
+                )
+                if view.get("finished_at"):
+                    conn.execute(
+                        "DELETE FROM jobs WHERE job_id NOT IN ("
+                        "SELECT job_id FROM jobs ORDER BY COALESCE(finished_at, heartbeat_at) DESC LIMIT ?)",
+                        (self.job_history_limit,)
+                    )
+        except Exception as e:
+            logger.error(f"Failed to persist job {view['job_id']}: {e}")
+
+    def get_job(self, job_id: str, stale_seconds: float) -> Optional[Dict[str, Any]]:
+        """读取任务状态；负责的worker超过 stale_seconds 没有心跳时，按是否还有待恢复的Operation给出状态"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT view, heartbeat_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            view = json.loads(row[0])
+            if view["status"] not in self.FINISHED_STATUSES and row[1] < now - stale_seconds:
+                pending = conn.execute(
+                    "SELECT 1 FROM operations WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                if pending:
+                    view["status"] = "queued"
+                    view["message"] = "Worker stopped, job will resume on another worker"
+                else:
+                    view["status"] = "failed"
+                    view["message"] = "Job lost because its worker stopped"
+                    view["error"] = view["message"]
+                    view["finished_at"] = row[1]
+        view["elapsed"] = round((view.get("finished_at") or now) - view["created_at"], 1)
+        return view
+
+
+# 全局Operation记录实例
+operation_store = OperationStore(
+    os.path.join(settings.state_folder, "operations.db"),
+    job_history_limit=settings.job_history_limit
+)
@@ -0,0 +1,398 @@
+import base64
+import json
+import os
+import sqlite3
+import stat as stat_module
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.helpers import output_shard, locate_output
+
+
+class OutputCatalog:
+    """输出文件索引 - 在SQLite中保存 outputs/images 和 outputs/videos 下每个文件的元数据
+
+    保存和删除文件时同步更新，列表接口按索引做游标分页，不再扫描目录。
+    """
+
+    # 文件类型 -> 子目录
+    SUBFOLDERS = {"image": "images", "video": "videos"}
+    SORT_COLUMNS = ("modified", "size", "filename")
+    # 未提供sha256时，大小和修改时间不变则保留已记录的哈希；
+    # 文件名带内容哈希的文件内容不会变化，复用内容对象时修改时间会被刷新，大小不变即保留
+    UPSERT_SQL = (
+        "INSERT INTO outputs (url, file_type, filename, size, sha256, created, modified, accessed) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(url) DO UPDATE SET "
+        "size = excluded.size, created = excluded.created, modified = excluded.modified, "
+        "accessed = MAX(COALESCE(outputs.accessed, 0), excluded.accessed), "
+        "sha256 = CASE WHEN excluded.sha256 IS NOT NULL THEN excluded.sha256 "
+        "WHEN outputs.size = excluded.size AND outputs.modified = excluded.modified THEN outputs.sha256 "
+        "WHEN outputs.size = excluded.size "
+        "AND instr(excluded.filename, '_' || substr(outputs.sha256, 1, 12) || '.') > 0 THEN outputs.sha256 "
+        "ELSE NULL END"
+    )
+
+    def __init__(self, db_path: str, root: str):
+        """初始化索引"""
+        self.db_path = db_path
+        self.root = root
+        # URL -> 最近访问时间，批量写入数据库，避免每次访问都写库
+        self._accessed: Dict[str, float] = {}
+        self._accessed_lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接"""
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        """创建表结构"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outputs (
+                    url TEXT PRIMARY KEY,
+                    file_type TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT,
+                    created REAL NOT NULL,
+                    modified REAL NOT NULL,
+                    accessed REAL
+                )
+            """)
+            # 旧版本数据库没有 accessed 列
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(outputs)")]
+            if "accessed" not in columns:
+                conn.execute("ALTER TABLE outputs ADD COLUMN accessed REAL")
+                conn.execute("UPDATE outputs SET accessed = modified")
+            for column in self.SORT_COLUMNS:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_outputs_{column} ON outputs(file_type, {column}, url)"
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_accessed ON outputs(accessed, url)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_sha256 ON outputs(sha256)")
+            # 后台任务的进度（如临时文件清理的游标），所有worker进程共享
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+
+    def _describe(self, path: str) -> Optional[Tuple[str, str, str]]:
+        """根据本地路径得到 (文件类型, 文件名, URL)，不属于索引范围时返回None
+
+        文件可以在 images/、videos/ 的分片子目录中，也可以是尚未迁移、直接在子目录根下的旧文件，
+        两者对应同一个URL。
+        """
+        filename = os.path.basename(path)
+        parent = os.path.dirname(os.path.abspath(path))
+        subfolder = os.path.basename(parent)
+        if os.path.basename(parent) == output_shard(filename):
+            subfolder = os.path.basename(os.path.dirname(parent))
+        file_type = next((t for t, folder in self.SUBFOLDERS.items() if folder == subfolder), None)
+        if file_type is None or filename.startswith("."):
+            return None
+        return file_type, filename, f"/outputs/{subfolder}/{filename}"
+
+    def describes(self, path: str) -> bool:
+        """文件是否在索引范围内"""
+        return self._describe(path) is not None
+
+    def add(self, path: str, sha256: Optional[str] = None):
+        """登记（或更新）一个文件"""
+        self.apply([(path, sha256)], [])
+
+    def remove(self, path: str):
+        """删除文件的索引记录"""
+        self.apply([], [path])
+
+    def apply(self, upserts: List[Tuple[str, Optional[str]]], removals: List[str]):
+        """在一个事务中批量登记和删除
+
+        Args:
+            upserts: [(本地路径, sha256或None)]，已不存在的文件按删除处理
+            removals: 本地路径列表，文件仍然存在（如已移动到分片目录）时按登记处理
+        """
+        # 按URL合并，以URL当前实际指向的文件为准（迁移时旧位置删除、分片位置新建，URL不变）
+        targets: Dict[str, Tuple[str, str, Optional[str]]] = {}
+        for path, sha256 in upserts + [(path, None) for path in removals]:
+            described = self._describe(path)
+            if described is None:
+                continue
+            file_type, filename, url = described
+            if url not in targets or sha256 is not None:
+                targets[url] = (file_type, filename, sha256)
+
+        rows = []
+        stale = []
+        for url, (file_type, filename, sha256) in targets.items():
+            path = locate_output(os.path.join(self.root, self.SUBFOLDERS[file_type]), filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stale.append((url,))
+                continue
+            except OSError as e:
+                logger.warning(f"Catalog update skipped, cannot stat {path}: {e}")
+                continue
+            if not stat_module.S_ISREG(stat.st_mode):
+                continue
+            rows.append((url, file_type, filename, stat.st_size, sha256, stat.st_ctime, stat.st_mtime,
+                         stat.st_mtime))
+        if not rows and not stale:
+            return
+        with self._connect() as conn:
+            conn.executemany(self.UPSERT_SQL, rows)
+            conn.executemany("DELETE FROM outputs WHERE url = ?", stale)
+
+    def get_sha256(self, path: str, stat_result: os.stat_result) -> Optional[str]:
+        """返回已记录的sha256；文件大小或修改时间与记录不一致时返回None"""
+        described = self._describe(path)
+        if described is None:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha256, size, modified FROM outputs WHERE url = ?", (described[2],)
+            ).fetchone()
+        if row is None or row[1] != stat_result.st_size or row[2] != stat_result.st_mtime:
+            return None
+        return row[0]
+
+    def list(self, file_type: str, limit: int = 50, cursor: Optional[str] = None,
+             sort: str = "modified", order: str = "desc", prefix: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页查询文件列表，返回 (文件列表, 下一页游标)
+
+        Args:
+            sort: 排序字段 modified / size / filename
+            order: desc 或 asc
+            prefix: 文件名前缀，如 generated_image
+            since, until: 按修改时间过滤（时间戳）
+        """
+        if sort not in self.SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort field: {sort}")
+        descending = order != "asc"
+        comparison = "<" if descending else ">"
+        direction = "DESC" if descending else "ASC"
+
+        conditions = ["file_type = ?"]
+        params: List[Any] = [file_type]
+        if prefix:
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            params.append(escaped + "%")
+        if since is not None:
+            conditions.append("modified >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("modified < ?")
+            params.append(until)
+        if cursor:
+            # 键集分页：从上一页最后一条之后继续，不随页码变慢
+            value, last_url = self._decode_cursor(cursor)
+            conditions.append(f"({sort} {comparison} ? OR ({sort} = ? AND url {comparison} ?))")
+            params.extend([value, value, last_url])
+
+        query = (
+            f"SELECT url, filename, size, sha256, created, modified FROM outputs "
+            f"WHERE {' AND '.join(conditions)} ORDER BY {sort} {direction}, url {direction} LIMIT ?"
+        )
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(query, params + [limit + 1]).fetchall()
+
+        files = [
+            {
+                "filename": row["filename"],
+                "url": row["url"],
+                "size": row["size"],
+                "size_mb": round(row["size"] / (1024 * 1024), 2),
+                "sha256": row["sha256"],
+                "created": row["created"],
+                "modified": row["modified"]
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = files[-1]
+            next_cursor = self._encode_cursor(last[sort], last["url"])
+        return files, next_cursor
+
+    def touch(self, path: str):
+        """记录一次访问，由 flush_access 批量写入"""
+        described = self._describe(path)
+        if described is None:
+            return
+        with self._accessed_lock:
+            self._accessed[described[2]] = time.time()
+
+    def flush_access(self):
+        """把内存中的访问时间写入数据库"""
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+        if not accessed:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE outputs SET accessed = MAX(COALESCE(accessed, 0), ?) WHERE url = ?",
+                [(when, url) for url, when in accessed.items()]
+            )
+
+    def list_expired(self, file_type: str, before: float, after: Optional[Tuple[float, str]] = None,
+                     limit: int = 100) -> List[Tuple[str, float]]:
+        """按修改时间列出早于 before 的文件 [(URL, 修改时间)]，after 为上一批最后一条，用于分批遍历"""
+        query = "SELECT url, modified FROM outputs WHERE file_type = ? AND modified < ?"
+        params: List[Any] = [file_type, before]
+        if after is not None:
+            query += " AND (modified > ? OR (modified = ? AND url > ?))"
+            params.extend([after[0], after[0], after[1]])
+        query += " ORDER BY modified, url LIMIT ?"
+        with self._connect() as conn:
+            return conn.execute(query, params + [limit]).fetchall()
+
+    def list_least_recent(self, after: Optional[Tuple[float, str]] = None,
+                          limit: int = 100) -> List[Tuple[str, int, float, Optional[str]]]:
+        """按最近访问时间从旧到新列出文件 [(URL, 大小, 访问时间, sha256)]，after 为上一批最后一条"""
+        query = "SELECT url, size, accessed, sha256 FROM outputs"
+        params: List[Any] = []
+        if after is not None:
+            query += " WHERE (accessed > ? OR (accessed = ? AND url > ?))"
+            params.extend([after[0], after[0], after[1]])
+        query += " ORDER BY accessed, url LIMIT ?"
+        with self._connect() as conn:
+            return conn.execute(query, params + [limit]).fetchall()
+
+    def total_size(self) -> int:
+        """索引中所有文件实际占用的总大小（字节），指向同一内容对象的多个文件只计一次"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM "
+                "(SELECT MAX(size) AS size FROM outputs GROUP BY COALESCE(sha256, url))"
+            ).fetchone()[0]
+
+    def count_aliases(self, sha256s: List[str]) -> Dict[str, int]:
+        """统计每个内容哈希对应的文件数 {sha256: 文件数}"""
+        counts: Dict[str, int] = {}
+        with self._connect() as conn:
+            for start in range(0, len(sha256s), 500):
+                chunk = sha256s[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                counts.update(conn.execute(
+                    f"SELECT sha256, COUNT(*) FROM outputs WHERE sha256 IN ({placeholders}) GROUP BY sha256",
+                    chunk
+                ).fetchall())
+        return counts
+
+    def get_sha256s(self, urls: List[str]) -> Dict[str, str]:
+        """批量读取已记录的内容哈希 {URL: sha256}，没有记录的URL不返回"""
+        result: Dict[str, str] = {}
+        with self._connect() as conn:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                result.update(conn.execute(
+                    f"SELECT url, sha256 FROM outputs WHERE url IN ({placeholders}) AND sha256 IS NOT NULL",
+                    chunk
+                ).fetchall())
+        return result
+
+    def get_meta(self, name: str) -> Optional[str]:
+        """读取后台任务进度"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name: str, value: str):
+        """保存后台任务进度"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO meta (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                (name, value)
+            )
+
+    def reconcile(self) -> Dict[str, int]:
+        """与磁盘对账：登记缺失或已变化的文件，删除已不存在的记录"""
+        added = removed = 0
+        for file_type, subfolder in self.SUBFOLDERS.items():
+            folder = os.path.join(self.root, subfolder)
+            with self._connect() as conn:
+                known = {
+                    url: (size, modified) for url, size, modified in conn.execute(
+                        "SELECT url, size, modified FROM outputs WHERE file_type = ?", (file_type,)
+                    )
+                }
+
+            # URL -> 磁盘上的文件，分片目录中的文件优先于旧位置的同名文件
+            entries_by_url = {}
+            if os.path.isdir(folder):
+                for entry in self._scan(folder):
+                    entries_by_url[f"/outputs/{subfolder}/{entry.name}"] = entry
+
+            upserts = []
+            seen = set(entries_by_url)
+            for url, entry in entries_by_url.items():
+                stat = entry.stat()
+                if known.get(url) != (stat.st_size, stat.st_mtime):
+                    upserts.append((url, file_type, entry.name, stat.st_size, None,
+                                    stat.st_ctime, stat.st_mtime, stat.st_mtime))
+
+            stale = [(url,) for url in known if url not in seen]
+            with self._connect() as conn:
+                conn.executemany(self.UPSERT_SQL, upserts)
+                conn.executemany("DELETE FROM outputs WHERE url = ?", stale)
+            added += len(upserts)
+            removed += len(stale)
+
+        if added or removed:
+            logger.info(f"Output catalog reconciled: {added} upserted, {removed} removed")
+        return {"upserted": added, "removed": removed}
+
+    @staticmethod
+    def _scan(folder: str) -> List[os.DirEntry]:
+        """列出子目录根下的旧文件，再列出各分片目录中的文件"""
+        legacy = []
+        sharded = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_file():
+                    legacy.append(entry)
+                elif entry.is_dir():
+                    with os.scandir(entry.path) as shard_entries:
+                        sharded.extend(
+                            shard_entry for shard_entry in shard_entries
+                            if not shard_entry.name.startswith(".") and shard_entry.is_file()
+                            and output_shard(shard_entry.name) == entry.name
+                        )
+        return legacy + sharded
+
+    @staticmethod
+    def _encode_cursor(value: Any, url: str) -> str:
+        """编码分页游标"""
+        return base64.urlsafe_b64encode(json.dumps([value, url]).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[Any, str]:
+        """解码分页游标"""
+        try:
+            value, url = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return value, url
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+
+# 全局输出索引实例
+output_catalog = OutputCatalog(
+    db_path=os.path.join(settings.state_folder, "catalog.db"),
+    root=settings.upload_folder
+)
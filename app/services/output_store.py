@@ -0,0 +1,113 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Optional, Tuple
+
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.helpers import sharded_path
+from app.services.output_catalog import output_catalog
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """分块计算文件的sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OutputStore:
+    """内容寻址的输出存储 - 每份内容按sha256只保存一次，/outputs 下的文件名是指向它的硬链接
+
+    写入先落到临时文件，再原子地链接到对象路径和对外文件名，并发写入互不覆盖；
+    对外文件名带内容哈希前缀，同一秒内的不同内容也不会冲突。
+    文件系统不支持硬链接时退化为复制。
+    """
+
+    OBJECTS_DIR = ".objects"
+    FILE_MODE = 0o644
+
+    def __init__(self, root: str):
+        """初始化存储，root 为 /outputs 对应的目录"""
+        self.root = root
+        self.objects_dir = os.path.join(root, self.OBJECTS_DIR)
+        self.tmp_dir = os.path.join(self.objects_dir, "tmp")
+
+    def object_path(self, sha256: str, ext: str) -> str:
+        """内容对象的存储路径"""
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}{ext}")
+
+    def temp_file(self) -> Tuple[int, str]:
+        """创建与对象同一文件系统的临时文件，返回 (fd, 路径)"""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".part")
+        # mkstemp 创建的文件只有属主可读，输出文件需要和普通写入的文件一样可被读取
+        os.fchmod(fd, self.FILE_MODE)
+        return fd, temp_path
+
+    def put_bytes(self, data: bytes, subfolder: str, prefix: str, ext: str) -> str:
+        """保存内容，返回 /outputs URL"""
+        if not data:
+            raise ValueError("Output data is empty")
+        fd, temp_path = self.temp_file()
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self.put_file(temp_path, subfolder, prefix, ext, hashlib.sha256(data).hexdigest())
+
+    def put_file(self, temp_path: str, subfolder: str, prefix: str, ext: str,
+                 sha256: Optional[str] = None) -> str:
+        """把写好的临时文件（须由 temp_file 创建）存入，返回 /outputs URL，临时文件会被移走"""
+        try:
+            if sha256 is None:
+                sha256 = hash_file(temp_path)
+            blob_path = self.object_path(sha256, ext)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                # link 在目标已存在时失败，相当于原子的“不存在才创建”
+                os.link(temp_path, blob_path)
+            except FileExistsError:
+                # 刷新修改时间，避免复用的对象被当作过期的孤立对象清理
+                os.utime(blob_path)
+                logger.info(f"Duplicate output content reused: {sha256[:12]}")
+            except OSError:
+                # 不支持硬链接，内容相同，直接覆盖也是安全的
+                os.replace(temp_path, blob_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{prefix}_{timestamp}_{sha256[:12]}{ext}"
+        alias_path = sharded_path(os.path.join(self.root, subfolder), filename)
+        self._link(blob_path, alias_path)
+        output_catalog.add(alias_path, sha256)
+        return f"/outputs/{subfolder}/{filename}"
+
+    def _link(self, blob_path: str, alias_path: str):
+        """创建对外文件名"""
+        directory = os.path.dirname(alias_path)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            os.link(blob_path, alias_path)
+        except FileExistsError:
+            # 文件名包含内容哈希，已存在说明内容相同
+            pass
+        except OSError:
+            # 不支持硬链接时复制到临时文件再原子重命名
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".part")
+            os.close(fd)
+            try:
+                shutil.copyfile(blob_path, temp_path)
+                os.chmod(temp_path, self.FILE_MODE)
+                os.replace(temp_path, alias_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+
+# 全局输出存储实例
+output_store = OutputStore(settings.upload_folder)
@@ -0,0 +1,107 @@
+import asyncio
+import os
+from typing import Optional, List, Callable
+
+from watchfiles import awatch
+
+from app.config import settings
+from app.utils.logger import logger
+from app.services.output_catalog import OutputCatalog, output_catalog
+
+
+class OutputWatcher:
+    """输出目录监视器 - 把目录中的新建、修改、删除事件增量应用到输出索引
+
+    运维直接往 outputs/ 放文件或手工删除时，列表无需重新扫描目录即可保持最新。
+    Linux上基于inotify；监视出错或事件丢失时，由定期对账兜底。
+    """
+
+    # 监视出错后重试前的等待时间（秒）
+    RETRY_DELAY = 10.0
+
+    def __init__(self, catalog: OutputCatalog, folders: List[str], enabled: bool = True,
+                 reconcile_interval: float = 3600.0):
+        """初始化
+
+        Args:
+            folders: 需要监视的目录
+            enabled: 是否监视文件事件，关闭时只做定期对账
+            reconcile_interval: 定期对账间隔（秒），0表示只在启动时对账
+        """
+        self.catalog = catalog
+        self.folders = folders
+        self.enabled = enabled
+        self.reconcile_interval = reconcile_interval
+        self._stop: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._listeners: List[Callable[[List[str]], None]] = []
+
+    def subscribe(self, callback: Callable[[List[str]], None]):
+        """注册变化回调，在事件循环中以变化的文件路径列表调用"""
+        self._listeners.append(callback)
+
+    async def start(self):
+        """启动时先对账一次，再开始监视"""
+        if self._tasks:
+            return
+        self._stop = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._reconcile_loop()))
+        if self.enabled:
+            self._tasks.append(asyncio.create_task(self._watch_loop()))
+        logger.info(f"Output watcher started (watching={self.enabled}, reconcile every {self.reconcile_interval:.0f}s)")
+
+    async def stop(self):
+        """停止监视"""
+        if not self._tasks:
+            return
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Output watcher stopped")
+
+    async def _reconcile_loop(self):
+        """启动时和之后定期与磁盘对账"""
+        while True:
+            try:
+                await asyncio.to_thread(self.catalog.reconcile)
+            except Exception as e:
+                logger.error(f"Output catalog reconcile failed: {e}")
+            if self.reconcile_interval <= 0:
+                return
+            await asyncio.sleep(self.reconcile_interval)
+
+    async def _watch_loop(self):
+        """监视文件事件，出错时对账一次后重新监视"""
+        while not self._stop.is_set():
+            try:
+                for folder in self.folders:
+                    os.makedirs(folder, exist_ok=True)
+                async for changes in awatch(*self.folders, stop_event=self._stop):
+                    # 同一批事件中可能先删后建，统一按文件当前是否存在处理
+                    paths = sorted({path for _, path in changes})
+                    await asyncio.to_thread(self.catalog.apply, [(path, None) for path in paths], [])
+                    for callback in self._listeners:
+                        try:
+                            callback(paths)
+                        except Exception as e:
+                            logger.error(f"Output change listener failed: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Output watcher failed, falling back to reconcile: {e}")
+                try:
+                    await asyncio.to_thread(self.catalog.reconcile)
+                except Exception as reconcile_error:
+                    logger.error(f"Output catalog reconcile failed: {reconcile_error}")
+                await asyncio.sleep(self.RETRY_DELAY)
+
+
+# 全局输出目录监视器实例
+output_watcher = OutputWatcher(
+    output_catalog,
+    folders=[os.path.join(settings.upload_folder, folder) for folder in OutputCatalog.SUBFOLDERS.values()],
+    enabled=settings.catalog_watch_enabled,
+    reconcile_interval=settings.catalog_reconcile_interval
+)
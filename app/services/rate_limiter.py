@@ -0,0 +1,381 @@
+import asyncio
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Iterable, Callable
+
+from fastapi import HTTPException
+
+from app.config import settings, get_server_api_keys
+from app.utils.logger import logger
+from app.services.client_registry import hash_api_key
+
+
+class RateLimitedError(HTTPException):
+    """本地配额不足且需要等待太久 - 返回429并带上Retry-After"""
+
+    def __init__(self, model_key: str, retry_after: float):
+        retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=429,
+            detail=f"Rate limit reached for {model_key}, please retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.model_key = model_key
+        self.retry_after = retry_after
+
+
+def is_quota_error(error: Exception) -> bool:
+    """判断是否为上游配额错误（429 / RESOURCE_EXHAUSTED）"""
+    if getattr(error, "code", None) == 429 or getattr(error, "status", None) == "RESOURCE_EXHAUSTED":
+        return True
+    text = str(error)
+    return "RESOURCE_EXHAUSTED" in text or text.startswith("429")
+
+
+def parse_retry_delay(error: Exception) -> Optional[float]:
+    """从上游错误中解析重试等待时间（秒）"""
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for item in (details.get("error") or {}).get("details") or []:
+            delay = item.get("retryDelay") if isinstance(item, dict) else None
+            if delay:
+                match = re.match(r"^([\d.]+)s$", str(delay))
+                if match:
+                    return float(match.group(1))
+    # 兜底：错误信息中的 "retry in 12.3s"
+    match = re.search(r"retry in ([\d.]+)\s*s", str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """令牌桶：容量 capacity，每 period 秒补满；时间为墙上时间，可持久化后跨进程、跨重启使用"""
+
+    def __init__(self, capacity: int, period: float, tokens: Optional[float] = None,
+                 updated: Optional[float] = None):
+        """初始化令牌桶，tokens/updated 为已持久化的状态"""
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity) if tokens is None else min(float(capacity), tokens)
+        self.updated = time.time() if updated is None else updated
+
+    def _refill(self, now: float):
+        """按时间补充令牌"""
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """拿到一个令牌需要等待的秒数"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        """预扣一个令牌（允许为负，表示已排队的请求）"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def drain(self, now: float):
+        """清空令牌（上游返回配额错误时调用）"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class QuotaState:
+    """单个 (API Key, 模型) 的配额状态"""
+
+    def __init__(self, rpm: int, rpd: int, row: Optional[sqlite3.Row] = None):
+        """初始化配额状态，row 为数据库中已有的记录"""
+        updated = row["updated"] if row is not None else None
+        self.minute = TokenBucket(
+            rpm, 60.0, row["minute_tokens"] if row is not None else None, updated
+        ) if rpm > 0 else None
+        self.day = TokenBucket(
+            rpd, 86400.0, row["day_tokens"] if row is not None else None, updated
+        ) if rpd > 0 else None
+        self.blocked_until = row["blocked_until"] if row is not None else 0.0
+        self.throttled = row["throttled"] if row is not None else 0
+
+    def wait_time(self, now: float) -> float:
+        """拿到执行许可需要等待的秒数"""
+        waits = [max(0.0, self.blocked_until - now)]
+        for bucket in (self.minute, self.day):
+            if bucket is not None:
+                waits.append(bucket.wait_time(now))
+        return max(waits)
+
+    def take(self, now: float):
+        """预扣令牌"""
+        for bucket in (self.minute, self.day):
+            if bucket is not None:
+                bucket.take(now)
+
+    def refill(self, now: float):
+        """把令牌补充到当前时间，写回前调用"""
+        for bucket in (self.minute, self.day):
+            if bucket is not None:
+                bucket.wait_time(now)
+
+
+class RateLimiter:
+    """按 API Key 和模型限流，根据上游429反馈暂停发送
+
+    配额状态保存在 state_folder 下的SQLite中，多个worker进程共享同一份预算，重启后每日配额不会重置。
+    每次扣减在 BEGIN IMMEDIATE 事务中完成，放到线程池执行，不阻塞事件循环。
+    用户提供的Key空闲超过 idle_seconds 后删除其记录；服务端Key和仍在限流中的记录不删除。
+    进程内另有一份有上限的状态快照，供Key池挑选Key时估算等待时间。
+    """
+
+    # 清理空闲记录的最小间隔（秒）
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, db_path: str, rpm_limits: Dict[str, int], rpd_limits: Dict[str, int],
+                 max_wait: float = 30.0, default_backoff: float = 30.0,
+                 max_states: int = 1024, idle_seconds: float = 3600.0,
+                 pinned_keys: Iterable[str] = ()):
+        """初始化限流器
+
+        Args:
+            db_path: 共享配额状态的数据库路径
+            rpm_limits: 每分钟请求数，键为 GeminiService.MODELS 中的名称，0或缺省表示不限
+            rpd_limits: 每天请求数，规则同上
+            max_wait: 同步请求在本地最多等待的秒数，超过则直接返回429
+            default_backoff: 上游429未给出重试时间时的暂停秒数
+            max_states: 进程内状态快照最多保留的用户Key记录数
+            idle_seconds: 用户Key配额记录空闲多久后删除
+            pinned_keys: 不删除的API Key（服务端Key池）
+        """
+        self.db_path = db_path
+        self.rpm_limits = rpm_limits
+        self.rpd_limits = rpd_limits
+        self.max_wait = max_wait
+        self.default_backoff = default_backoff
+        self.max_states = max_states
+        self.idle_seconds = idle_seconds
+        self._pinned = {hash_api_key(key) for key in pinned_keys}
+        # 最近一次读写得到的状态快照，只用于估算，不用于放行
+        self._states: "OrderedDict[Tuple[str, str], QuotaState]" = OrderedDict()
+        self._last_prune = 0.0
+        # 视频任务会在线程中上报错误，需要加锁
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接"""
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """创建表结构"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quotas (
+                    key_hash TEXT NOT NULL,
+                    model_key TEXT NOT NULL,
+                    minute_tokens REAL,
+                    day_tokens REAL,
+                    updated REAL NOT NULL,
+                    blocked_until REAL NOT NULL,
+                    throttled INTEGER NOT NULL,
+                    PRIMARY KEY (key_hash, model_key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_quotas_updated ON quotas(updated)")
+        finally:
+            conn.close()
+
+    def _new_state(self, model_key: str, row: Optional[sqlite3.Row] = None) -> QuotaState:
+        """按当前配置的限额创建状态"""
+        return QuotaState(self.rpm_limits.get(model_key, 0), self.rpd_limits.get(model_key, 0), row)
+
+    def _transact(self, api_key: str, model_key: str, fn: Callable[[QuotaState, float], Any]) -> Any:
+        """在写事务中读取配额状态、执行 fn(state, now) 并写回，返回 fn 的结果（阻塞，需在线程池中调用）"""
+        key = (hash_api_key(api_key or ""), model_key)
+        conn = self._connect()
+        try:
+            # 立即拿写锁，多个进程对同一记录的读-改-写串行执行
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT * FROM quotas WHERE key_hash = ? AND model_key = ?", key
+            ).fetchone()
+            state = self._new_state(model_key, row)
+            result = fn(state, now)
+            state.refill(now)
+            conn.execute(
+                "INSERT OR REPLACE INTO quotas "
+                "(key_hash, model_key, minute_tokens, day_tokens, updated, blocked_until, throttled) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key[0], model_key,
+                 state.minute.tokens if state.minute else None,
+                 state.day.tokens if state.day else None,
+                 now, state.blocked_until, state.throttled)
+            )
+            if now - self._last_prune >= self.PRUNE_INTERVAL:
+                self._last_prune = now
+                self._prune(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._remember(key, state)
+        return result
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        """删除空闲过久且已恢复满额的用户Key记录"""
+        rows = conn.execute(
+            "SELECT * FROM quotas WHERE updated < ? AND blocked_until < ?", (now - self.idle_seconds, now)
+        ).fetchall()
+        for row in rows:
+            if row["key_hash"] in self._pinned:
+                continue
+            # 仍在限流中的记录保留，删除后会丢失已扣的配额
+            if self._new_state(row["model_key"], row).wait_time(now) > 0:
+                continue
+            conn.execute(
+                "DELETE FROM quotas WHERE key_hash = ? AND model_key = ?", (row["key_hash"], row["model_key"])
+            )
+
+    def _remember(self, key: Tuple[str, str], state: QuotaState):
+        """更新进程内快照，超出容量时淘汰最久未使用的用户Key记录"""
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            unpinned = [k for k in self._states if k[0] not in self._pinned]
+            for evicted in unpinned[:max(0, len(unpinned) - self.max_states)]:
+                del self._states[evicted]
+
+    async def acquire(self, api_key: str, model_key: str, max_wait: Optional[float] = -1):
+        """在本地等待到有配额再放行
+
+        Args:
+            max_wait: 最多等待秒数，-1 使用默认值，None 表示一直等待（后台任务使用）
+        """
+        if max_wait == -1:
+            max_wait = self.max_wait
+
+        def reserve(state: QuotaState, now: float) -> Tuple[float, bool]:
+            wait = state.wait_time(now)
+            if max_wait is not None and wait > max_wait:
+                state.throttled += 1
+                return wait, False
+            state.take(now)
+            return wait, True
+
+        wait, granted = await asyncio.to_thread(self._transact, api_key, model_key, reserve)
+        if not granted:
+            raise RateLimitedError(model_key, wait)
+
+        if wait > 0:
+            logger.info(f"Rate limited locally for {model_key}, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+            # 等待期间可能收到上游429（包括其他进程收到的），再确认一次暂停状态
+            blocked = await asyncio.to_thread(self._blocked_for, api_key, model_key)
+            if blocked > 0:
+                if max_wait is not None and blocked > max_wait:
+                    raise RateLimitedError(model_key, blocked)
+                await asyncio.sleep(blocked)
+
+    def _blocked_for(self, api_key: str, model_key: str) -> float:
+        """上游429导致的剩余暂停秒数"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT blocked_until FROM quotas WHERE key_hash = ? AND model_key = ?",
+                (hash_api_key(api_key or ""), model_key)
+            ).fetchone()
+        finally:
+            conn.close()
+        return max(0.0, row["blocked_until"] - time.time()) if row is not None else 0.0
+
+    def wait_time(self, api_key: str, model_key: str) -> float:
+        """估算拿到配额需要等待的秒数（读取进程内快照，不访问数据库、不预扣令牌）"""
+        key = (hash_api_key(api_key or ""), model_key)
+        with self._lock:
+            state = self._states.get(key)
+            return state.wait_time(time.time()) if state is not None else 0.0
+
+    async def try_acquire(self, api_key: str, model_key: str) -> bool:
+        """不等待地尝试拿到配额（对冲等可选请求使用），拿不到返回False"""
+        def take_if_free(state: QuotaState, now: float) -> bool:
+            if state.wait_time(now) > 0:
+                return False
+            state.take(now)
+            return True
+
+        return await asyncio.to_thread(self._transact, api_key, model_key, take_if_free)
+
+    def report_error(self, api_key: str, model_key: str, error: Exception) -> bool:
+        """上报上游错误，配额错误时暂停该 Key/模型 的请求，返回是否为配额错误
+
+        在事件循环中调用时，数据库写入放到线程池执行。
+        """
+        if not is_quota_error(error):
+            return False
+
+        delay = parse_retry_delay(error) or self.default_backoff
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._block, api_key, model_key, delay)
+        except RuntimeError:
+            # 不在事件循环中（视频任务的线程），直接写入
+            self._block(api_key, model_key, delay)
+        logger.warning(f"Upstream quota exhausted for {model_key}, pausing {delay:.1f}s")
+        return True
+
+    def _block(self, api_key: str, model_key: str, delay: float):
+        """记录上游要求的暂停"""
+        def block(state: QuotaState, now: float):
+            state.blocked_until = max(state.blocked_until, now + delay)
+            if state.minute is not None:
+                state.minute.drain(now)
+
+        try:
+            self._transact(api_key, model_key, block)
+        except Exception as e:
+            logger.error(f"Failed to record upstream quota pause for {model_key}: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取限流状态（API Key只显示哈希前缀，阻塞，需在线程池中调用）"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM quotas ORDER BY key_hash, model_key").fetchall()
+        finally:
+            conn.close()
+        status = {}
+        for row in rows:
+            state = self._new_state(row["model_key"], row)
+            state.refill(now)
+            status[f"{row['key_hash'][:12]}/{row['model_key']}"] = {
+                "minute_tokens": round(state.minute.tokens, 2) if state.minute else None,
+                "day_tokens": round(state.day.tokens, 2) if state.day else None,
+                "blocked_for": round(max(0.0, state.blocked_until - now), 1),
+                "throttled": state.throttled
+            }
+        return status
+
+
+# 全局限流器实例
+rate_limiter = RateLimiter(
+    os.path.join(settings.state_folder, "rate_limits.db"),
+    settings.model_rpm_limits,
+    settings.model_rpd_limits,
+    max_wait=settings.rate_limit_max_wait,
+    max_states=settings.rate_limit_max_states,
+    idle_seconds=settings.rate_limit_idle_seconds,
+    pinned_keys=get_server_api_keys()
+)
@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Dict, Any
+
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.helpers import output_url_to_path
+
+
+class ResultCache:
+    """文生图结果缓存 - 按 模型+提示词+参数 的哈希索引已生成的输出文件
+
+    索引保存在SQLite中，缓存内容就是 outputs/images 下已有的图片，
+    淘汰只删除索引记录，不删除图片文件。
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_bytes: int, enabled: bool = False):
+        """初始化结果缓存"""
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        if self.enabled:
+            self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接"""
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        """创建表结构"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_results (
+                    cache_key TEXT PRIMARY KEY,
+                    files TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_image_results_access ON image_results(last_access)")
+
+    def get(self, cache_key: str) -> Optional[List[str]]:
+        """查询缓存，命中返回文件URL列表"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT files, created_at FROM image_results WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            files = json.loads(row[0])
+            expired = now - row[1] > self.ttl_seconds
+            # 输出文件可能已被手动删除，此时缓存失效
+            missing = any(not os.path.exists(output_url_to_path(url)) for url in files)
+            if expired or missing:
+                conn.execute("DELETE FROM image_results WHERE cache_key = ?", (cache_key,))
+                return None
+
+            conn.execute("UPDATE image_results SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+
+        logger.info(f"Image result cache hit: {cache_key[:12]}")
+        return files
+
+    def put(self, cache_key: str, files: List[str]):
+        """写入缓存并按容量淘汰"""
+        if not self.enabled or not files:
+            return
+
+        size_bytes = 0
+        for url in files:
+            try:
+                size_bytes += os.path.getsize(output_url_to_path(url))
+            except OSError:
+                return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO image_results (cache_key, files, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cache_key, json.dumps(files), size_bytes, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """删除过期记录，超过容量时按最近访问时间淘汰"""
+        conn.execute("DELETE FROM image_results WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM image_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute("SELECT cache_key, size_bytes FROM image_results ORDER BY last_access").fetchall()
+        evicted = []
+        for cache_key, size_bytes in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((cache_key,))
+            total -= size_bytes
+        conn.executemany("DELETE FROM image_results WHERE cache_key = ?", evicted)
+        logger.info(f"Image result cache evicted {len(evicted)} entries")
+
+
+class AnalysisCache:
+    """图片分析结果缓存 - 按 (图片内容sha256, 分析提示词, 模型) 缓存分析文本，带TTL和容量上限"""
+
+    def __init__(self, ttl_seconds: int, max_entries: int, enabled: bool = True):
+        """初始化分析缓存"""
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        # {cache_key: (过期时间, 分析文本)}，按最近使用排序
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """查询缓存，命中返回分析文本"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(cache_key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, cache_key: str, analysis: str):
+        """写入缓存，超出容量时淘汰最久未使用的记录"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic() + self.ttl_seconds, analysis)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取缓存状态"""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# 全局结果缓存实例
+image_result_cache = ResultCache(
+    db_path=os.path.join(settings.state_folder, "result_cache.db"),
+    ttl_seconds=settings.image_cache_ttl_hours * 3600,
+    max_bytes=settings.image_cache_max_mb * 1024 * 1024,
+    enabled=settings.image_cache_enabled
+)
+
+analysis_cache = AnalysisCache(
+    ttl_seconds=settings.analysis_cache_ttl_seconds,
+    max_entries=settings.analysis_cache_max_entries,
+    enabled=settings.analysis_cache_enabled
+)
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import time
+from typing import Optional, Dict, List, Set, Tuple
+
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.helpers import output_url_to_path
+from app.services.file_service import FileService
+from app.services.output_catalog import OutputCatalog, output_catalog
+from app.services.output_store import output_store
+from app.services.thumbnail_service import thumbnail_service
+from app.services.video_registry import video_registry
+
+
+class RetentionEngine:
+    """输出文件保留策略 - 后台按类型的最长保留时间和总大小上限清理 outputs
+
+    超出总大小时按最近访问时间淘汰；仍可延长的视频不会被删除。
+    总大小按内容对象计算，内容相同的多个文件只计一次，最后一个文件删除后立即删除内容对象。
+    每批只处理少量文件，批次之间让出事件循环，不影响请求处理。
+    """
+
+    # 刚写入或刚访问过的文件不淘汰（秒）
+    GRACE_SECONDS = 600
+    # 批次之间的间隔（秒）
+    BATCH_PAUSE = 0.05
+    # 临时文件清理游标在索引中的名称
+    TEMP_CURSOR = "temp_cleanup_cursor"
+
+    def __init__(self, catalog: OutputCatalog, file_service: FileService, interval: float = 600.0,
+                 batch_size: int = 100, max_age_hours: Optional[Dict[str, float]] = None,
+                 max_bytes: int = 0, temp_max_age_hours: float = 24):
+        """初始化
+
+        Args:
+            interval: 检查间隔（秒）
+            batch_size: 每批最多删除的文件数
+            max_age_hours: 文件类型 -> 最长保留时间（小时），0表示不限
+            max_bytes: 图片和视频的总大小上限（字节），0表示不限
+            temp_max_age_hours: 临时文件和孤立内容对象的保留时间（小时）
+        """
+        self.catalog = catalog
+        self.file_service = file_service
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_age_hours = max_age_hours or {}
+        self.max_bytes = max_bytes
+        self.temp_max_age_hours = temp_max_age_hours
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Dict[str, int] = {}
+
+    async def start(self):
+        """启动后台清理循环"""
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Retention engine started (interval {self.interval:.0f}s)")
+
+    async def stop(self):
+        """停止清理循环，并保存尚未写入的访问时间"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await asyncio.to_thread(self.catalog.flush_access)
+        logger.info("Retention engine stopped")
+
+    async def _run(self):
+        """定期执行一轮清理"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
+
+    async def run_once(self) -> Dict[str, int]:
+        """执行一轮清理，返回各类删除数量"""
+        await asyncio.to_thread(self.catalog.flush_access)
+        pinned = set(await asyncio.to_thread(video_registry.list_extendable))
+        result = {"expired": 0, "evicted": 0}
+
+        now = time.time()
+        for file_type, hours in self.max_age_hours.items():
+            if hours > 0:
+                result["expired"] += await self._expire(file_type, now - hours * 3600, pinned)
+        if self.max_bytes > 0:
+            result["evicted"] = await self._enforce_quota(pinned)
+
+        result.update(await asyncio.to_thread(self._cleanup_temp_files))
+        self.last_run = result
+        if result["expired"] or result["evicted"]:
+            logger.info(f"Retention removed {result['expired']} expired and {result['evicted']} evicted outputs")
+        return result
+
+    def _cleanup_temp_files(self) -> Dict[str, int]:
+        """增量清理遗留的临时文件和孤立内容对象，每轮最多检查 batch_size 个文件，游标保存在索引中"""
+        cursor = self.catalog.get_meta(self.TEMP_CURSOR) or ""
+        removed, cursor = self.file_service.cleanup_temp_files(self.temp_max_age_hours, cursor, self.batch_size)
+        self.catalog.set_meta(self.TEMP_CURSOR, cursor)
+        return removed
+
+    async def _expire(self, file_type: str, before: float, pinned: Set[str]) -> int:
+        """分批删除修改时间早于 before 的文件"""
+        removed = 0
+        after: Optional[Tuple[float, str]] = None
+        while True:
+            rows = await asyncio.to_thread(
+                self.catalog.list_expired, file_type, before, after, self.batch_size
+            )
+            if not rows:
+                return removed
+            after = (rows[-1][1], rows[-1][0])
+            removed += await asyncio.to_thread(
+                self._remove_batch, [url for url, _ in rows if url not in pinned]
+            )
+            await asyncio.sleep(self.BATCH_PAUSE)
+
+    async def _enforce_quota(self, pinned: Set[str]) -> int:
+        """总大小超出上限时，从最久未访问的文件开始分批删除"""
+        total = await asyncio.to_thread(self.catalog.total_size)
+        removed = 0
+        after: Optional[Tuple[float, str]] = None
+        cutoff = time.time() - self.GRACE_SECONDS
+        # 内容哈希 -> 尚未选中删除的文件数，降到0时才释放空间
+        remaining: Dict[str, int] = {}
+        while total > self.max_bytes:
+            rows = await asyncio.to_thread(self.catalog.list_least_recent, after, self.batch_size)
+            if not rows:
+                break
+            after = (rows[-1][2], rows[-1][0])
+            unknown = list({sha256 for _, _, _, sha256 in rows if sha256 and sha256 not in remaining})
+            if unknown:
+                remaining.update(await asyncio.to_thread(self.catalog.count_aliases, unknown))
+            batch = []
+            for url, size, accessed, sha256 in rows:
+                if total <= self.max_bytes or (accessed or 0) >= cutoff:
+                    break
+                if url in pinned:
+                    continue
+                batch.append(url)
+                if sha256:
+                    remaining[sha256] = remaining.get(sha256, 1) - 1
+                    if remaining[sha256] > 0:
+                        continue
+                total -= size
+            removed += await asyncio.to_thread(self._remove_batch, batch)
+            if (rows[-1][2] or 0) >= cutoff:
+                # 剩下的都是最近访问过的文件
+                break
+            await asyncio.sleep(self.BATCH_PAUSE)
+        if total > self.max_bytes:
+            logger.warning(f"Outputs still exceed quota after eviction: {total} > {self.max_bytes} bytes")
+        return removed
+
+    def _remove_batch(self, urls: List[str]) -> int:
+        """删除一批文件及其索引记录和缩略图，并删除已没有其他文件引用的内容对象"""
+        sha256s = self.catalog.get_sha256s(urls)
+        blobs = set()
+        paths = []
+        for url in urls:
+            path = output_url_to_path(url)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Retention failed to remove {path}: {e}")
+                continue
+            if path.startswith(thumbnail_service.source_folder + os.sep):
+                thumbnail_service.remove(os.path.basename(path))
+            paths.append(path)
+            if url in sha256s:
+                blobs.add(output_store.object_path(sha256s[url], os.path.splitext(path)[1]))
+        self.catalog.apply([], paths)
+        self._remove_orphan_blobs(blobs)
+        return len(paths)
+
+    def _remove_orphan_blobs(self, blobs: Set[str]):
+        """删除只剩对象目录中一个链接的内容对象"""
+        cutoff = time.time() - self.GRACE_SECONDS
+        for blob in blobs:
+            try:
+                stat_result = os.stat(blob)
+                # 刚写入或刚被复用（put_file 会刷新修改时间）的对象可能正要链接出新文件，留给之后的清理
+                if stat_result.st_nlink == 1 and stat_result.st_mtime < cutoff:
+                    os.remove(blob)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Retention failed to remove object {blob}: {e}")
+
+
+# 全局保留策略实例
+retention_engine = RetentionEngine(
+    output_catalog,
+    FileService(),
+    interval=settings.retention_interval,
+    batch_size=settings.retention_batch_size,
+    max_age_hours={
+        "image": settings.retention_image_max_age_hours,
+        "video": settings.retention_video_max_age_hours
+    },
+    max_bytes=settings.retention_max_bytes,
+    temp_max_age_hours=settings.retention_temp_max_age_hours
+)
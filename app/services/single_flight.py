@@ -0,0 +1,53 @@
+import asyncio
+import hashlib
+import json
+from typing import Dict, Any, Callable, Awaitable
+
+from app.utils.logger import logger
+
+
+def _normalize(value: Any) -> Any:
+    """规范化参数：字符串去首尾空白并合并连续空白"""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+def make_request_key(**params) -> str:
+    """根据规范化后的请求参数生成去重键"""
+    normalized = {name: _normalize(value) for name, value in params.items()}
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """合并相同的进行中请求：重复请求挂到正在执行的调用上，共享同一结果"""
+
+    def __init__(self):
+        """初始化"""
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn，若相同 key 的调用正在进行则等待它的结果"""
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"Coalesced duplicate request: {key[:12]}")
+        else:
+            # 独立任务执行，发起请求的客户端断开也不影响其它等待者
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取合并状态"""
+        return {
+            "in_flight": len(self._calls),
+            "coalesced": self.coalesced
+        }
+
+
+# 全局请求合并实例
+single_flight = SingleFlight()
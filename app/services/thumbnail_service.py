@@ -0,0 +1,207 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Tuple, List
+
+from PIL import Image, ImageOps
+
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.helpers import sharded_path, locate_output, output_shard, is_upload_filename, is_content_addressed
+from app.services.operation_store import operation_store
+
+
+def render_variant(source: str, dest: str, max_side: int, pil_format: str, quality: int) -> str:
+    """在子进程中生成缩小的图片副本（模块级函数，便于进程池序列化）"""
+    with Image.open(source) as original:
+        img = ImageOps.exif_transpose(original)
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+        if pil_format == "JPEG":
+            # JPEG不支持透明，铺白色背景
+            if has_alpha:
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img.convert("RGBA"), mask=img.convert("RGBA").getchannel("A"))
+                img = background
+            else:
+                img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if has_alpha else "RGB")
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".", suffix=".part")
+        os.close(fd)
+        try:
+            img.save(temp_path, format=pil_format, quality=quality)
+            os.replace(temp_path, dest)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return dest
+
+
+class ThumbnailService:
+    """图片缩略图/预览图服务 - 在进程池中生成缩小的副本并缓存到磁盘
+
+    outputs/images 下新写入的图片在后台预先生成WebP缩略图和预览图，多个worker中只有抢到租约的进程生成；
+    请求时按 Accept 头选择AVIF（Pillow支持时）或WebP，缓存缺失或过期时现场生成。
+    """
+
+    # 尺寸名 -> 最长边像素
+    SIZES = {"thumb": 320, "preview": 1280}
+    # 格式 -> (Pillow格式名, MIME类型)，按优先顺序排列
+    FORMATS = {
+        "avif": ("AVIF", "image/avif"),
+        "webp": ("WEBP", "image/webp"),
+        "jpeg": ("JPEG", "image/jpeg")
+    }
+    # 后台预生成的格式
+    PREGENERATE_FORMAT = "webp"
+    # 预生成租约时长（秒），期间其他worker不再为同一图片预生成
+    PREGENERATE_LEASE = 300.0
+
+    def __init__(self, source_folder: str, cache_folder: str, workers: int = 2, quality: int = 80):
+        """初始化
+
+        Args:
+            source_folder: 原图目录（outputs/images）
+            cache_folder: 缓存目录
+            workers: 生成图片的进程数
+            quality: 有损压缩质量
+        """
+        self.source_folder = source_folder
+        self.cache_folder = cache_folder
+        self.workers = workers
+        self.quality = quality
+        Image.init()
+        self.supported_formats = [
+            fmt for fmt, (pil_format, _) in self.FORMATS.items() if pil_format in Image.SAVE
+        ]
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # (文件名, 尺寸, 格式) -> 进行中的生成任务，同一副本只生成一次
+        self._pending: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._owner = uuid.uuid4().hex
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """懒加载进程池；用spawn启动，避免fork带上主进程的线程和连接"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def negotiate(self, accept: str) -> str:
+        """根据 Accept 头选择输出格式"""
+        accept = (accept or "").lower()
+        for fmt in ("avif", "webp"):
+            if fmt in self.supported_formats and f"image/{fmt}" in accept:
+                return fmt
+        # 没有声明支持新格式的客户端回退到JPEG
+        return "jpeg"
+
+    def media_type(self, fmt: str) -> str:
+        """格式对应的MIME类型"""
+        return self.FORMATS[fmt][1]
+
+    def variant_path(self, filename: str, size: str, fmt: str) -> str:
+        """缓存副本的路径，和原图一样按文件名分片"""
+        return os.path.join(self.cache_folder, size, output_shard(filename), f"{filename}.{fmt}")
+
+    async def get(self, filename: str, size: str, fmt: str) -> Optional[str]:
+        """返回可用的缓存副本路径，必要时生成；原图不存在时返回None"""
+        source = locate_output(self.source_folder, filename)
+        dest = self.variant_path(filename, size, fmt)
+        try:
+            source_mtime = os.stat(source).st_mtime
+        except FileNotFoundError:
+            return None
+        if self._is_fresh(filename, dest, source_mtime):
+            return dest
+
+        key = (filename, size, fmt)
+        future = self._pending.get(key)
+        if future is None:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._get_executor(), render_variant,
+                source, dest, self.SIZES[size], self.FORMATS[fmt][0], self.quality
+            )
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _is_fresh(filename: str, dest: str, source_mtime: float) -> bool:
+        """缓存副本是否可用
+
+        文件名包含内容哈希的图片内容不会变化，副本存在即可用；内容相同的图片共用一个文件，
+        复用时会刷新修改时间，不能据此判断副本过期。其他图片比较修改时间。
+        """
+        try:
+            dest_mtime = os.stat(dest).st_mtime
+        except FileNotFoundError:
+            return False
+        return is_content_addressed(filename) or dest_mtime >= source_mtime
+
+    def on_output_changes(self, paths: List[str]):
+        """输出目录变化时调用：为新图片预生成副本，清除已删除图片的副本；跳过临时文件和上传的文件"""
+        source_folder = os.path.abspath(self.source_folder)
+        for path in paths:
+            filename = os.path.basename(path)
+            if filename.startswith(".") or is_upload_filename(filename):
+                continue
+            parent = os.path.dirname(os.path.abspath(path))
+            if parent != source_folder and parent != os.path.dirname(sharded_path(source_folder, filename)):
+                continue
+            if os.path.isfile(locate_output(self.source_folder, filename)):
+                asyncio.ensure_future(self._pregenerate(filename))
+            elif not os.path.isdir(path):
+                self.remove(filename)
+
+    async def _pregenerate(self, filename: str):
+        """后台生成图片的各尺寸副本，失败只记录日志
+
+        每个worker都会收到同一文件变化，只有抢到租约的进程生成，其他进程跳过。
+        """
+        try:
+            leased = await asyncio.to_thread(
+                operation_store.try_lease, f"thumbnail:{filename}", self._owner, self.PREGENERATE_LEASE
+            )
+        except Exception as e:
+            logger.warning(f"Thumbnail lease failed for {filename}: {e}")
+            return
+        if not leased:
+            return
+        results = await asyncio.gather(
+            *(self.get(filename, size, self.PREGENERATE_FORMAT) for size in self.SIZES),
+            return_exceptions=True
+        )
+        for size, result in zip(self.SIZES, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Thumbnail generation failed for {filename} ({size}): {result}")
+
+    def remove(self, filename: str):
+        """删除图片的所有缓存副本"""
+        for size in self.SIZES:
+            for fmt in self.FORMATS:
+                path = self.variant_path(filename, size, fmt)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局缩略图服务实例
+thumbnail_service = ThumbnailService(
+    source_folder=os.path.join(settings.upload_folder, "images"),
+    cache_folder=os.path.join(settings.state_folder, "thumbnails"),
+    workers=settings.thumbnail_workers,
+    quality=settings.thumbnail_quality
+)
@@ -0,0 +1,148 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Optional, List
+
+from google.genai import types
+
+from app.config import settings
+from app.utils.logger import logger
+
+
+class VideoRegistry:
+    """可延长视频登记表 - 持久化Video引用和延长链，跨重启、跨worker进程共享
+
+    Video对象只保存 uri/mime_type（不含视频字节），按TTL过期并按最近访问淘汰。
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_entries: int):
+        """初始化登记表"""
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接"""
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        """创建表结构"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    filename TEXT PRIMARY KEY,
+                    video TEXT NOT NULL,
+                    chain TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_access ON videos(last_access)")
+            # 旧版本数据库没有 key_hash 列
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(videos)")]
+            if "key_hash" not in columns:
+                conn.execute("ALTER TABLE videos ADD COLUMN key_hash TEXT")
+
+    def register(self, filename: str, video_object, parent_filename: Optional[str] = None,
+                 key_hash: Optional[str] = None) -> List[str]:
+        """登记视频，返回它之前的延长链
+
+        Args:
+            filename: 视频文件名（如"/outputs/videos/xxx.mp4"）
+            video_object: API返回的Video对象
+            parent_filename: 父视频文件名（如果是延长的话）
+            key_hash: 生成视频所用API Key的哈希，延长时需使用同一个Key
+        """
+        video_data = video_object.model_dump(mode="json", exclude_none=True, exclude={"video_bytes"})
+        if not video_data.get("uri"):
+            logger.warning(f"Video has no uri, it cannot be extended later: {filename}")
+            return []
+
+        now = time.time()
+        with self._connect() as conn:
+            # 继承父视频的链
+            chain = []
+            if parent_filename:
+                row = conn.execute("SELECT chain FROM videos WHERE filename = ?", (parent_filename,)).fetchone()
+                if row is not None:
+                    chain = json.loads(row[0])
+                    chain.append(parent_filename)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO videos (filename, video, chain, created_at, last_access, key_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (filename, json.dumps(video_data), json.dumps(chain), now, now, key_hash)
+            )
+            self._evict(conn, now)
+
+        logger.info(f"Video registered: {filename}, chain length: {len(chain)}")
+        return chain
+
+    def get_video(self, filename: str):
+        """获取可用于延长的Video对象，不存在或已过期返回None"""
+        row = self._get_row(filename)
+        if row is None:
+            return None
+        return types.Video.model_validate(json.loads(row[0]))
+
+    def get_chain(self, filename: str) -> List[str]:
+        """获取视频的延长历史链（按时间顺序，包含自身）"""
+        row = self._get_row(filename)
+        if row is None:
+            return [filename]
+        return json.loads(row[1]) + [filename]
+
+    def get_key_hash(self, filename: str) -> Optional[str]:
+        """获取生成视频所用API Key的哈希"""
+        row = self._get_row(filename)
+        if row is None:
+            return None
+        return row[3]
+
+    def is_extendable(self, filename: str) -> bool:
+        """检查视频是否可以延长"""
+        return self._get_row(filename) is not None
+
+    def list_extendable(self) -> List[str]:
+        """列出所有仍可延长的视频文件名"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT filename FROM videos WHERE created_at >= ?", (time.time() - self.ttl_seconds,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _get_row(self, filename: str):
+        """查询未过期的记录并刷新访问时间"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT video, chain, created_at, key_hash FROM videos WHERE filename = ?", (filename,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.ttl_seconds:
+                conn.execute("DELETE FROM videos WHERE filename = ?", (filename,))
+                return None
+            conn.execute("UPDATE videos SET last_access = ? WHERE filename = ?", (now, filename))
+        return row
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """删除过期记录，超出容量时淘汰最久未访问的记录"""
+        conn.execute("DELETE FROM videos WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM videos WHERE filename IN ("
+            "SELECT filename FROM videos ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+
+# 全局视频登记表实例
+video_registry = VideoRegistry(
+    db_path=os.path.join(settings.state_folder, "video_registry.db"),
+    ttl_seconds=settings.video_registry_ttl_hours * 3600,
+    max_entries=settings.video_registry_max_entries
+)
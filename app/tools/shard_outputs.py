@@ -0,0 +1,80 @@
+"""把 outputs/images 和 outputs/videos 根目录下的旧文件移动到按文件名分片的子目录
+
+用法：
+    python -m app.tools.shard_outputs            # 执行迁移
+    python -m app.tools.shard_outputs --dry-run  # 只统计需要迁移的文件
+
+URL不变，迁移前后文件都能访问，服务运行中也可以执行；文件在同一目录树内重命名，
+不复制内容，指向 .objects 的硬链接保持不变。可以重复执行，已迁移的文件会被跳过。
+"""
+import argparse
+import os
+from typing import Dict
+
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.helpers import SHARDED_OUTPUT_FOLDERS, sharded_path
+
+
+def migrate_folder(folder: str, dry_run: bool = False) -> Dict[str, int]:
+    """迁移一个子目录，返回 {"moved", "conflicts"}"""
+    result = {"moved": 0, "conflicts": 0}
+    if not os.path.isdir(folder):
+        return result
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            # 跳过正在写入的临时文件和已有的分片目录
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            dest = sharded_path(folder, entry.name)
+            if os.path.exists(dest):
+                logger.warning(f"Skipped {entry.path}: {dest} already exists")
+                result["conflicts"] += 1
+                continue
+            result["moved"] += 1
+            if dry_run:
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.rename(entry.path, dest)
+    return result
+
+
+def drop_flat_thumbnails(cache_folder: str, dry_run: bool = False) -> int:
+    """删除旧布局下的缩略图缓存（按需重新生成），返回删除的文件数"""
+    removed = 0
+    if not os.path.isdir(cache_folder):
+        return removed
+    with os.scandir(cache_folder) as sizes:
+        for size_dir in sizes:
+            if not size_dir.is_dir():
+                continue
+            with os.scandir(size_dir.path) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        removed += 1
+                        if not dry_run:
+                            os.remove(entry.path)
+    return removed
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="Move flat output files into sharded subdirectories")
+    parser.add_argument("--root", default=settings.upload_folder, help="outputs directory")
+    parser.add_argument("--dry-run", action="store_true", help="only count files to move")
+    args = parser.parse_args()
+
+    for subfolder in SHARDED_OUTPUT_FOLDERS:
+        folder = os.path.join(args.root, subfolder)
+        result = migrate_folder(folder, dry_run=args.dry_run)
+        action = "would move" if args.dry_run else "moved"
+        print(f"{folder}: {action} {result['moved']} files, {result['conflicts']} conflicts")
+
+    thumbnails = drop_flat_thumbnails(os.path.join(settings.state_folder, "thumbnails"), dry_run=args.dry_run)
+    if thumbnails:
+        action = "would remove" if args.dry_run else "removed"
+        print(f"Thumbnail cache: {action} {thumbnails} files from the old layout")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import hashlib
 import os
+import re
 import uuid
 from datetime import datetime
 from typing import Optional
@@ -26,6 +28,24 @@ def generate_unique_filename(original_filename: str, prefix: str = "") -> str:
         return f"{timestamp}_{unique_id}{file_ext}"
 
 
+# 上传文件的文件名：类型_日期_时间_随机ID.扩展名（generate_unique_filename 以文件类型为前缀）
+UPLOAD_FILENAME = re.compile(r"^(image|video)_\d{8}_\d{6}_[0-9a-f]{8}\.[A-Za-z0-9]+$")
+
+
+def is_upload_filename(filename: str) -> bool:
+    """是否为上传的文件（图片分析、图生视频等的输入，用完即删）"""
+    return bool(UPLOAD_FILENAME.match(filename))
+
+
+# 按内容存储的输出文件名：前缀_日期_时间_内容哈希前12位.扩展名（OutputStore.put_file 生成），内容不会变化
+CONTENT_ADDRESSED_FILENAME = re.compile(r"^.+_\d{8}_\d{6}_[0-9a-f]{12}\.[A-Za-z0-9]+$")
+
+
+def is_content_addressed(filename: str) -> bool:
+    """文件名是否包含内容哈希"""
+    return bool(CONTENT_ADDRESSED_FILENAME.match(filename))
+
+
 def validate_file_type(filename: str, allowed_extensions: list) -> bool:
     """验证文件类型"""
     if not filename:
@@ -53,6 +73,42 @@ def cleanup_temp_file(file_path: str):
         print(f"Failed to delete temp file {file_path}: {e}")
 
 
+# 按文件名分片存放的输出子目录，URL中不体现分片
+SHARDED_OUTPUT_FOLDERS = ("images", "videos")
+
+
+def output_shard(filename: str) -> str:
+    """文件名对应的分片目录名（文件名sha256的前2位，共256个分片）"""
+    return hashlib.sha256(filename.encode("utf-8")).hexdigest()[:2]
+
+
+def sharded_path(folder: str, filename: str) -> str:
+    """文件在分片目录中的路径，新文件都写到这里"""
+    return os.path.join(folder, output_shard(filename), filename)
+
+
+def locate_output(folder: str, filename: str) -> str:
+    """查找文件的实际路径：优先分片目录，尚未迁移的旧文件仍在子目录根下"""
+    path = sharded_path(folder, filename)
+    if not os.path.exists(path):
+        legacy_path = os.path.join(folder, filename)
+        if os.path.exists(legacy_path):
+            return legacy_path
+    return path
+
+
+def output_url_to_path(url: str) -> str:
+    """将 /outputs/... 形式的URL转换为本地文件路径"""
+    from app.config import settings
+    relative = url.split("?", 1)[0]
+    if relative.startswith("/outputs/"):
+        relative = relative[len("/outputs/"):]
+    parts = relative.strip("/").split("/")
+    if len(parts) == 2 and parts[0] in SHARDED_OUTPUT_FOLDERS:
+        return locate_output(os.path.join(settings.upload_folder, parts[0]), parts[1])
+    return os.path.join(settings.upload_folder, *parts)
+
+
 def format_file_size(size_bytes: int) -> str:
     """格式化文件大小显示"""
     if size_bytes == 0:
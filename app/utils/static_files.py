@@ -0,0 +1,116 @@
+import mimetypes
+import os
+import re
+import stat
+from typing import Optional, Dict
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+
+from app.config import settings
+from app.services.output_catalog import output_catalog
+from app.services.output_store import hash_file
+from app.utils.helpers import SHARDED_OUTPUT_FOLDERS, locate_output
+
+# 部分系统的mimetypes缺少这些类型，会按octet-stream返回，浏览器无法直接播放和拖动视频
+for _media_type, _ext in (("image/webp", ".webp"), ("image/avif", ".avif"), ("video/mp4", ".mp4"),
+                          ("video/quicktime", ".mov"), ("video/x-matroska", ".mkv"),
+                          ("video/x-msvideo", ".avi")):
+    mimetypes.add_type(_media_type, _ext)
+
+# 内容寻址的文件名：前缀_日期_时间_sha256前12位.扩展名
+CONTENT_ADDRESSED_NAME = re.compile(r"_\d{8}_\d{6}_([0-9a-f]{12})\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def content_hash(path: str, stat_result: os.stat_result) -> Optional[str]:
+    """获取输出文件的sha256：优先读取索引，索引中没有时计算一次并写回；不在索引范围内的文件返回None"""
+    sha256 = output_catalog.get_sha256(path, stat_result)
+    if sha256 is None and output_catalog.describes(path):
+        sha256 = hash_file(path)
+        output_catalog.add(path, sha256)
+    return sha256
+
+
+def cache_headers(path: str, sha256: Optional[str]) -> Dict[str, str]:
+    """根据内容哈希生成缓存相关的响应头"""
+    if sha256 is None:
+        # 没有内容哈希时沿用基于修改时间和大小的默认ETag
+        return {"Cache-Control": REVALIDATE_CACHE_CONTROL}
+    headers = {"ETag": f'"{sha256}"'}
+    match = CONTENT_ADDRESSED_NAME.search(os.path.basename(path))
+    if match and sha256.startswith(match.group(1)):
+        # 文件名中包含内容哈希，同一URL的内容永远不变
+        headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    else:
+        headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return headers
+
+
+class OutputStaticFiles(StaticFiles):
+    """/outputs 静态文件 - 以内容哈希作强ETag，内容寻址的文件名长期缓存
+
+    条件请求返回304，Range请求由FileResponse处理；
+    以点开头的路径（.objects 对象目录、.part 临时文件）不对外提供。
+    images/、videos/ 下的文件按文件名分片存放，URL中不包含分片目录。
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """返回文件响应"""
+        parts = path.replace("\\", "/").strip("/").split("/")
+        if any(part.startswith(".") for part in parts):
+            raise HTTPException(status_code=404)
+        sharded = parts[0] in SHARDED_OUTPUT_FOLDERS
+        if sharded and len(parts) != 2:
+            # 分片目录只是存储布局，不作为URL对外提供
+            raise HTTPException(status_code=404)
+
+        if scope["method"] in ("GET", "HEAD"):
+            try:
+                if sharded:
+                    full_path, stat_result = await anyio.to_thread.run_sync(self._lookup_sharded, *parts)
+                else:
+                    full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            except (OSError, ValueError):
+                # 交给父类返回对应的错误
+                stat_result = None
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                output_catalog.touch(full_path)
+                sha256 = await anyio.to_thread.run_sync(content_hash, full_path, stat_result)
+                return self.file_response(full_path, stat_result, scope, sha256=sha256)
+
+        return await super().get_response(path, scope)
+
+    def _lookup_sharded(self, subfolder: str, filename: str):
+        """在分片目录（或尚未迁移的旧位置）中查找文件"""
+        full_path = locate_output(os.path.join(self.directory, subfolder), filename)
+        try:
+            return full_path, os.stat(full_path)
+        except FileNotFoundError:
+            return "", None
+
+    def file_response(self, full_path: str, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200, sha256: Optional[str] = None,
+                      download_name: Optional[str] = None) -> Response:
+        """构造文件响应，download_name 不为空时作为附件下载"""
+        request_headers = Headers(scope=scope)
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers=cache_headers(full_path, sha256),
+            filename=download_name
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# 全局 /outputs 静态文件实例
+output_files = OutputStaticFiles(directory=settings.upload_folder, check_dir=False)
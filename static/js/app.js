@@ -566,7 +566,10 @@ class WebUIManager {
                 })
             });
 
-            const result = await response.json();
+            const submitted = await response.json();
+            const result = submitted.success
+                ? await this.waitForJob(submitted.data.job_id, '正在生成视频...')
+                : submitted;
             this.hideLoading();
 
             if (result.success) {
@@ -628,7 +631,10 @@ class WebUIManager {
                 body: formData
             });
 
-            const result = await response.json();
+            const submitted = await response.json();
+            const result = submitted.success
+                ? await this.waitForJob(submitted.data.job_id, '正在生成视频...')
+                : submitted;
             this.hideLoading();
 
             if (result.success) {
@@ -765,6 +771,13 @@ class WebUIManager {
 
 
 
+    imageVariantUrl(url, size) {
+        // outputs/images 下的图片使用服务端生成的缩略图/预览图，其他地址原样返回
+        const prefix = '/outputs/images/';
+        if (typeof url !== 'string' || !url.startsWith(prefix)) return url;
+        return `${CONFIG.ENDPOINTS.GEMINI.THUMBNAIL}/${size}/${encodeURIComponent(url.slice(prefix.length))}`;
+    }
+
     displayImages(imageUrls) {
         const gallery = document.getElementById('imageGallery');
         gallery.innerHTML = '';
@@ -772,8 +785,11 @@ class WebUIManager {
         imageUrls.forEach((url, index) => {
             const imageDiv = document.createElement('div');
             imageDiv.className = 'relative group';
+            // 展示缩小的副本，原图只在下载时加载
             imageDiv.innerHTML = `
-                <img src="${url}" alt="Generated Image ${index + 1}" 
+                <img src="${this.imageVariantUrl(url, 'preview')}" 
+                     srcset="${this.imageVariantUrl(url, 'thumb')} 320w, ${this.imageVariantUrl(url, 'preview')} 1280w" 
+                     sizes="(min-width: 640px) 50vw, 100vw" loading="lazy" alt="Generated Image ${index + 1}" 
                      class="w-full h-auto object-contain rounded-lg shadow-md">
                 <div class="absolute inset-0 bg-black bg-opacity-0 group-hover:bg-opacity-50 transition-all duration-200 rounded-lg flex items-center justify-center">
                     <button onclick="webUI.downloadFile('${url}', 'image_${index + 1}.png')" 
@@ -945,7 +961,10 @@ class WebUIManager {
                 })
             });
             
-            const result = await response.json();
+            const submitted = await response.json();
+            const result = submitted.success
+                ? await this.waitForJob(submitted.data.job_id, '正在延长视频...')
+                : submitted;
             this.hideLoading();
             
             if (result.success) {
@@ -1089,6 +1108,65 @@ class WebUIManager {
         `;
     }
 
+    waitForJob(jobId, loadingText) {
+        // 通过SSE订阅视频任务进度，浏览器不支持或连接出错时回退到轮询
+        if (!window.EventSource) {
+            return this.pollJob(jobId, loadingText);
+        }
+        return new Promise(resolve => {
+            const source = new EventSource(`${CONFIG.ENDPOINTS.GEMINI.JOB}/${jobId}/events`);
+            source.addEventListener('status', event => {
+                const job = JSON.parse(event.data);
+                const result = this.jobResult(job, loadingText);
+                if (result) {
+                    source.close();
+                    resolve(result);
+                }
+            });
+            source.onerror = () => {
+                source.close();
+                resolve(this.pollJob(jobId, loadingText));
+            };
+        });
+    }
+
+    async pollJob(jobId, loadingText) {
+        // 轮询视频任务状态，直到完成或失败
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, CONFIG.DEFAULTS.JOB_POLL_INTERVAL));
+            const response = await fetch(`${CONFIG.ENDPOINTS.GEMINI.JOB}/${jobId}`);
+            const result = await response.json();
+            if (!result.success) {
+                return result;
+            }
+            const finished = this.jobResult(result.data, loadingText);
+            if (finished) {
+                return finished;
+            }
+        }
+    }
+
+    jobResult(job, loadingText) {
+        // 任务结束时返回结果，否则更新加载提示并返回null
+        const statusText = {
+            queued: '排队中',
+            running: '生成中',
+            downloading: '下载中'
+        };
+        if (job.status === 'done') {
+            return { success: true, message: job.message, data: job };
+        }
+        if (job.status === 'failed') {
+            return { success: false, message: job.message };
+        }
+        let detail = `${statusText[job.status] || job.status}，已用时 ${Math.round(job.elapsed)} 秒`;
+        if (job.polls) {
+            detail += `，已查询 ${job.polls} 次`;
+        }
+        this.showLoading(`${loadingText}（${detail}）`);
+        return null;
+    }
+
     fileToBase64(file) {
         return new Promise((resolve, reject) => {
             const reader = new FileReader();
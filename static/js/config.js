@@ -22,7 +22,9 @@ const CONFIG = {
             ANALYZE_IMAGE: '/api/v1/gemini/analyze/image',
             EXTEND_VIDEO: '/api/v1/gemini/extend/video',
             UPLOAD_VIDEO: '/api/v1/gemini/upload/video',
-            LIST_VIDEOS: '/api/v1/gemini/files/videos'
+            LIST_VIDEOS: '/api/v1/gemini/files/videos',
+            THUMBNAIL: '/api/v1/gemini/thumbnails',  // /{size}/{filename}，size 为 thumb 或 preview
+            JOB: '/api/v1/gemini/jobs'  // 任务状态查询，/{id}/events 为SSE进度流
         }
     },
     
@@ -33,7 +35,8 @@ const CONFIG = {
         VIDEO_ASPECT_RATIO: '16:9',
         VIDEO_DURATION: 8,
         VIDEO_RESOLUTION: '720p',
-        PERSON_GENERATION: 'allow_adult'
+        PERSON_GENERATION: 'allow_adult',
+        JOB_POLL_INTERVAL: 5000 // 视频任务状态轮询间隔（毫秒）
     },
     
     // 文件上传配置